@@ -0,0 +1,109 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import contextvars
+from contextvars import ContextVar
+import functools
+import itertools
+
+from .AsyncRelationManager import AsyncRelationManager
+from .RelationManager import RelationManager
+
+# The AsyncEntityManager and single-thread executor of the async transaction open in the current context, if any.
+_transaction_lane = ContextVar("transaction_lane", default=None)
+
+# Exposes an EntityManager to asyncio code.
+# Every blocking operation runs on a bounded pool of worker threads, so the event loop never waits on the database.
+# The DatabaseManager hands each thread the connection it last released, so each worker tends to keep reusing one connection.
+# Operations inside transaction() run on a thread reserved for that transaction, which holds its pinned connection.
+class AsyncEntityManager:
+	# At most max_workers operations run at once outside transactions, and at most max_transactions transactions are open at once.
+	def __init__(self, entity_mgr, max_workers=4, max_transactions=4):
+		if type(max_workers) is not int or max_workers < 1:
+			raise ValueError(f"max_workers must be a positive int, not '{max_workers}'.")
+		
+		if type(max_transactions) is not int or max_transactions < 1:
+			raise ValueError(f"max_transactions must be a positive int, not '{max_transactions}'.")
+		
+		self.entity_mgr = entity_mgr
+		self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="entity-worker")
+		
+		self.max_transactions = max_transactions
+		self.transaction_slots = None # Created on first use, on the running event loop.
+		
+		self.tables = {}
+	
+	# Acquires the async counterpart of EntityManager.with_table().
+	def with_table(self, table_name):
+		if table_name not in self.tables:
+			self.tables[table_name] = AsyncRelationManager(self, self.entity_mgr.with_table(table_name))
+		
+		return self.tables[table_name]
+	
+	# Runs fn(*args, **kwargs) on a worker thread, or on the transaction's thread inside transaction(), and returns its result.
+	# fn runs in a copy of the calling context, so that its spans are children of the caller's.
+	async def run(self, fn, *args, **kwargs):
+		lane = _transaction_lane.get()
+		executor = lane[1] if lane is not None and lane[0] is self else self.executor
+		
+		return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(contextvars.copy_context().run, fn, *args, **kwargs))
+	
+	# Yields the items of a blocking iterator, drawing batch_size of them at a time on the worker threads.
+	# The iterator is closed when iteration ends early.
+	async def iterate(self, iterator, batch_size=None):
+		if batch_size is None:
+			batch_size = RelationManager.default_batch_size
+		
+		try:
+			while True:
+				batch = await self.run(lambda: list(itertools.islice(iterator, batch_size)))
+				if len(batch) == 0:
+					return
+				
+				for item in batch:
+					yield item
+		
+		finally:
+			if hasattr(iterator, "close"):
+				await self.run(iterator.close)
+	
+	# The async counterpart of EntityManager.transaction(). Yields the UnitOfWork.
+	# Every operation awaited through this AsyncEntityManager within the block, including by tasks it starts, joins the transaction.
+	# Commits on exit, or rolls back if the block raises or is cancelled. Nested scopes join the outermost one.
+	@asynccontextmanager
+	async def transaction(self):
+		lane = _transaction_lane.get()
+		if lane is not None and lane[0] is self:
+			yield await self.run(self.entity_mgr.current_transaction)
+			return
+		
+		if self.transaction_slots is None:
+			self.transaction_slots = asyncio.Semaphore(self.max_transactions)
+		
+		async with self.transaction_slots:
+			loop = asyncio.get_running_loop()
+			executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="entity-transaction")
+			
+			try:
+				scope = self.entity_mgr.transaction()
+				transaction = await loop.run_in_executor(executor, scope.__enter__)
+				
+				token = _transaction_lane.set((self, executor))
+				try:
+					yield transaction
+				
+				except BaseException as e:
+					_transaction_lane.reset(token)
+					await loop.run_in_executor(executor, scope.__exit__, type(e), e, e.__traceback__)
+					raise
+				
+				else:
+					_transaction_lane.reset(token)
+					await loop.run_in_executor(executor, scope.__exit__, None, None, None)
+			
+			finally:
+				executor.shutdown(wait=False)
+	
+	# Stops the worker threads once queued operations have finished.
+	def close(self, wait=True):
+		self.executor.shutdown(wait=wait)
@@ -0,0 +1,82 @@
+from .RelationManager import RelationManager
+
+# Exposes the operations of a RelationManager or JoinedRelationManager as coroutines. Obtained from AsyncEntityManager.with_table().
+# Each operation runs the blocking one on the AsyncEntityManager's threads. See RelationManager for what they do.
+class AsyncRelationManager:
+	def __init__(self, async_entity_mgr, relation_mgr):
+		self.async_entity_mgr = async_entity_mgr
+		self.relation_mgr = relation_mgr
+	
+	# Builds no rows, so it does not block.
+	def new_blank_entity(self):
+		return self.relation_mgr.new_blank_entity()
+	
+	def join(self, right_relation, left_key, right_key, join_type=RelationManager.JoinType.INNER, left_alias=None, right_alias=None):
+		return AsyncRelationManager(self.async_entity_mgr, self.relation_mgr.join(right_relation, left_key, right_key, join_type, left_alias, right_alias))
+	
+	def inner_join(self, right_relation, left_key, right_key, left_alias=None, right_alias=None):
+		return AsyncRelationManager(self.async_entity_mgr, self.relation_mgr.inner_join(right_relation, left_key, right_key, left_alias, right_alias))
+	
+	def outer_join(self, right_relation, left_key, right_key, left_alias=None, right_alias=None):
+		return AsyncRelationManager(self.async_entity_mgr, self.relation_mgr.outer_join(right_relation, left_key, right_key, left_alias, right_alias))
+	
+	def left_join(self, right_relation, left_key, right_key, left_alias=None, right_alias=None):
+		return AsyncRelationManager(self.async_entity_mgr, self.relation_mgr.left_join(right_relation, left_key, right_key, left_alias, right_alias))
+	
+	def right_join(self, right_relation, left_key, right_key, left_alias=None, right_alias=None):
+		return AsyncRelationManager(self.async_entity_mgr, self.relation_mgr.right_join(right_relation, left_key, right_key, left_alias, right_alias))
+	
+	#### CRUD Operations ####
+	
+	async def new_bound_entity(self):
+		return await self.async_entity_mgr.run(self.relation_mgr.new_bound_entity)
+	
+	async def create(self, entity):
+		return await self.async_entity_mgr.run(self.relation_mgr.create, entity)
+	
+	async def create_many(self, entities):
+		return await self.async_entity_mgr.run(self.relation_mgr.create_many, entities)
+	
+	async def read(self, id):
+		return await self.async_entity_mgr.run(self.relation_mgr.read, id)
+	
+	async def read_many(self, keys, column_name="id"):
+		return await self.async_entity_mgr.run(self.relation_mgr.read_many, keys, column_name)
+	
+	async def read_by_column(self, column_name, matching_value):
+		return await self.async_entity_mgr.run(self.relation_mgr.read_by_column, column_name, matching_value)
+	
+	async def read_one_or_none_by_column(self, column_name, matching_value):
+		return await self.async_entity_mgr.run(self.relation_mgr.read_one_or_none_by_column, column_name, matching_value)
+	
+	async def read_one_by_column(self, column_name, matching_value):
+		return await self.async_entity_mgr.run(self.relation_mgr.read_one_by_column, column_name, matching_value)
+	
+	async def read_columns(self, column_names=None, column_name=None, matching_value=None, batch_size=None):
+		return await self.async_entity_mgr.run(self.relation_mgr.read_columns, column_names, column_name, matching_value, batch_size)
+	
+	# Async iterators over the results of RelationManager.iter_by_column() and scan(). Rows are fetched batch_size at a time on the worker threads.
+	async def iter_by_column(self, column_name, matching_value, batch_size=None):
+		iterator = await self.async_entity_mgr.run(self.relation_mgr.iter_by_column, column_name, matching_value, batch_size)
+		async for entity in self.async_entity_mgr.iterate(iterator, batch_size):
+			yield entity
+	
+	async def scan(self, batch_size=None):
+		iterator = self.relation_mgr.scan(batch_size)
+		async for entity in self.async_entity_mgr.iterate(iterator, batch_size):
+			yield entity
+	
+	async def update(self, entity):
+		return await self.async_entity_mgr.run(self.relation_mgr.update, entity)
+	
+	async def update_many(self, entities):
+		return await self.async_entity_mgr.run(self.relation_mgr.update_many, entities)
+	
+	async def delete(self, id):
+		return await self.async_entity_mgr.run(self.relation_mgr.delete, id)
+	
+	async def update_where(self, column_name, matching_value, **assignments):
+		return await self.async_entity_mgr.run(self.relation_mgr.update_where, column_name, matching_value, **assignments)
+	
+	async def delete_where(self, column_name, matching_value):
+		return await self.async_entity_mgr.run(self.relation_mgr.delete_where, column_name, matching_value)
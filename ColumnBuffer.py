@@ -0,0 +1,155 @@
+from array import array
+from datetime import datetime, UTC
+
+from .DatabaseManager import DatabaseManager
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Accumulates the values of one column for RelationManager.read_columns(), a batch at a time.
+# Timestamps arrive as the ISO 8601 text they are stored as, rather than being converted to datetimes one by one.
+# With NumPy, each batch is converted to an array as it arrives, and the arrays are joined once at the end.
+# Without it, values go straight into an array.array, or a list for values which array.array cannot hold.
+class ColumnBuffer:
+	# Kinds of column from narrowest to widest. A column widens when a batch holds values that its kind cannot.
+	# "timestamp" columns only widen to "object".
+	widening_order = ("int", "float", "object")
+	
+	numpy_dtypes = {
+		"int": "int64",
+		"float": "float64",
+		"timestamp": "datetime64[us]",
+		"object": "object"
+	}
+	
+	# Without NumPy, timestamps are stored as POSIX seconds, and NULLs in numeric columns as NaN.
+	array_typecodes = {
+		"int": "q",
+		"float": "d",
+		"timestamp": "d"
+	}
+	
+	def __init__(self, declared_type):
+		self.kind = ColumnBuffer.kind_of_type(declared_type)
+		
+		self.chunks = []
+		self.values = None if numpy is not None else ColumnBuffer.new_container(self.kind)
+	
+	# The narrowest kind for a column of the declared type, following SQLite's type affinity rules.
+	@staticmethod
+	def kind_of_type(declared_type):
+		if DatabaseManager.get_converter(declared_type) is not None:
+			return "timestamp" if DatabaseManager.get_converter_name(declared_type) == "TIMESTAMP" else "object"
+		
+		type_name = declared_type.upper() if declared_type is not None else ""
+		if "INT" in type_name:
+			return "int"
+		
+		if "CHAR" in type_name or "CLOB" in type_name or "TEXT" in type_name or "BLOB" in type_name or type_name == "":
+			return "object"
+		
+		return "float"
+	
+	# The narrowest kind which holds all of values.
+	def kind_of_values(self, values):
+		if self.kind == "object":
+			return "object"
+		
+		value_types = set(map(type, values))
+		has_nulls = type(None) in value_types
+		value_types.discard(type(None))
+		
+		if self.kind == "timestamp":
+			return "timestamp" if value_types <= {str} else "object"
+		
+		if value_types <= {int} and not has_nulls:
+			kind = "int"
+		elif value_types <= {int, float}:
+			kind = "float"
+		else:
+			kind = "object"
+		
+		return max(kind, self.kind, key=ColumnBuffer.widening_order.index)
+	
+	@staticmethod
+	def new_container(kind):
+		if kind in ColumnBuffer.array_typecodes:
+			return array(ColumnBuffer.array_typecodes[kind])
+		
+		return []
+	
+	def extend(self, values):
+		kind = self.kind_of_values(values)
+		if kind != self.kind:
+			self.kind = kind
+			
+			# NumPy chunks are cast to the final kind when joined.
+			if self.values is not None:
+				widened_values = ColumnBuffer.new_container(kind)
+				widened_values.extend(iter(self.values)) # array.array only extends directly from arrays of the same typecode.
+				self.values = widened_values
+		
+		if self.values is None:
+			self.chunks.append(self.to_numpy(values))
+		
+		elif self.kind == "timestamp":
+			self.values.extend([ColumnBuffer.to_posix(value) for value in values])
+		
+		elif self.kind == "float":
+			self.values.extend([float("nan") if value is None else value for value in values])
+		
+		else:
+			self.values.extend(values)
+	
+	def to_numpy(self, values):
+		if self.kind == "object":
+			# Filled by assignment, so that sequences such as bytes are kept whole.
+			chunk = numpy.empty(len(values), dtype=object)
+			chunk[:] = values
+			return chunk
+		
+		if self.kind == "timestamp":
+			values = [ColumnBuffer.to_naive_utc_text(value) for value in values]
+		
+		return numpy.array(values, dtype=ColumnBuffer.numpy_dtypes[self.kind])
+	
+	# Returns the finished column, as a NumPy array, an array.array or a list.
+	def result(self):
+		if self.values is not None:
+			return self.values
+		
+		dtype = ColumnBuffer.numpy_dtypes[self.kind]
+		if len(self.chunks) == 0:
+			return numpy.empty(0, dtype=dtype)
+		
+		return numpy.concatenate([chunk.astype(dtype, copy=False) for chunk in self.chunks])
+	
+	# datetime64 has no time zone, so aware timestamps are stored in UTC.
+	# NumPy parses the returned text. Only timestamps with an offset other than UTC's are parsed here.
+	@staticmethod
+	def to_naive_utc_text(value):
+		if value is None:
+			return None
+		
+		if value.endswith("+00:00"):
+			return value[:-6]
+		
+		# Offsets follow the time, which follows the date.
+		if value.find("+", 10) == -1 and value.find("-", 10) == -1 and not value.endswith("Z"):
+			return value
+		
+		return datetime.fromisoformat(value).astimezone(UTC).replace(tzinfo=None).isoformat()
+	
+	# Naive timestamps are taken to be in UTC, as with datetime64.
+	@staticmethod
+	def to_posix(value):
+		if value is None:
+			return float("nan")
+		
+		value = datetime.fromisoformat(value)
+		if value.tzinfo is None:
+			value = value.replace(tzinfo=UTC)
+		
+		return value.timestamp()
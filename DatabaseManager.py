@@ -1,7 +1,15 @@
+from contextlib import contextmanager
 from datetime import datetime
+import json
+import os
 import sqlite3
+import threading
+import time
+from urllib.parse import quote
 from uuid import UUID
+import weakref
 
+from .StatementMetrics import OperationTimer, StatementMetrics
 from .VoidLog import VoidLog
 
 class ColumnInfo:
@@ -13,6 +21,21 @@ class ColumnInfo:
 		self.default_val = default_val
 		self.pk = pk
 	
+	# Used to persist schema snapshots.
+	def to_dict(self):
+		return {
+			"table_name": self.table_name,
+			"name": self.name,
+			"type": self.type,
+			"nullable": self.nullable,
+			"default_val": self.default_val,
+			"pk": self.pk
+		}
+	
+	@staticmethod
+	def from_dict(obj):
+		return ColumnInfo(obj["table_name"], obj["name"], obj["type"], obj["nullable"], obj["default_val"], obj["pk"])
+	
 	# Function is a bit off, requires research... benched for now.
 	# The ColumnInfo type field is literally the unaltered type specifier text from the create table statement, which can be basically anything.
 	# See getting_defaults_sqlite.md for details
@@ -27,11 +50,138 @@ class ColumnInfo:
 		
 		# return val == type
 
+# A sqlite3 connection carrying the bookkeeping used by the DatabaseManager's connection pool.
+class PooledConnection(sqlite3.Connection):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		
+		self.owner_pid = os.getpid()
+		self.read_only = False
+		self.last_thread_id = None
+		self.last_released = None
+		
+		# Name of the pragma profile last applied to this connection.
+		self.pragma_profile_name = None
+		
+		# Set by RelationManager once it has created its temporary table on this connection.
+		self.has_match_values_table = False
+
+# Connections must never be shared between a parent and a forked child.
+# Every live manager is reset by one fork hook, and held weakly so that the hook does not extend its lifetime.
+_live_db_mgrs = weakref.WeakSet()
+
+def _reset_pools_after_fork():
+	for db_mgr in list(_live_db_mgrs):
+		db_mgr._reset_pool_after_fork()
+
+if hasattr(os, "register_at_fork"):
+	os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
 class DatabaseManager:
-	def __init__(self, db_conn_str, database_log=VoidLog()):
+	# Named sets of pragmas, one of which is applied to every connection. See apply_pragma_profile() and using_pragma_profile().
+	# Every profile sets the same per-connection pragmas, so that switching a connection between profiles leaves nothing behind.
+	# journal_mode is stored in the database file rather than on the connection. It is skipped on read-only connections, which cannot change it.
+	pragma_profiles = {
+		# SQLite's own defaults, leaving the journal mode as it is.
+		"default": {
+			"synchronous": "FULL",
+			"mmap_size": 0,
+			"cache_size": -2000,
+			"temp_store": "DEFAULT",
+			"busy_timeout": 5000
+		},
+		# Every commit is flushed to disk before it returns.
+		"durable": {
+			"journal_mode": "WAL",
+			"synchronous": "FULL",
+			"mmap_size": 0,
+			"cache_size": -16000,
+			"temp_store": "DEFAULT",
+			"busy_timeout": 5000
+		},
+		# Commits can be lost on power failure, but never corrupt the database.
+		"throughput": {
+			"journal_mode": "WAL",
+			"synchronous": "NORMAL",
+			"mmap_size": 268435456,
+			"cache_size": -64000,
+			"temp_store": "MEMORY",
+			"busy_timeout": 5000
+		},
+		# For managers which only read, such as those serving a copy of the database.
+		"read_replica": {
+			"synchronous": "NORMAL",
+			"mmap_size": 268435456,
+			"cache_size": -64000,
+			"temp_store": "MEMORY",
+			"busy_timeout": 10000
+		},
+		# For loading data which can be loaded again if the process dies part way. Never syncs.
+		"bulk_load": {
+			"journal_mode": "WAL",
+			"synchronous": "OFF",
+			"mmap_size": 268435456,
+			"cache_size": -256000,
+			"temp_store": "MEMORY",
+			"busy_timeout": 30000
+		}
+	}
+	
+	# pool_size is the maximum number of idle connections retained for reuse, of each of the read-write and read-only kinds. Busy connections are not capped.
+	# Idle connections which have sat unused for longer than health_check_interval seconds are pinged before being handed out.
+	# If schema_snapshot_path is given, load_schema() persists the schema there and reuses it for as long as the database's schema_version is unchanged.
+	# pragma_profile names the entry of pragma_profiles applied to connections opened by this manager.
+	def __init__(self, db_conn_str, database_log=VoidLog(), pool_size=8, health_check_interval=30.0, schema_snapshot_path=None, pragma_profile="default"):
+		if type(pool_size) is not int or pool_size < 0:
+			raise ValueError(f"pool_size must be a non-negative int, not '{pool_size}'.")
+		
+		DatabaseManager.get_pragma_profile(pragma_profile)
+		self.pragma_profile_name = pragma_profile
+		
+		# Holds the profile selected by using_pragma_profile() on each thread.
+		self._pragma_local = threading.local()
+		
 		self.db_conn_str = db_conn_str
 		self.database_log = database_log
 		
+		self.pool_size = pool_size
+		self.health_check_interval = health_check_interval
+		
+		# Identifiers which have already passed validate_sql_identifiers().
+		self.validated_identifiers = set()
+		
+		# Bumped by schema_changed(). RelationManagers compare against it to know when their compiled statements are stale.
+		self.schema_generation = 0
+		
+		# Maps table names to lists of ColumnInfo once load_schema() has run. columns_of() answers from here when it can.
+		self.schema_snapshot_path = schema_snapshot_path
+		self.schema = None
+		
+		# A StatementMetrics recording connection acquires, run_script() and load_schema(). Set by EntityManager.enable_metrics().
+		self.metrics = None
+		
+		# A Tracer tracing run_script() and load_schema(). Set by EntityManager.enable_tracing().
+		self.tracer = None
+		
+		# The SlowQueryLog set by EntityManager.enable_slow_query_log(), whose threshold can be changed from here too.
+		# Scripts and schema loading run no statement worth explaining, so they are not checked.
+		self.slow_query_log = None
+		
+		self._pool_lock = threading.Lock()
+		self._idle_connections = []
+		self._idle_read_only_connections = []
+		self._pool_stats = {
+			"created": 0,
+			"reused": 0,
+			"released": 0,
+			"discarded": 0,
+			"health_check_failures": 0,
+			"fork_resets": 0,
+			"checked_out": 0
+		}
+		
+		_live_db_mgrs.add(self)
+		
 		sqlite3.register_converter(
 			"timestamp", lambda v: datetime.fromisoformat(v.decode())
 		)
@@ -48,21 +198,76 @@ class DatabaseManager:
 			UUID, lambda v: v.bytes
 		)
 	
+	# Returns the converter that PARSE_DECLTYPES applies to values of columns with the declared type, or None.
+	# Lets values which were read without conversion be converted later.
+	@staticmethod
+	def get_converter(declared_type):
+		converter_name = DatabaseManager.get_converter_name(declared_type)
+		if converter_name is None:
+			return None
+		
+		return sqlite3.converters.get(converter_name)
+	
+	# The name PARSE_DECLTYPES looks converters up by, which is the first word of the declared type in uppercase.
+	@staticmethod
+	def get_converter_name(declared_type):
+		if declared_type is None:
+			return None
+		
+		type_words = declared_type.split("(", 1)[0].split()
+		if len(type_words) == 0:
+			return None
+		
+		return type_words[0].upper()
+	
 	def run_script(self, sql_file):
 		# Connect to database and instance the schema.
-		conn = self.get_connection()
+		with OperationTimer.of(self.metrics, self.tracer, None, StatementMetrics.database_label, "run_script") as timer, self.borrow_connection() as conn:
+			sql_script = sql_file.read()
+			crsr = conn.cursor()
+			
+			start = timer.begin()
+			crsr.executescript(sql_script)
+			conn.commit()
+			timer.end_sql(start)
 		
-		sql_script = sql_file.read()
-		crsr = conn.cursor()
-		crsr.executescript(sql_script)
+		self.schema_changed()
+	
+	# Tells every RelationManager using this DatabaseManager to re-read its columns and recompile its statements.
+	# Called by run_script(). Call it after altering the schema by any other means.
+	def schema_changed(self):
+		self.schema = None
+		self.schema_generation += 1
+	
+	# Returns the detail lines of the statement's EXPLAIN QUERY PLAN, each indented by two spaces per level of nesting.
+	# Plans do not depend on the values bound, so if values is None, NULLs stand in for them.
+	# Runs on conn, or a borrowed connection if it is None. Throws sqlite3.Error if the statement cannot be prepared.
+	def explain_query_plan(self, sql, values=None, conn=None):
+		if values is None:
+			values = [None] * sql.count("?")
+		
+		if conn is None:
+			with self.borrow_connection() as conn:
+				rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", list(values)).fetchall()
+		else:
+			rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", list(values)).fetchall()
 		
-		conn.commit()
-		conn.close()
+		depths = {0: -1}
+		plan = []
+		for id, parent, notused, detail in rows:
+			depths[id] = depths.get(parent, -1) + 1
+			plan.append("  " * depths[id] + detail)
+		
+		return plan
 	
 	# Prevents SQL injection (even though it should be impossible anyway)
 	# by verifying the validity of the column/table names which are going to be spliced into a SQL statement.
+	# Identifiers which passed once are remembered and not checked again.
 	def validate_sql_identifiers(self, identifiers):
 		for identifier in identifiers:
+			if identifier in self.validated_identifiers:
+				continue
+			
 			if not isinstance(identifier, str):
 				raise TypeError(f"Identifier must be string, not {type(identifier)}.")
 			
@@ -73,27 +278,353 @@ class DatabaseManager:
 				if not character.isascii() or (character != "_" and not character.isalnum()):
 					self.database_log.critical(f"Detected invalid SQL identifier name which could present a possible route for SQL injection: {identifier}")
 					raise ValueError("Invalid SQL identifier.")
+			
+			# Bounded, since identifiers can come from callers.
+			if len(self.validated_identifiers) >= 4096:
+				self.validated_identifiers.clear()
+			
+			self.validated_identifiers.add(identifier)
 	
-	def get_connection(self):
-		conn = sqlite3.connect(self.db_conn_str, detect_types=sqlite3.PARSE_DECLTYPES, autocommit=False)
+	# Opens a new connection which is owned by the caller and must be closed by them.
+	# Prefer borrow_connection(), which reuses pooled connections.
+	# A read_only connection opens the database file with mode=ro, so that any write through it fails.
+	def get_connection(self, check_same_thread=True, read_only=False):
+		if read_only:
+			conn = sqlite3.connect(self.get_read_only_uri(), uri=True, detect_types=sqlite3.PARSE_DECLTYPES, autocommit=False, check_same_thread=check_same_thread, factory=PooledConnection)
+			conn.read_only = True
+		else:
+			conn = sqlite3.connect(self.db_conn_str, detect_types=sqlite3.PARSE_DECLTYPES, autocommit=False, check_same_thread=check_same_thread, factory=PooledConnection)
+		
 		conn.row_factory = sqlite3.Row
 		
-		conn.execute("PRAGMA foreign_keys = ON")
+		try:
+			self.apply_pragma_profile(conn, self.get_active_pragma_profile_name())
+		
+		except BaseException:
+			conn.close()
+			raise
+		
+		return conn
+	
+	def get_read_only_uri(self):
+		db_conn_str = str(self.db_conn_str)
+		if db_conn_str == "" or db_conn_str == ":memory:":
+			raise ValueError("Read-only connections need a database file.")
+		
+		return f"file:{quote(os.path.abspath(db_conn_str))}?mode=ro"
+	
+	#### Pragma Profiles ####
+	
+	@staticmethod
+	def get_pragma_profile(profile_name):
+		if not isinstance(profile_name, str):
+			raise TypeError(f"Pragma profile name must be string, not {type(profile_name)}.")
+		
+		profile = DatabaseManager.pragma_profiles.get(profile_name)
+		if profile is None:
+			raise ValueError(f"Unknown pragma profile '{profile_name}'. Expected one of: {', '.join(DatabaseManager.pragma_profiles)}.")
+		
+		return profile
+	
+	# The profile which connections borrowed by the calling thread should have applied.
+	def get_active_pragma_profile_name(self):
+		return getattr(self._pragma_local, "profile_name", None) or self.pragma_profile_name
+	
+	# Applies foreign_keys and the named profile's pragmas to the connection.
+	# Pragmas such as foreign_keys and journal_mode do nothing inside a transaction, so they are run with autocommit on. Anything uncommitted on the connection is committed first.
+	# A pragma which SQLite refuses (e.g. switching journal_mode while another connection holds a lock) is logged and skipped.
+	def apply_pragma_profile(self, conn, profile_name):
+		profile = DatabaseManager.get_pragma_profile(profile_name)
+		
+		pragmas = [("foreign_keys", "ON")]
+		for pragma, value in profile.items():
+			if pragma == "journal_mode" and conn.read_only:
+				continue
+			
+			pragmas.append((pragma, value))
+		
+		self.validate_sql_identifiers([pragma for pragma, value in pragmas] + [value for pragma, value in pragmas if isinstance(value, str)])
+		
+		conn.autocommit = True
+		try:
+			for pragma, value in pragmas:
+				try:
+					conn.execute(f"PRAGMA {pragma} = {int(value) if not isinstance(value, str) else value}").fetchall()
+				
+				except sqlite3.OperationalError as e:
+					self.database_log.warning(f"Could not set PRAGMA {pragma} = {value} for profile '{profile_name}': {e}")
+		
+		finally:
+			conn.autocommit = False
+		
+		conn.pragma_profile_name = profile_name
+	
+	# Connections borrowed by the calling thread within the with block get the named profile instead of the manager's own.
+	# Pooled connections are switched as they are acquired, and switched back by the first acquire after the block.
+	# Open a transaction inside the block, not the other way around, since a transaction keeps the connection it started with.
+	@contextmanager
+	def using_pragma_profile(self, profile_name):
+		DatabaseManager.get_pragma_profile(profile_name)
+		
+		previous_profile_name = getattr(self._pragma_local, "profile_name", None)
+		self._pragma_local.profile_name = profile_name
+		try:
+			yield
+		
+		finally:
+			self._pragma_local.profile_name = previous_profile_name
+	
+	#### Connection Pool ####
+	
+	# Takes a connection out of the pool, opening a new one if none are idle.
+	# The connection last released by the calling thread is preferred, so that each thread tends to keep reusing the same connection.
+	# Read-only connections are pooled separately from the others.
+	# Every acquired connection must be handed back with release_connection().
+	def acquire_connection(self, read_only=False):
+		metrics = self.metrics
+		if metrics is not None:
+			start = time.perf_counter()
+		
+		thread_id = threading.get_ident()
+		
+		conn = None
+		with self._pool_lock:
+			idle_connections = self._idle_read_only_connections if read_only else self._idle_connections
+			
+			for i in range(len(idle_connections) - 1, -1, -1):
+				if idle_connections[i].last_thread_id == thread_id:
+					conn = idle_connections.pop(i)
+					break
+			
+			if conn is None and len(idle_connections) > 0:
+				conn = idle_connections.pop()
+			
+			self._pool_stats["checked_out"] += 1
+		
+		if conn is not None and not self.connection_is_healthy(conn):
+			conn = None
+		
+		created = conn is None
+		if created:
+			try:
+				conn = self.get_connection(check_same_thread=False, read_only=read_only)
+			except sqlite3.Error:
+				with self._pool_lock:
+					self._pool_stats["checked_out"] -= 1
+				raise
+			
+			with self._pool_lock:
+				self._pool_stats["created"] += 1
+		
+		else:
+			with self._pool_lock:
+				self._pool_stats["reused"] += 1
+			
+			profile_name = self.get_active_pragma_profile_name()
+			if conn.pragma_profile_name != profile_name:
+				self.apply_pragma_profile(conn, profile_name)
+		
+		conn.last_thread_id = thread_id
+		
+		if metrics is not None:
+			metrics.record_acquire(time.perf_counter() - start, created)
 		
 		return conn
 	
+	# Returns a connection to the pool. Anything left uncommitted on it is rolled back.
+	def release_connection(self, conn):
+		with self._pool_lock:
+			self._pool_stats["checked_out"] -= 1
+		
+		# Borrowed before a fork. It belongs to the parent, so it must not be touched or reused here.
+		if conn.owner_pid != os.getpid():
+			with self._pool_lock:
+				self._pool_stats["discarded"] += 1
+			
+			return
+		
+		# Ends the implicit transaction, which also drops any locks held by reads.
+		try:
+			conn.rollback()
+		
+		except sqlite3.Error as e:
+			self.database_log.warning(f"Discarding pooled connection which failed to roll back: {e}")
+			self.close_discarded_connection(conn)
+			return
+		
+		conn.last_released = time.monotonic()
+		
+		with self._pool_lock:
+			idle_connections = self._idle_read_only_connections if conn.read_only else self._idle_connections
+			
+			if len(idle_connections) < self.pool_size:
+				idle_connections.append(conn)
+				self._pool_stats["released"] += 1
+				return
+		
+		self.close_discarded_connection(conn)
+	
+	# Borrows a pooled connection for the duration of a with block.
+	@contextmanager
+	def borrow_connection(self, read_only=False):
+		conn = self.acquire_connection(read_only)
+		try:
+			yield conn
+		
+		finally:
+			self.release_connection(conn)
+	
+	# Pings connections which have been idle for longer than the health check interval.
+	# Broken connections are closed and reported as unhealthy.
+	def connection_is_healthy(self, conn):
+		if conn.last_released is not None and time.monotonic() - conn.last_released < self.health_check_interval:
+			return True
+		
+		try:
+			conn.execute("SELECT 1").fetchone()
+		
+		except sqlite3.Error as e:
+			self.database_log.warning(f"Pooled connection failed health check: {e}")
+			
+			with self._pool_lock:
+				self._pool_stats["health_check_failures"] += 1
+			
+			self.close_discarded_connection(conn)
+			return False
+		
+		return True
+	
+	def close_discarded_connection(self, conn):
+		with self._pool_lock:
+			self._pool_stats["discarded"] += 1
+		
+		try:
+			conn.close()
+		except sqlite3.Error:
+			pass
+	
+	# Closes every idle connection. Connections which are currently borrowed are closed as they are released.
+	def close_pool(self):
+		with self._pool_lock:
+			idle_connections = self._idle_connections + self._idle_read_only_connections
+			self._idle_connections = []
+			self._idle_read_only_connections = []
+		
+		for conn in idle_connections:
+			self.close_discarded_connection(conn)
+	
+	# Called in a freshly forked child. The parent's connections are dropped rather than reused, and the lock is replaced in case it was held mid-fork.
+	def _reset_pool_after_fork(self):
+		self._pool_lock = threading.Lock()
+		self._idle_connections = []
+		self._idle_read_only_connections = []
+		
+		self._pool_stats["checked_out"] = 0
+		self._pool_stats["fork_resets"] += 1
+	
+	# Returns a snapshot of the pool's counters.
+	def pool_stats(self):
+		with self._pool_lock:
+			res = dict(self._pool_stats)
+			res["idle"] = len(self._idle_connections)
+			res["idle_read_only"] = len(self._idle_read_only_connections)
+		
+		res["pool_size"] = self.pool_size
+		return res
+	
+	#### Schema Introspection ####
+	
+	# Reads the columns of every table in the database over one connection, and keeps them for columns_of().
+	# With a schema_snapshot_path, the result is saved alongside the database's schema_version,
+	# and later calls (including from other processes) load the snapshot instead of introspecting while that version is unchanged.
+	# Returns the dict of table names to lists of ColumnInfo.
+	def load_schema(self):
+		with OperationTimer.of(self.metrics, self.tracer, None, StatementMetrics.database_label, "load_schema") as timer, self.borrow_connection() as conn:
+			schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+			
+			schema = self.read_schema_snapshot(schema_version)
+			if schema is None:
+				start = timer.begin()
+				crsr = conn.execute(
+					"SELECT m.name AS table_name, p.name, p.type, p.\"notnull\", p.dflt_value, p.pk "
+					"FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+					"WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' "
+					"ORDER BY m.name, p.cid"
+				)
+				
+				schema = {}
+				for column in crsr:
+					schema.setdefault(column["table_name"], []).append(
+						ColumnInfo(column["table_name"], column["name"], column["type"], not column["notnull"], column["dflt_value"], column["pk"])
+					)
+				
+				timer.end_sql(start, rows=sum(len(columns) for columns in schema.values()))
+				
+				self.write_schema_snapshot(schema_version, schema)
+		
+		self.schema = schema
+		return schema
+	
+	# Returns the snapshotted schema if it was taken of this database at the passed schema_version, or None.
+	def read_schema_snapshot(self, schema_version):
+		if self.schema_snapshot_path is None:
+			return None
+		
+		try:
+			with open(self.schema_snapshot_path, "r") as snapshot_file:
+				snapshot = json.load(snapshot_file)
+		
+		except (OSError, ValueError) as e:
+			self.database_log.info(f"Not using schema snapshot '{self.schema_snapshot_path}': {e}")
+			return None
+		
+		if snapshot.get("db_conn_str") != str(self.db_conn_str) or snapshot.get("schema_version") != schema_version:
+			return None
+		
+		self.database_log.debug(f"Loaded schema snapshot for schema_version {schema_version}.")
+		
+		schema = {}
+		for table_name, columns in snapshot["tables"].items():
+			schema[table_name] = [ColumnInfo.from_dict(column) for column in columns]
+		
+		return schema
+	
+	# Written to a temporary file first, so that concurrent readers never see a partial snapshot.
+	def write_schema_snapshot(self, schema_version, schema):
+		if self.schema_snapshot_path is None:
+			return
+		
+		snapshot = {
+			"db_conn_str": str(self.db_conn_str),
+			"schema_version": schema_version,
+			"tables": {table_name: [column.to_dict() for column in columns] for table_name, columns in schema.items()}
+		}
+		
+		temp_path = f"{self.schema_snapshot_path}.{os.getpid()}.tmp"
+		try:
+			with open(temp_path, "w") as snapshot_file:
+				json.dump(snapshot, snapshot_file)
+			
+			os.replace(temp_path, self.schema_snapshot_path)
+		
+		except OSError as e:
+			self.database_log.warning(f"Could not write schema snapshot '{self.schema_snapshot_path}': {e}")
+	
 	# Meant to be called only during RelationManager instantiation, not regularly!
+	# Answers from the schema read by load_schema() if it is loaded.
 	def columns_of(self, table_name):
 		self.validate_sql_identifiers([table_name])
 		
-		conn = self.get_connection() # Nothing to commit.
-		crsr = conn.execute("PRAGMA table_info(" + table_name + ")")
+		if self.schema is not None and table_name in self.schema:
+			return list(self.schema[table_name])
 		
-		ret = []
-		for column in crsr:
-			ret.append(ColumnInfo(table_name, column["name"], column["type"], not column["notnull"], column["dflt_value"], column["pk"]))
-		
-		# TODO: Perform INSERT DEFAULT VALUES and SELECT to get the defaults too.
+		with self.borrow_connection() as conn: # Nothing to commit.
+			crsr = conn.execute("PRAGMA table_info(" + table_name + ")")
+			
+			ret = []
+			for column in crsr:
+				ret.append(ColumnInfo(table_name, column["name"], column["type"], not column["notnull"], column["dflt_value"], column["pk"]))
+			
+			# TODO: Perform INSERT DEFAULT VALUES and SELECT to get the defaults too.
 		
-		conn.close()
 		return ret
\ No newline at end of file
@@ -1,20 +1,58 @@
 
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import contextvars
+import threading
 import traceback
 
 from .VoidLog import VoidLog
+from .IdentityMap import IdentityMap
+from .IndexAdvisor import IndexAdvisor
 from .RelationManager import RelationManager
+from .SlowQueryLog import SlowQueryLog
+from .StatementMetrics import StatementMetrics
+from .Tracer import Tracer
+from .UnitOfWork import UnitOfWork
 
 # TODO: Rename recurse-only parameters with a preceeding underscore.
 
 # Holds canonical copies of managers for the various entities in the database.
 class EntityManager:
-	def __init__(self, db_mgr, entity_log):
+	# gather_workers is the number of queries that gather() runs at once.
+	def __init__(self, db_mgr, entity_log, gather_workers=4):
+		if type(gather_workers) is not int or gather_workers < 1:
+			raise ValueError(f"gather_workers must be a positive int, not '{gather_workers}'.")
+		
 		self.db_mgr = db_mgr
 		self.entity_log = entity_log
 		
 		self.tables = {}
+		
+		# Created by get_gather_executor() once gather() is used, and shut down by close().
+		self.gather_workers = gather_workers
+		self.gather_executor = None
+		self._gather_executor_lock = threading.Lock()
+		
+		# Set by enable_identity_map().
+		self.identity_map = None
+		
+		# Set by enable_metrics().
+		self.metrics = None
+		
+		# Set by enable_tracing().
+		self.tracer = None
+		
+		# Set by enable_slow_query_log().
+		self.slow_query_log = None
+		
+		# Set by enable_index_advisor().
+		self.index_advisor = None
+		
+		# Holds the transaction open on each thread, if any, and whether the thread is running a gather() query.
+		self._local = threading.local()
 	
-	def manage_table(self, table_name, entity_model):
+	# With slotted, entities store their columns in slots rather than a __dict__. With lazy, read entities copy values out of their row only when accessed. See RelationManager.
+	def manage_table(self, table_name, entity_model, slotted=False, lazy=False):
 		if type(table_name) is not str:
 			raise TypeError(f"table_name must be string, not {type(table_name)}.")
 		
@@ -24,11 +62,232 @@ class EntityManager:
 		# if not issubclass(entity_model, EntityModel):
 			# raise TypeError(f"entity_model must be a class which inherits EntityModel, not {entity_model}.")
 		
-		self.tables[table_name] = RelationManager(self, self.entity_log, table_name, entity_model)
+		self.tables[table_name] = RelationManager(self, self.entity_log, table_name, entity_model, slotted, lazy)
+	
+	# Manages every table in the database, reading the whole schema at once with DatabaseManager.load_schema().
+	# entity_models optionally maps table names to their entity models. Other tables use default_entity_model.
+	# Tables which are already managed are left alone, and tables without an 'id' primary key are skipped.
+	def manage_all_tables(self, entity_models={}, default_entity_model=None, slotted=False, lazy=False):
+		from .EntityModel import EntityModel
+		if default_entity_model is None:
+			default_entity_model = EntityModel
+		
+		schema = self.db_mgr.load_schema()
+		
+		for table_name in schema:
+			if table_name in self.tables:
+				continue
+			
+			try:
+				self.manage_table(table_name, entity_models.get(table_name, default_entity_model), slotted, lazy)
+			
+			except ValueError as e:
+				self.entity_log.info(f"Not managing table '{table_name}': {e}")
 	
 	# Acquires the named table manager which can be used to perform CRUD operations on a specific kind of item.
 	def with_table(self, table_name):
 		if table_name in self.tables:
 			return self.tables[table_name]
 		else:
-			raise RuntimeError("Invalid Table '" + table_name + "'")
\ No newline at end of file
+			raise RuntimeError("Invalid Table '" + table_name + "'")
+	
+	# Stops the gather() worker threads, waiting for running queries, and closes the database's idle pooled connections.
+	# A later gather() starts new workers.
+	def close(self):
+		with self._gather_executor_lock:
+			gather_executor = self.gather_executor
+			self.gather_executor = None
+		
+		if gather_executor is not None:
+			gather_executor.shutdown()
+		
+		self.db_mgr.close_pool()
+	
+	#### Identity Map ####
+	
+	# Makes repeated read(id) calls on any managed table return one cached entity instance, rather than reading the row again.
+	# Up to default_size entities are kept per table, least recently used first out. table_sizes overrides this per table, where 0 disables caching.
+	# Writes made through the RelationManagers keep the cache coherent. Writes made by any other means are not seen by it.
+	def enable_identity_map(self, default_size=1024, table_sizes={}):
+		self.identity_map = IdentityMap(default_size, table_sizes)
+	
+	def disable_identity_map(self):
+		self.identity_map = None
+	
+	# Returns the hit, miss, eviction and invalidation counters of the identity map, or None if it is disabled.
+	def identity_map_stats(self):
+		if self.identity_map is None:
+			return None
+		
+		return self.identity_map.get_stats()
+	
+	#### Metrics ####
+	
+	# Starts recording the SQL time, hydration time, statements and rows of every operation run through the managed tables, per table and operation,
+	# along with how long connections take to acquire from the DatabaseManager's pool. Anything recorded before is discarded.
+	# exporter, if given, is called with a dict describing each operation and acquire as it is recorded. See StatementMetrics.
+	def enable_metrics(self, exporter=None):
+		self.metrics = StatementMetrics(exporter)
+		self.db_mgr.metrics = self.metrics
+	
+	def disable_metrics(self):
+		if self.db_mgr.metrics is self.metrics:
+			self.db_mgr.metrics = None
+		
+		self.metrics = None
+	
+	# Returns a snapshot of the recorded metrics as described by StatementMetrics.stats(), or None if they are disabled.
+	def stats(self):
+		if self.metrics is None:
+			return None
+		
+		return self.metrics.stats()
+	
+	#### Tracing ####
+	
+	# Traces every operation run through the managed tables as a span, with child spans for its statements, fetches, hydration and commit. See Tracer.
+	# sink is called with each finished Span, e.g. a SpanCollector or LoggingSpanSink. Traces are sampled with probability sample_rate.
+	# Returns the Tracer, whose span() opens spans which the operations run inside it are children of.
+	def enable_tracing(self, sink, sample_rate=1.0):
+		self.tracer = Tracer(sink, sample_rate)
+		self.db_mgr.tracer = self.tracer
+		return self.tracer
+	
+	def disable_tracing(self):
+		if self.db_mgr.tracer is self.tracer:
+			self.db_mgr.tracer = None
+		
+		self.tracer = None
+	
+	#### Slow Queries ####
+	
+	# Logs, as a warning to log (by default the entity_log), every operation whose statements took at least threshold seconds, with the last statement's parameters and EXPLAIN QUERY PLAN.
+	# Full scans and automatic indexes in the plan are called out, as they mean an index is missing. Anything recorded before is discarded. See SlowQueryLog.
+	# Returns the SlowQueryLog.
+	def enable_slow_query_log(self, threshold=0.1, log=None, explain=True, log_parameters=True):
+		self.slow_query_log = SlowQueryLog(self.db_mgr, log if log is not None else self.entity_log, threshold, explain, log_parameters)
+		self.db_mgr.slow_query_log = self.slow_query_log
+		return self.slow_query_log
+	
+	def disable_slow_query_log(self):
+		if self.db_mgr.slow_query_log is self.slow_query_log:
+			self.db_mgr.slow_query_log = None
+		
+		self.slow_query_log = None
+	
+	# Returns the n slow statements which took the most time in total, as described by SlowQueryLog.report(), or None if the slow query log is disabled.
+	def slow_query_report(self, n=10):
+		if self.slow_query_log is None:
+			return None
+		
+		return self.slow_query_log.report(n)
+	
+	#### Index Advisor ####
+	
+	# Starts watching which columns the managed tables are filtered and joined on, to propose the indexes they lack. See IndexAdvisor.
+	# Returns the IndexAdvisor, whose apply() creates the proposed indexes and reports how the plans of the queries changed.
+	def enable_index_advisor(self):
+		self.index_advisor = IndexAdvisor(self.db_mgr)
+		return self.index_advisor
+	
+	def disable_index_advisor(self):
+		self.index_advisor = None
+	
+	# Returns the indexes proposed by IndexAdvisor.advise(), or None if the index advisor is disabled.
+	def index_advice(self, min_uses=1):
+		if self.index_advisor is None:
+			return None
+		
+		return self.index_advisor.advise(min_uses)
+	
+	#### Transactions ####
+	
+	# Returns the UnitOfWork opened by transaction() on the calling thread, or None.
+	def current_transaction(self):
+		return getattr(self._local, "transaction", None)
+	
+	# Groups every operation on this thread within the with block into a single transaction on one pinned connection.
+	# Commits once on exit, or rolls everything back if the block raises.
+	# Nested scopes join the outermost one.
+	@contextmanager
+	def transaction(self):
+		transaction = self.current_transaction()
+		if transaction is not None:
+			yield transaction
+			return
+		
+		with self.db_mgr.borrow_connection() as conn:
+			transaction = UnitOfWork(self, conn)
+			self._local.transaction = transaction
+			
+			try:
+				yield transaction
+				transaction.commit()
+			
+			except BaseException:
+				self.entity_log.info("Rolling back transaction.")
+				transaction.rollback()
+				
+				# Cached entities may hold writes which were just rolled back.
+				if self.identity_map is not None:
+					self.identity_map.clear()
+				
+				raise
+			
+			finally:
+				self._local.transaction = None
+	
+	#### Parallel Reads ####
+	
+	# True while the calling thread runs a query for gather(). RelationManagers then borrow read-only connections.
+	def is_read_only(self):
+		return getattr(self._local, "read_only", False)
+	
+	# Runs independent read queries at the same time, each on a worker thread with its own read-only connection, and returns their results in order.
+	# Each query is a callable taking no arguments, such as: lambda: entity_mgr.with_table("users").read_by_column("manager_id", boss_id)
+	# Once every query has finished, the first error raised by any of them is raised, in query order. With return_exceptions, errors are returned in place of results instead.
+	# Inside a transaction or another gather() query, queries run one after another on the calling thread, so that they see its uncommitted writes.
+	def gather(self, *queries, return_exceptions=False):
+		for query in queries:
+			if not callable(query):
+				raise TypeError(f"Queries must be callable, not {type(query)}.")
+		
+		if self.current_transaction() is not None or self.is_read_only():
+			futures = None
+		else:
+			# Each query runs in a copy of the calling context, so that its spans are children of the caller's.
+			gather_executor = self.get_gather_executor()
+			futures = [gather_executor.submit(contextvars.copy_context().run, self.run_read_only, query) for query in queries]
+			wait(futures)
+		
+		res = []
+		first_error = None
+		for i, query in enumerate(queries):
+			try:
+				res.append(query() if futures is None else futures[i].result())
+			
+			except Exception as e:
+				if not return_exceptions and first_error is None:
+					first_error = e
+				
+				res.append(e)
+		
+		if first_error is not None:
+			raise first_error
+		
+		return res
+	
+	def get_gather_executor(self):
+		with self._gather_executor_lock:
+			if self.gather_executor is None:
+				self.gather_executor = ThreadPoolExecutor(max_workers=self.gather_workers, thread_name_prefix="entity-gather")
+			
+			return self.gather_executor
+	
+	def run_read_only(self, query):
+		self._local.read_only = True
+		try:
+			return query()
+		
+		finally:
+			self._local.read_only = False
@@ -7,17 +7,49 @@ from .ColumnIdentifier import ColumnIdentifier, ColumnRetrievalError
 class EntityModel:
 	# No constructor, so that deriving classes do not need to use the super constructor.
 	
+	# Deriving classes which declare no __slots__ of their own store columns in a __dict__ as usual.
+	# Those declaring __slots__ = () can be managed with slotted=True, which stores columns in slots of a class generated per table.
+	__slots__ = ()
+	
 	def set_relation_mgr(self, relation_mgr):
 		object.__setattr__(self, "relation_mgr", relation_mgr)
 	
 	def get_relation_mgr(self):
 		# Detailed error checking for initialization, since the constructor is not defined.
 		try:
-			return self.__dict__["relation_mgr"]
+			return object.__getattribute__(self, "relation_mgr")
 			
-		except (KeyError):
+		except (AttributeError):
 			raise RuntimeError("relation_mgr was not initialized.")
 	
+	#### Dirty Tracking ####
+	
+	# Shared by every clean entity, so that a set is only allocated once an entity is modified.
+	clean_columns = frozenset()
+	
+	# Records that a column was assigned since the entity was last read or written.
+	def mark_dirty(self, column_name):
+		try:
+			object.__getattribute__(self, "dirty_columns").add(column_name.lower())
+		
+		except AttributeError: # Unset, or clean_columns.
+			object.__setattr__(self, "dirty_columns", {column_name.lower()})
+	
+	# Called once the entity matches its row, after being read or written.
+	def mark_clean(self):
+		object.__setattr__(self, "dirty_columns", EntityModel.clean_columns)
+	
+	# Returns the set of lowercase names assigned since the entity was last read or written.
+	def get_dirty_columns(self):
+		try:
+			return object.__getattribute__(self, "dirty_columns")
+		
+		except AttributeError:
+			return EntityModel.clean_columns
+	
+	def is_dirty(self):
+		return len(self.get_dirty_columns()) > 0
+	
 	# Context management
 	def __enter__(self):
 		return self
@@ -69,7 +101,7 @@ class EntityModel:
 		if depth == 0: # Validate input.
 			self.get_relation_mgr().entity_mgr.db_mgr.validate_sql_identifiers([table_name_or_alias])
 		
-		if table_name_or_alias.lower() == self_alias.lower() or table_name_or_alias.lower() == self.get_relation_mgr().get_validated_relation_expression().lower():
+		if (self_alias is not None and table_name_or_alias.lower() == self_alias.lower()) or table_name_or_alias.lower() == self.get_relation_mgr().get_validated_relation_expression().lower():
 			return self
 		
 		else:
@@ -106,8 +138,10 @@ class EntityModel:
 		
 		return val
 	
-	# def __setattr__(self, name, new_value):
-		# self.set_value(new_value, name)
+	# Member assignment is tracked so that update() can write only the columns that changed.
+	def __setattr__(self, name, new_value):
+		object.__setattr__(self, name, new_value)
+		self.mark_dirty(name)
 	
 	# This recursive function's signature must match JoinedRelationManager.value_accessor(), the caller!
 	# Exposes get/set functionality on the columns of this entity.
@@ -115,7 +149,6 @@ class EntityModel:
 	# That alias was passed to the JoinedRelationManager's constructor. This mechanism allows different aliases to the self table during self-joins.
 	def value_accessor(self, column, self_alias, am_setting, new_value, depth):
 		#print("value_accessor", column, self_alias, am_setting, new_value, depth)
-		self.get_relation_mgr().entity_log.debug("  "*depth + f"[{self_alias if self_alias is not None else self.get_relation_mgr().get_table_name()}] {column}{f" := {new_value}"}")
 		
 		table_name_matches_self_alias = column.qualifier is not None and self_alias is not None and column.qualifier.lower() == self_alias.lower()
 		table_name_matches_self_name = column.qualifier is not None and column.qualifier.lower() == self.get_relation_mgr().get_validated_relation_expression().lower()
@@ -126,13 +159,14 @@ class EntityModel:
 		# Validate identified table, if any.
 		if column.qualifier is None or table_name_matches_self_alias or table_name_matches_self_name:
 			# Validate column presence.
-			if column.name.lower() in self.get_relation_mgr().get_column_names():
+			if column.name.lower() in self.get_relation_mgr().get_column_name_set():
 				if am_setting:
-					return object.__setattr__(self, column.name, new_value)
+					object.__setattr__(self, column.name, new_value)
+					self.mark_dirty(column.name)
+					return
 				else:
-					# print(self.__dict__)
-					# Attribute should've been created by new_blank_entity()
-					return self.__dict__[column.name]
+					# Attribute should've been created by new_blank_entity(), in __dict__ or a slot.
+					return object.__getattribute__(self, column.name)
 				
 			else:
 				raise ColumnRetrievalError(f"Column name '{column}' does not exist.")
@@ -140,4 +174,50 @@ class EntityModel:
 		else:
 			raise ColumnRetrievalError(f"'{column.qualifier}' does not refer to this entity.")
 		
-		assert False
\ No newline at end of file
+		assert False
+
+# Column attribute of the classes generated for lazy entities. See RelationManager.
+# Until a column is first written, its value is read from the row the entity was read from, and converted from its declared type on first access.
+class LazyColumn:
+	def __init__(self, name, index, converter):
+		self.name = name
+		self.index = index
+		self.converter = converter
+	
+	def __get__(self, entity, owner=None):
+		if entity is None:
+			return self
+		
+		entity_dict = entity.__dict__
+		if self.name in entity_dict:
+			return entity_dict[self.name]
+		
+		if "lazy_row" not in entity_dict:
+			raise AttributeError(f"Column '{self.name}' has no value.")
+		
+		value = self.decode(entity_dict["lazy_row"])
+		
+		# Keep converted values, so that they are converted once.
+		if self.converter is not None:
+			entity_dict[self.name] = value
+		
+		return value
+	
+	# The first write copies every column out of the row, after which the entity holds its own values like any other.
+	def __set__(self, entity, value):
+		entity_dict = entity.__dict__
+		if "lazy_row" in entity_dict:
+			row = entity_dict.pop("lazy_row")
+			
+			for lazy_column in type(entity).lazy_columns:
+				if lazy_column.name not in entity_dict:
+					entity_dict[lazy_column.name] = lazy_column.decode(row)
+		
+		entity_dict[self.name] = value
+	
+	def decode(self, row):
+		value = row[self.index]
+		if value is not None and self.converter is not None:
+			value = self.converter(value)
+		
+		return value
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import threading
+
+# An LRU cache of entities keyed by table name and id, shared by the RelationManagers of one EntityManager.
+# Repeated reads of the same id return the same entity instance, so changes made to it are visible to every holder.
+class IdentityMap:
+	# default_size is the number of entities kept per table. table_sizes overrides it for individual tables, where 0 disables caching.
+	def __init__(self, default_size=1024, table_sizes={}):
+		if type(default_size) is not int or default_size < 0:
+			raise ValueError(f"default_size must be a non-negative int, not '{default_size}'.")
+		
+		self.default_size = default_size
+		self.table_sizes = dict(table_sizes)
+		
+		self.lock = threading.Lock()
+		self.tables = {}
+		self.stats = {
+			"hits": 0,
+			"misses": 0,
+			"evictions": 0,
+			"invalidations": 0
+		}
+	
+	def get_table_size(self, table_name):
+		return self.table_sizes.get(table_name, self.default_size)
+	
+	# Returns the cached entity, or None.
+	def get(self, table_name, id):
+		with self.lock:
+			entities = self.tables.get(table_name)
+			entity = entities.get(id) if entities is not None else None
+			
+			if entity is None:
+				self.stats["misses"] += 1
+				return None
+			
+			entities.move_to_end(id)
+			self.stats["hits"] += 1
+			return entity
+	
+	# Caches a bound entity, evicting the least recently used entity of its table if the table is full.
+	def put(self, table_name, entity):
+		size = self.get_table_size(table_name)
+		if size == 0:
+			return
+		
+		with self.lock:
+			entities = self.tables.setdefault(table_name, OrderedDict())
+			entities[entity.id] = entity
+			entities.move_to_end(entity.id)
+			
+			while len(entities) > size:
+				entities.popitem(last=False)
+				self.stats["evictions"] += 1
+	
+	# Returns True if this exact entity instance is the one cached for its id.
+	def holds(self, table_name, entity):
+		with self.lock:
+			entities = self.tables.get(table_name)
+			return entities is not None and entities.get(entity.id) is entity
+	
+	def invalidate(self, table_name, id):
+		with self.lock:
+			entities = self.tables.get(table_name)
+			if entities is not None and entities.pop(id, None) is not None:
+				self.stats["invalidations"] += 1
+	
+	# Drops every cached entity of one table, or of all tables if table_name is None.
+	def clear(self, table_name=None):
+		with self.lock:
+			if table_name is None:
+				cleared = self.tables
+				self.tables = {}
+			else:
+				cleared = {table_name: self.tables.pop(table_name, {})}
+			
+			self.stats["invalidations"] += sum(len(entities) for entities in cleared.values())
+	
+	# Returns a snapshot of the counters, along with the number of entities currently cached per table.
+	def get_stats(self):
+		with self.lock:
+			res = dict(self.stats)
+			res["sizes"] = {table_name: len(entities) for table_name, entities in self.tables.items()}
+		
+		return res
@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+
+# Watches which columns queries filter on and join on, and proposes the indexes they lack.
+# Each proposal is one of:
+# - "filter": an index on a column which read_by_column(), read_many(), update_where() and the like match against.
+# - "join": an index on the key of a joined table, so that SQLite searches the table for each row of the other rather than scanning it.
+# - "covering": an index on a read_columns() filter followed by the columns it reads, so that the table itself is never read.
+# Columns already leading an index, and the id column, which is the rowid, are never proposed.
+class IndexAdvisor:
+	def __init__(self, db_mgr):
+		self.db_mgr = db_mgr
+		
+		self.lock = threading.Lock()
+		self.candidates = {}
+	
+	# Called by RelationManager.observe_query() as a query runs on relation.
+	def observe(self, relation, column_name, column_names=None):
+		observed = []
+		
+		if column_name is not None:
+			leaf_relation, column = relation.get_index_target(column_name)
+			
+			covered_columns = []
+			if column_names is not None and leaf_relation is relation:
+				covered_columns = [relation.get_index_target(name)[1] for name in column_names]
+				covered_columns = [name for name in dict.fromkeys(covered_columns) if name.lower() not in ("id", column.lower())]
+			
+			if len(covered_columns) > 0:
+				observed.append(("covering", leaf_relation, (column, *covered_columns)))
+			else:
+				observed.append(("filter", leaf_relation, (column,)))
+		
+		for leaf_relation, column in relation.get_join_targets():
+			observed.append(("join", leaf_relation, (column,)))
+		
+		with self.lock:
+			for kind, leaf_relation, columns in observed:
+				if columns[0].lower() == "id":
+					continue
+				
+				key = (leaf_relation.get_table_name(), columns)
+				candidate = self.candidates.get(key)
+				if candidate is None:
+					candidate = {
+						"kind": kind,
+						"relation": leaf_relation,
+						"uses": 0
+					}
+					self.candidates[key] = candidate
+				
+				candidate["uses"] += 1
+				
+				# Kept to explain a query like the last one before and after the index is created.
+				candidate["example"] = (relation, column_name, column_names)
+	
+	# Returns the indexes worth creating, most used first, as dicts with the "table", "columns", "kind" of use, number of "uses",
+	# and the "name" and "sql" that RelationManager.ensure_index() would create it with. Candidates used fewer than min_uses times are left out.
+	def advise(self, min_uses=1):
+		with self.lock:
+			candidates = [(key, candidate) for key, candidate in self.candidates.items() if candidate["uses"] >= min_uses]
+		
+		candidates.sort(key=lambda item: item[1]["uses"], reverse=True)
+		
+		indexes = {}
+		
+		res = []
+		for (table_name, columns), candidate in candidates:
+			relation = candidate["relation"]
+			if table_name not in indexes:
+				indexes[table_name] = [index for index in relation.get_indexes() if not index["partial"]]
+			
+			if any(IndexAdvisor.index_serves(index["columns"], columns) for index in indexes[table_name]):
+				continue
+			
+			# A longer index starting with the same columns, proposed for other queries, would serve too.
+			if any(other_table_name == table_name and len(other_columns) > len(columns) and IndexAdvisor.index_serves(other_columns, columns) for (other_table_name, other_columns), other_candidate in candidates):
+				continue
+			
+			index_name, query_str = relation.get_create_index_statement(list(columns))
+			res.append({
+				"table": table_name,
+				"columns": list(columns),
+				"kind": candidate["kind"],
+				"uses": candidate["uses"],
+				"name": index_name,
+				"sql": query_str
+			})
+		
+		return res
+	
+	# Creates the indexes advise() proposes, and returns its proposals with the outcome of each:
+	# "created" is False if the index could not be created, "expected" is the plan line the example query should now have,
+	# "before" and "after" are the example query's plans, and "as_expected" is whether the new plan uses the index.
+	# Plans are explained after every index is created, since which a join uses can depend on the indexes of the other tables.
+	def apply(self, min_uses=1):
+		res = self.advise(min_uses)
+		
+		examples = []
+		for proposal in res:
+			with self.lock:
+				candidate = self.candidates[(proposal["table"], tuple(proposal["columns"]))]
+			
+			sql, values = IndexAdvisor.get_example_statement(*candidate["example"])
+			examples.append((sql, values))
+			
+			proposal["before"] = self.explain(sql, values)
+			proposal["created"] = candidate["relation"].ensure_index(proposal["columns"]) is not None
+		
+		for proposal, (sql, values) in zip(res, examples):
+			proposal["expected"] = f"SEARCH {proposal["table"]} USING {"COVERING " if proposal["kind"] == "covering" else ""}INDEX {proposal["name"]}"
+			proposal["after"] = self.explain(sql, values)
+			proposal["as_expected"] = proposal["created"] and any(f"INDEX {proposal["name"]} " in f"{line} " for line in proposal["after"])
+		
+		return res
+	
+	# Forgets what was observed.
+	def reset(self):
+		with self.lock:
+			self.candidates = {}
+	
+	# True if an index on index_columns makes a separate index on columns redundant, by starting with them.
+	@staticmethod
+	def index_serves(index_columns, columns):
+		index_columns = [None if column is None else column.lower() for column in index_columns]
+		return index_columns[:len(columns)] == [column.lower() for column in columns]
+	
+	# Builds a statement like those of an observed query, with a single value to match in place of whatever was matched.
+	@staticmethod
+	def get_example_statement(relation, column_name, column_names):
+		if column_name is None:
+			return f"{relation.get_select_statement()} WHERE 1", []
+		
+		condition = f"{relation.get_validated_column_reference(column_name)} = ?"
+		
+		if column_names is None:
+			return f"{relation.get_select_statement()} WHERE {condition}", [None]
+		
+		column_references = [relation.get_validated_column_reference(name) for name in column_names]
+		return f"SELECT {",".join(column_references)} FROM {relation.get_validated_relation_expression()} WHERE {condition}", [None]
+	
+	def explain(self, sql, values):
+		try:
+			return self.db_mgr.explain_query_plan(sql, values)
+		
+		except sqlite3.Error as e:
+			return [f"(unavailable: {e})"]
@@ -4,21 +4,33 @@ from .EntityModel import EntityModel
 # The EntityModel for objects stored on JOIN'd relations, corresponding to individual rows in the result of a JOIN.
 # Automatically constructed as the return types of queries on JoinedRelationManaager
 class JoinedEntityModel(EntityModel):
-	def __init__(self, joined_relation):
+	# The constituent entities are blank unless passed in, as JoinedRelationManager.new_entity_shell() does.
+	def __init__(self, joined_relation, left_entity=None, right_entity=None):
 		from .JoinedRelationManager import JoinedRelationManager
 		if type(joined_relation) is not JoinedRelationManager:
 			raise TypeError(f"joined_relation must be JoinedRelationManager, not {joined_relation}.")
 		
 		self.set_relation_mgr(joined_relation)
 		
-		self.left_relation = joined_relation.left_relation
-		self.right_relation = joined_relation.right_relation
+		# Not columns, so assigned without dirty tracking.
+		object.__setattr__(self, "left_relation", joined_relation.left_relation)
+		object.__setattr__(self, "right_relation", joined_relation.right_relation)
 		
-		self.left_model = self.left_relation.entity_model
-		self.right_model = self.right_relation.entity_model
+		object.__setattr__(self, "left_model", self.left_relation.entity_model)
+		object.__setattr__(self, "right_model", self.right_relation.entity_model)
 		
-		self.left_entity = self.left_relation.new_blank_entity()
-		self.right_entity = self.right_relation.new_blank_entity()
+		object.__setattr__(self, "left_entity", left_entity if left_entity is not None else self.left_relation.new_blank_entity())
+		object.__setattr__(self, "right_entity", right_entity if right_entity is not None else self.right_relation.new_blank_entity())
+		
+		# The entities of each table in the join, indexed by JoinedRelationManager.get_accessor_map().
+		object.__setattr__(self, "leaf_entities", self.get_leaves_of(self.left_entity) + self.get_leaves_of(self.right_entity))
+	
+	@staticmethod
+	def get_leaves_of(entity):
+		if isinstance(entity, JoinedEntityModel):
+			return entity.leaf_entities
+		
+		return [entity]
 	
 	def get_left_relation_mgr(self):
 		return self.left_entity.get_relation_mgr()
@@ -37,7 +49,7 @@ class JoinedEntityModel(EntityModel):
 		res = {}
 		
 		left_dict = self.left_entity.to_dict()
-		if type(self.left_relation) is JoinedEntityModel:
+		if isinstance(self.left_entity, JoinedEntityModel):
 			for table in left_dict:
 				res[table] = left_dict[table]
 			
@@ -46,7 +58,7 @@ class JoinedEntityModel(EntityModel):
 			res[table] = left_dict
 		
 		right_dict = self.right_entity.to_dict()
-		if type(self.right_relation) is JoinedEntityModel:
+		if isinstance(self.right_entity, JoinedEntityModel):
 			for table in right_dict:
 				res[table] = right_dict[table]
 			
@@ -56,6 +68,13 @@ class JoinedEntityModel(EntityModel):
 		
 		return res
 	
+	# Cleans the constituent entities, which can be written through their own relations.
+	def mark_clean(self):
+		super().mark_clean()
+		
+		self.left_entity.mark_clean()
+		self.right_entity.mark_clean()
+	
 	def put(self, obj):
 		raise RuntimeError("Cannot 'put' JoinedEntityModel.")
 	
@@ -64,48 +83,52 @@ class JoinedEntityModel(EntityModel):
 	
 	#### Column & Table Retrieval, Modification ####
 	
-	# Get or set the value of the specified column.
-	# Optionally, a table_name_or_alias can be provided for disambiguation.
-	# Note that self_alias is not used. It must be included to match the signature of RelationManager.get_value_or_none()
-	def value_accessor(self, column, self_alias, am_setting, new_value, depth):
-		#print("joined value_accessor", column, self_alias, am_setting, new_value, depth)
-		self.get_relation_mgr().entity_log.debug("  "*depth + f"{column}{f" := {new_value}"}")
-		
-		if depth >= 128:
-			raise RuntimeError("JOIN depth limit exceeded.")
-		
-		if not am_setting and new_value is not None:
-			raise valueError("new_value must be None if am_setting is False.")
-		
-		# Retrieve results of value_accessor from sub-relations.
-		left_result, right_result = (None, None)
-		left_result_exists, right_result_exists = (True, True)
-		
-		try:
-			left_result = self.left_entity.value_accessor(column, self.get_left_alias(), am_setting, new_value, depth+1)
-		except (ColumnRetrievalError):
-			left_result_exists = False
+	# Finds the leaf entity holding a column and the column's name on it, from a ColumnIdentifier or string.
+	# Throws ColumnRetrievalError if no table has the column, and ValueError if more than one does.
+	def resolve_column(self, column):
+		if type(column) is str:
+			name = column
+		elif column.qualifier is None:
+			name = column.name
+		else:
+			name = f"{column.qualifier}.{column.name}"
 		
-		try:
-			right_result = self.right_entity.value_accessor(column, self.get_right_alias(), am_setting, new_value, depth+1)
-		except (ColumnRetrievalError):
-			right_result_exists = False
+		accessor_map = self.get_relation_mgr().get_accessor_map()
 		
-		self.get_relation_mgr().entity_log.debug(f"Got {left_result} ({"exists" if left_result_exists else "not exists"}) else {right_result} ({"exists" if right_result_exists else "not exists"})")
+		resolved = accessor_map.get(name)
+		if resolved is None:
+			resolved = accessor_map.get(name.lower())
+			
+			if resolved is None:
+				raise ColumnRetrievalError(f"Column name '{column}' does not exist.")
 		
-		# Check for multiple results (ambiguity)
-		if left_result_exists and right_result_exists:
+		leaf_index, column_name = resolved
+		if leaf_index is None:
 			raise ValueError(f"Column name '{column}' is ambiguous.")
 		
-		if right_result_exists:
-			return right_result
-		
-		elif left_result_exists:
-			return left_result
+		return self.leaf_entities[leaf_index], column_name
+	
+	# Override. Optionally, a qualifier with the table name or alias can be provided for disambiguation.
+	def get_value(self, column, self_alias=None):
+		leaf_entity, column_name = self.resolve_column(column)
+		return object.__getattribute__(leaf_entity, column_name)
+	
+	# Override.
+	def set_value(self, column, new_value=None, self_alias=None):
+		leaf_entity, column_name = self.resolve_column(column)
+		object.__setattr__(leaf_entity, column_name, new_value)
+		leaf_entity.mark_dirty(column_name)
+	
+	# Get or set the value of the specified column.
+	# Note that self_alias is not used, since a JoinedEntityModel cannot be aliased. It must be included to match the signature of EntityModel.value_accessor()
+	def value_accessor(self, column, self_alias, am_setting, new_value, depth):
+		if not am_setting and new_value is not None:
+			raise ValueError("new_value must be None if am_setting is False.")
 		
+		if am_setting:
+			self.set_value(column, new_value)
 		else:
-			self.get_relation_mgr().entity_log.debug(self.left_entity.__dict__)
-			raise ColumnRetrievalError(f"Column name '{column}' does not exist.")
+			return self.get_value(column)
 	
 	# Gets leaf node - aka EntityModel - on the table
 	def get_child_entity_model_or_none(self, table_name_or_alias, self_alias=None, depth=0):
@@ -117,7 +140,6 @@ class JoinedEntityModel(EntityModel):
 		
 		left_result = self.left_entity.get_child_entity_model_or_none(table_name_or_alias, self.get_left_alias(), depth+1)
 		right_result = self.right_entity.get_child_entity_model_or_none(table_name_or_alias, self.get_right_alias(), depth+1)
-		self.get_relation_mgr().entity_log.debug(f"Got {left_result} / {right_result}")
 		
 		# Check for multiple results (ambiguity)
 		if left_result is not None and right_result is not None:
@@ -12,6 +12,9 @@ from .JoinedEntityModel import JoinedEntityModel
 # Exposes CRUD operations on a joined table.
 # The only supported join condition is equality between a column from each table.
 class JoinedRelationManager(RelationManager):
+	# Entry of the accessor map for names which match columns on more than one table.
+	ambiguous_column = (None, None)
+	
 	# The alias parameters allow disambigution of column names passed as the keys on this JoinedRelationManager or any that includes this one as a component, directly or indirectly.
 	# These aliases appear in the generated SQL exactly as one would expect.
 	def __init__(self, left_relation, right_relation, left_key, right_key, join_type=RelationManager.JoinType.INNER, left_alias=None, right_alias=None):
@@ -35,8 +38,6 @@ class JoinedRelationManager(RelationManager):
 		
 		if left_relation.entity_mgr is not right_relation.entity_mgr:
 			raise ValueError("The constituent tables must be managed by the same EntityManager.")
-			
-		left_relation.entity_log.debug(f"JoinedRelationManager {left_relation} {right_relation} {left_key} {right_key} {join_type} {left_alias} {right_alias}")
 		
 		# TODO: Is it okay that the tables on the relations are not checked?
 		
@@ -73,6 +74,11 @@ class JoinedRelationManager(RelationManager):
 	def initialize_columns(self):
 		pass
 	
+	# Override. Drops the compiled statements. The constituent relations refresh themselves.
+	def refresh_columns(self):
+		self.statement_cache_generation = self.entity_mgr.db_mgr.schema_generation
+		self.statement_cache = {}
+	
 	# List all tables descending from this join.
 	def get_all_table_names(self, depth=0):
 		if depth >= 128:
@@ -83,6 +89,46 @@ class JoinedRelationManager(RelationManager):
 	def get_columns(self):
 		return self.left_relation.get_columns() + self.right_relation.get_columns()
 	
+	# Lists (relation, alias) for each table in this join, from left to right. JoinedEntityModel.leaf_entities follows the same order.
+	def get_leaf_relations(self, depth=0):
+		if depth >= 128:
+			raise RuntimeError("JOIN depth limit exceeded.")
+		
+		res = []
+		for relation, alias in ((self.left_relation, self.left_alias), (self.right_relation, self.right_alias)):
+			if isinstance(relation, JoinedRelationManager):
+				res += relation.get_leaf_relations(depth+1)
+			else:
+				res.append((relation, alias))
+		
+		return res
+	
+	# Maps each name a column can be accessed by on a JoinedEntityModel to the index of its leaf entity and the column's name.
+	# Names are bare or qualified with the table name or alias, both as written in the schema and in lowercase.
+	# Names matching columns on more than one table map to ambiguous_column.
+	def get_accessor_map(self):
+		return self.cached(("accessors",), self.compile_accessor_map)
+	
+	def compile_accessor_map(self):
+		accessor_map = {}
+		for leaf_index, (relation, alias) in enumerate(self.get_leaf_relations()):
+			qualifiers = [relation.get_table_name()]
+			if alias is not None:
+				qualifiers.append(alias)
+			
+			for column_name in relation.get_column_names():
+				names = {column_name}
+				for qualifier in qualifiers:
+					names.add(f"{qualifier}.{column_name}")
+				
+				for name in names | {name.lower() for name in names}:
+					if name in accessor_map and accessor_map[name][0] != leaf_index:
+						accessor_map[name] = JoinedRelationManager.ambiguous_column
+					else:
+						accessor_map[name] = (leaf_index, column_name)
+		
+		return accessor_map
+	
 	# Returns all the columns of the descendant tables with appropriate qualifications.
 	def get_column_identifiers(self):
 		left_columns = self.left_relation.get_column_identifiers()
@@ -102,6 +148,9 @@ class JoinedRelationManager(RelationManager):
 	# Returns a SQL expression which corresponds to the relation managed by this JoinedRelationManager.
 	# For the base class, this is just the name of the manged table.
 	def get_validated_relation_expression(self):
+		return self.cached(("relation",), self.compile_relation_expression)
+	
+	def compile_relation_expression(self):
 		left_relation_expression = self.left_relation.get_validated_relation_expression()
 		right_relation_expression = self.right_relation.get_validated_relation_expression()
 		
@@ -115,16 +164,63 @@ class JoinedRelationManager(RelationManager):
 		
 		return f"{left_relation_expression} {join_expression} {right_relation_expression} ON {self.left_key} = {self.right_key}"
 	
+	# Override. Entries are (index, leaf index, column name), so that each value is assigned straight onto its table's entity.
+	def compile_hydration_plan(self):
+		accessor_map = self.get_accessor_map()
+		return tuple((index, *accessor_map[f"{column.qualifier}.{column.name}"]) for index, column in enumerate(self.get_compiled_column_identifiers()))
+	
+	# Override.
+	def hydrate_entity(self, entity_data, hydration_plan):
+		entity = self.new_entity_shell()
+		
+		leaf_entities = entity.leaf_entities
+		for index, leaf_index, column_name in hydration_plan:
+			object.__setattr__(leaf_entities[leaf_index], column_name, entity_data[index])
+		
+		entity.mark_clean()
+		return entity
+	
 	def get_table_name(self):
 		raise RuntimeError("No table name on JoinedRelationManager.")
+	
+	# Joins are recorded under the names of their tables, e.g. "users+projects".
+	def get_metrics_label(self):
+		return self.cached(("metrics_label",), lambda: "+".join(self.get_all_table_names()))
 
+	# Override.
+	def get_index_target(self, column_name):
+		return self.cached(("index_target", column_name), lambda: self.compile_index_target(column_name))
+	
+	def compile_index_target(self, column_name):
+		accessor_map = self.get_accessor_map()
+		
+		resolved = accessor_map.get(column_name)
+		if resolved is None:
+			resolved = accessor_map[column_name.lower()]
+		
+		leaf_index, column_name = resolved
+		return self.get_leaf_relations()[leaf_index][0].get_index_target(column_name)
+	
+	# Override.
+	def get_join_targets(self):
+		return self.cached(("join_targets",), self.compile_join_targets)
+	
+	def compile_join_targets(self):
+		res = list(self.left_relation.get_join_targets()) + list(self.right_relation.get_join_targets())
+		
+		for relation, key in ((self.left_relation, self.left_key), (self.right_relation, self.right_key)):
+			if isinstance(relation, JoinedRelationManager):
+				res.append(relation.get_index_target(f"{key.qualifier}.{key.name}"))
+			else:
+				res.append(relation.get_index_target(key.name))
+		
+		return tuple(res)
+	
 	# Checks that a column exists on this table. Throws if it doesn't, or if it is ambiguous.
 	# Accepts an alias from a parent JoinedRelationManager.
 	# When called from such a parent, the column_name will have already been split into a table identifier / column identifier pair.
 	# This is the case when depth is positive.
 	def get_validated_column_identifier(self, column, self_alias=None, depth=0):
-		self.entity_log.debug(f"joined get_validated_column_identifier {column} {self_alias} {depth}")
-		
 		if self_alias is not None:
 			raise ValueError("Cannot alias a JoinedRelationManaager.")
 		
@@ -171,5 +267,16 @@ class JoinedRelationManager(RelationManager):
 		
 		return entity
 	
+	# Override. Joins shells of the constituent entities.
+	def new_entity_shell(self):
+		return self.entity_model(self, self.left_relation.new_entity_shell(), self.right_relation.new_entity_shell())
+	
 	def new_bound_entity(self):
-		raise NotImplementedError()
\ No newline at end of file
+		raise NotImplementedError()
+	
+	# Writes go through the constituent tables' relations.
+	def update_where(self, column_name, matching_value, **assignments):
+		raise RuntimeError("Cannot update_where on JoinedRelationManager.")
+	
+	def delete_where(self, column_name, matching_value):
+		raise RuntimeError("Cannot delete_where on JoinedRelationManager.")
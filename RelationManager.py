@@ -1,9 +1,14 @@
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, UTC
 from enum import Enum
+import itertools
 import sqlite3
+import zlib
 
+from .ColumnBuffer import ColumnBuffer
 from .ColumnIdentifier import ColumnIdentifier, ColumnRetrievalError, ReadResultError
-from .EntityModel import EntityModel
+from .EntityModel import EntityModel, LazyColumn
+from .StatementMetrics import OperationTimer, null_operation_timer
 
 # Exposes CRUD operations on a single table in the database.
 # Automatically manages the created_on, updated_on, and id columns if they exist.
@@ -15,8 +20,22 @@ class RelationManager:
 		LEFT = 3
 		RIGHT = 4
 	
+	# Upper bound on the rows packed into one multi-row INSERT by create_many(), on top of SQLite's host parameter limit.
+	max_rows_per_insert = 1000
+	
+	# Lists of values to match which are longer than this are loaded into a temporary table rather than bound inline.
+	max_inline_values = 256
+	
+	# Number of rows fetched at a time by iter_by_column() and scan().
+	default_batch_size = 500
+	
+	# Distinguishes the value lists loaded into the temporary table by concurrent queries.
+	match_value_batches = itertools.count()
+	
 	# TODO: Validate table exists
-	def __init__(self, entity_mgr, entity_log, table_name, entity_model):
+	# With slotted, entities are instances of a subclass of entity_model generated from the table's columns, storing each column in a slot rather than a __dict__.
+	# With lazy, read entities keep the row they were read from, and copy and convert values out of it only when accessed. They copy all of their values on first write.
+	def __init__(self, entity_mgr, entity_log, table_name, entity_model, slotted=False, lazy=False):
 		self.entity_mgr = entity_mgr
 		self.entity_log = entity_log
 		
@@ -25,12 +44,25 @@ class RelationManager:
 			
 		self.table_name = table_name
 		self.entity_model = entity_model
+		self.slotted = slotted
+		self.lazy = lazy
+		
+		if slotted and lazy:
+			raise ValueError("Entities cannot be both slotted and lazy.")
+		
+		# SQL and column metadata compiled from the columns, valid for one schema generation of the DatabaseManager.
+		self.statement_cache = {}
+		self.statement_cache_generation = self.entity_mgr.db_mgr.schema_generation
 		
 		self.columns = None
 		self.initialize_columns()
 		
 		# All managed tables must have a column 'id' which is the primary key.
 		self.validate_pk_id_exists()
+		
+		# Reject models which cannot be slotted now rather than on the first read.
+		if self.slotted or self.lazy:
+			self.get_entity_class()
 	
 	#### Internal Methods & Utilities ####
 	
@@ -60,6 +92,7 @@ class RelationManager:
 		return [self.get_table_name()]
 	
 	def get_columns(self):
+		self.get_statement_cache() # Re-reads the columns if the schema changed.
 		return self.columns
 	
 	# Returns a SQL expression which corresponds to the relation managed by this RelationManager.
@@ -86,6 +119,9 @@ class RelationManager:
 	# Mostly included for its semantic similarity to get_column_names_to_create
 	# Returns the names of all columns on the table using this EntityManager.
 	def get_column_names(self, do_lower=True):
+		return list(self.cached(("column_names", do_lower), lambda: self.compile_column_names(do_lower)))
+	
+	def compile_column_names(self, do_lower):
 		res = []
 		for column in self.get_columns():
 			res.append(column.name)
@@ -93,7 +129,11 @@ class RelationManager:
 			if do_lower:
 				res[-1] = res[-1].lower()
 		
-		return res
+		return tuple(res)
+	
+	# The lowercase column names as a set, for membership checks.
+	def get_column_name_set(self):
+		return self.cached(("column_name_set",), lambda: frozenset(self.get_column_names()))
 	
 	# Returns a ColumnIdentifier for every column onm the managed table
 	# The qualifier
@@ -107,6 +147,10 @@ class RelationManager:
 		
 		return res
 	
+	# Like get_column_identifiers(), but compiled once. The returned ColumnIdentifiers are shared and must not be modified.
+	def get_compiled_column_identifiers(self):
+		return self.cached(("column_identifiers",), lambda: tuple(self.get_column_identifiers()))
+	
 	# Retrieves the underlying values of a list of attributes on an object.
 	# Used in the construction of arbitrary INSERT statements.
 	def get_values_of_columns(self, entity, column_names):
@@ -115,14 +159,23 @@ class RelationManager:
 			res.append(getattr(entity, column_name))
 		
 		return res
+	
+	# Sets updated_on, and created_on if creating, to now on entity, for whichever of them the table has.
+	# Slotted entities have no slot for columns which do not exist.
+	def set_timestamps(self, entity, now, creating=False):
+		column_name_set = self.get_column_name_set()
+		
+		if creating and "created_on" in column_name_set:
+			entity.created_on = now
+		
+		if "updated_on" in column_name_set:
+			entity.updated_on = now
 
 	# Checks that a column exists on this table. Throws if it doesn't
 	# Accepts an alias from a parent JoinedRelationManager.
 	# When called from such a parent, the column_name will have already been split into a table identifier / column identifier pair.
 	# This is the case when depth is positive.
 	def get_validated_column_identifier(self, column, self_alias=None, depth=0):
-		self.entity_log.debug(f"get_validated_column_identifier {column} {self_alias} {depth}")
-		
 		# Check SQL values for invalid characters.
 		if depth == 0:
 			if type(column) is not ColumnIdentifier:
@@ -146,7 +199,7 @@ class RelationManager:
 			else:
 				qualifier_is_valid = column.qualifier.lower() == managed_table_name.lower()
 		
-		name_is_valid = column.name in self.get_column_names()
+		name_is_valid = column.name in self.get_column_name_set()
 		
 		# Validate table name and that column exists.
 		if qualifier_is_valid and name_is_valid:
@@ -155,18 +208,291 @@ class RelationManager:
 		else:
 			raise ColumnRetrievalError(f"Column name '{column}' does not exist.")
 	
+	#### Statement Cache ####
+	
+	# Returns this relation's cache of compiled SQL and column metadata.
+	# If the DatabaseManager has reported a schema change since the cache was filled, the columns are re-read and the cache is emptied first.
+	def get_statement_cache(self):
+		if self.statement_cache_generation != self.entity_mgr.db_mgr.schema_generation:
+			self.refresh_columns()
+		
+		return self.statement_cache
+	
+	# Returns the cached value for key, calling compile() to produce it on a miss.
+	def cached(self, key, compile):
+		statement_cache = self.get_statement_cache()
+		
+		value = statement_cache.get(key)
+		if value is None:
+			value = compile()
+			statement_cache[key] = value
+		
+		return value
+	
+	# Re-reads the columns of the managed table and drops everything compiled from them.
+	def refresh_columns(self):
+		self.statement_cache_generation = self.entity_mgr.db_mgr.schema_generation
+		self.statement_cache = {}
+		
+		self.columns = None
+		self.initialize_columns()
+		self.validate_pk_id_exists()
+		
+		# Cached entities lack any new columns.
+		if self.get_identity_map() is not None:
+			self.get_identity_map().clear(self.table_name)
+	
+	# Returns the repr() of the validated ColumnIdentifier for column_name, which is how the column is referred to in SQL.
+	def get_validated_column_reference(self, column_name):
+		return self.cached(("column_reference", column_name), lambda: repr(self.get_validated_column_identifier(ColumnIdentifier(column_name))))
+	
+	# SELECT ... FROM ... for every column, each aliased to the repr() of its ColumnIdentifier. Conditions are appended by the caller.
+	def get_select_statement(self):
+		return self.cached(("select",), self.compile_select_statement)
+	
+	def compile_select_statement(self):
+		column_expressions = []
+		for column_info, column in zip(self.get_columns(), self.get_compiled_column_identifiers()):
+			# Casting drops the declared type, so that lazy entities convert values on access rather than sqlite3 converting every value on fetch.
+			if self.lazy and self.entity_mgr.db_mgr.get_converter(column_info.type) is not None:
+				column_expressions.append(f"CAST({repr(column)} AS BLOB) AS [{repr(column)}]")
+			else:
+				column_expressions.append(f"{repr(column)} AS [{repr(column)}]")
+		
+		return f"SELECT {",".join(column_expressions)} FROM {self.get_validated_relation_expression()}"
+	
+	# Pairs the index of each column selected by get_select_statement() with where hydrate_entity() puts its value.
+	def get_hydration_plan(self):
+		return self.cached(("hydration_plan",), self.compile_hydration_plan)
+	
+	# Overriden by JoinedRelationManager
+	def compile_hydration_plan(self):
+		return tuple(enumerate(self.get_column_names()))
+	
+	def get_insert_statement(self, columns_to_create, row_count=1, return_ids=False):
+		return self.cached(("insert", columns_to_create, row_count, return_ids), lambda: self.compile_insert_statement(columns_to_create, row_count, return_ids))
+	
+	# A multi-row INSERT of row_count rows which returns the new ids when return_ids is set.
+	def compile_insert_statement(self, columns_to_create, row_count, return_ids=False):
+		self.entity_mgr.db_mgr.validate_sql_identifiers(columns_to_create)
+		
+		relation_expression = self.get_validated_relation_expression()
+		if len(columns_to_create) == 0:
+			return f"INSERT INTO {relation_expression} DEFAULT VALUES"
+		
+		row_placeholder = f"({",".join("?"*len(columns_to_create))})"
+		query_str = f"INSERT INTO {relation_expression} ({",".join(columns_to_create)}) VALUES {",".join([row_placeholder]*row_count)}"
+		
+		if return_ids:
+			query_str += " RETURNING id"
+		
+		return query_str
+	
+	# Every column except id, in the order update() writes them.
+	def get_columns_to_update(self):
+		return self.cached(("columns_to_update",), lambda: tuple(column_name for column_name in self.get_column_names() if column_name != "id"))
+	
+	# The columns of entity which were assigned since it was last read or written, in the order update() writes them.
+	def get_dirty_columns_to_update(self, entity):
+		dirty_columns = entity.get_dirty_columns()
+		return tuple(column_name for column_name in self.get_columns_to_update() if column_name in dirty_columns)
+	
+	def get_update_statement(self, columns_to_update):
+		return self.cached(("update", columns_to_update), lambda: self.compile_update_statement(columns_to_update))
+	
+	def compile_update_statement(self, columns_to_update):
+		self.entity_mgr.db_mgr.validate_sql_identifiers(columns_to_update)
+		return f"UPDATE {self.get_validated_relation_expression()} SET {",".join(map(lambda v : v + "=?", columns_to_update))} WHERE id = ?"
+	
+	#### Identity Map ####
+	
+	# Returns the EntityManager's identity map, or None if it is disabled. Joined relations are never cached.
+	def get_identity_map(self):
+		if self.table_name is None:
+			return None
+		
+		return self.entity_mgr.identity_map
+	
+	# Keeps the identity map coherent after entity was written. With successful set, an entity which is itself the cached instance stays cached.
+	# Any other cached entity for the same id is dropped, since its columns may no longer match the row.
+	# Inside a transaction, the write is not yet visible to other threads, so even the cached instance is dropped, and cached again once the transaction commits.
+	def invalidate_cached_entity(self, entity, successful=False):
+		identity_map = self.get_identity_map()
+		if identity_map is None or entity.id is None:
+			return
+		
+		transaction = self.entity_mgr.current_transaction()
+		if successful and transaction is not None:
+			if identity_map.holds(self.table_name, entity):
+				transaction.record_cacheable(self, entity)
+			
+			identity_map.invalidate(self.table_name, entity.id)
+		
+		elif not successful or not identity_map.holds(self.table_name, entity):
+			identity_map.invalidate(self.table_name, entity.id)
+	
+	# Yields a SQL condition matching the named column against matching_value, along with its parameters, for use on conn.
+	# A list, tuple or set matches any of the values it contains.
+	# Up to max_inline_values are bound inline with IN (...). Longer lists are loaded into a temporary table and matched with a semi-join,
+	# which keeps clear of SQLite's host parameter limit and lets every such query share one plan.
+	@contextmanager
+	def validated_condition(self, conn, column_name, matching_value):
+		column = self.get_validated_column_reference(column_name) # TODO get alias here!!!!
+		
+		if not isinstance(matching_value, (list, tuple, set, frozenset)):
+			yield f"{column} = ?", [matching_value]
+		
+		elif len(matching_value) == 0:
+			yield "0", [] # Empty IN lists match nothing.
+		
+		elif len(matching_value) <= self.max_inline_values:
+			yield f"{column} IN ({",".join("?"*len(matching_value))})", list(matching_value)
+		
+		else:
+			self.prepare_match_values_table(conn)
+			
+			batch = next(RelationManager.match_value_batches)
+			conn.executemany("INSERT INTO temp.entity_match_values (batch, value) VALUES (?, ?)", ((batch, value) for value in matching_value))
+			
+			try:
+				yield f"{column} IN (SELECT value FROM temp.entity_match_values WHERE batch = ?)", [batch]
+			
+			finally:
+				conn.execute("DELETE FROM temp.entity_match_values WHERE batch = ?", (batch,))
+	
+	# Creates the temporary table used by validated_condition() for long lists, once per connection.
+	# Outside of a transaction the table is committed right away, so that it outlives this borrow of the connection.
+	def prepare_match_values_table(self, conn):
+		if conn.has_match_values_table:
+			return
+		
+		conn.execute("CREATE TEMP TABLE IF NOT EXISTS entity_match_values (batch INTEGER NOT NULL, value)")
+		conn.execute("CREATE INDEX IF NOT EXISTS temp.entity_match_values_batch ON entity_match_values (batch, value)")
+		
+		if self.entity_mgr.current_transaction() is None:
+			conn.commit()
+			conn.has_match_values_table = True
+	
+	# Yields the connection that an operation should run on.
+	# Inside EntityManager.transaction() this is the transaction's pinned connection, after its queued updates have been flushed.
+	# Committing that connection is left to the transaction.
+	# Otherwise, a connection is borrowed from the pool, read-only if this thread is running an EntityManager.gather() query, and if commit is True, committed afterwards.
+	# The commit is counted towards timer, if given.
+	@contextmanager
+	def connection(self, commit=False, timer=null_operation_timer):
+		transaction = self.entity_mgr.current_transaction()
+		if transaction is not None:
+			transaction.flush()
+			yield transaction.conn
+			return
+		
+		with self.entity_mgr.db_mgr.borrow_connection(self.entity_mgr.is_read_only()) as conn:
+			try:
+				yield conn
+			
+			finally:
+				if commit:
+					start = timer.begin()
+					conn.commit()
+					timer.end_commit(start)
+	
+	# Returns an OperationTimer for one call of the named operation, recording into the EntityManager's metrics, tracer and slow query log, or a timer which does nothing if all are disabled.
+	# activate is passed on to Tracer.span(), and must be False in generators.
+	def timed(self, operation, activate=True):
+		entity_mgr = self.entity_mgr
+		if entity_mgr.metrics is None and entity_mgr.tracer is None and entity_mgr.slow_query_log is None:
+			return null_operation_timer
+		
+		return OperationTimer(entity_mgr.metrics, entity_mgr.tracer, entity_mgr.slow_query_log, self.get_metrics_label(), operation, activate)
+	
+	# The name operations on this relation are recorded under by timed().
+	# Overriden by JoinedRelationManager
+	def get_metrics_label(self):
+		return self.table_name
+	
+	# Builds an entity from a row of get_select_statement(), following the plan from get_hydration_plan().
+	# Overriden by JoinedRelationManager
+	def hydrate_entity(self, entity_data, hydration_plan):
+		entity = self.new_entity_shell()
+		
+		if self.lazy:
+			object.__setattr__(entity, "lazy_row", entity_data)
+		else:
+			for index, column_name in hydration_plan:
+				object.__setattr__(entity, column_name, entity_data[index])
+		
+		entity.mark_clean()
+		return entity
+	
 	# Returns a blank instance of the entity that this manages
 	# Such an entity is inherently suitable for CRUD operations.
 	def new_blank_entity(self):
-		entity = self.entity_model()
+		entity = self.get_entity_class()()
 		entity.set_relation_mgr(self)
 		
-		for column_name in self.get_column_names():
-			if column_name not in entity.__dict__:
-				setattr(entity, column_name, None)
+		if self.slotted:
+			for column_name in self.get_column_names():
+				try:
+					object.__getattribute__(entity, column_name)
+				
+				except AttributeError: # Slot not assigned by the constructor.
+					setattr(entity, column_name, None)
+		
+		else:
+			for column_name in self.get_column_names():
+				if column_name not in entity.__dict__:
+					setattr(entity, column_name, None)
 		
 		return entity
 	
+	# Returns an entity without column values, for hydrate_entity() to fill.
+	# Overriden by JoinedRelationManager
+	def new_entity_shell(self):
+		entity = self.get_entity_class()()
+		entity.set_relation_mgr(self)
+		return entity
+	
+	# The class instantiated by new_blank_entity(), which is entity_model or a subclass of it.
+	def get_entity_class(self):
+		return self.cached(("entity_class",), self.compile_entity_class)
+	
+	def compile_entity_class(self):
+		entity_model = self.entity_model
+		
+		if self.lazy:
+			namespace = {"__module__": entity_model.__module__}
+			
+			lazy_columns = []
+			for index, column in enumerate(self.get_columns()):
+				lazy_column = LazyColumn(column.name.lower(), index, self.entity_mgr.db_mgr.get_converter(column.type))
+				namespace[lazy_column.name] = lazy_column
+				lazy_columns.append(lazy_column)
+			
+			namespace["lazy_columns"] = tuple(lazy_columns)
+			
+			# A subclass without __slots__ has a __dict__ to hold values once they are copied out of the row.
+			return type(entity_model)(entity_model.__name__, (entity_model,), namespace)
+		
+		if not self.slotted:
+			if entity_model.__dictoffset__ != 0:
+				return entity_model
+			
+			# entity_model declares __slots__, so give its unslotted instances somewhere to keep their columns.
+			return type(entity_model)(entity_model.__name__, (entity_model,), {"__module__": entity_model.__module__})
+		
+		if entity_model.__dictoffset__ != 0:
+			raise TypeError(f"'{entity_model.__name__}' and all of its bases must declare __slots__ for slotted entities on '{self.get_table_name()}'.")
+		
+		slots = ["relation_mgr", "dirty_columns"]
+		for column_name in self.get_column_names():
+			if not column_name.isidentifier():
+				raise TypeError(f"Column '{column_name}' on '{self.get_table_name()}' cannot be stored in a slot.")
+			
+			if column_name not in slots:
+				slots.append(column_name)
+		
+		return type(entity_model)(entity_model.__name__, (entity_model,), {"__slots__": tuple(slots), "__module__": entity_model.__module__})
+	
 	# Creates and binds a blank entity.
 	def new_bound_entity(self):
 		entity = self.new_blank_entity()
@@ -185,99 +511,367 @@ class RelationManager:
 		if not isinstance(entity, self.entity_model):
 			raise RuntimeError(f"Cannot insert '{entity}' into '{self.get_validated_relation_expression()}'.")
 		
-		entity.created_on = datetime.now(UTC)
-		entity.updated_on = entity.created_on
+		self.set_timestamps(entity, datetime.now(UTC), creating=True)
+		
+		with self.timed("create") as timer, self.connection(commit=True, timer=timer) as conn:
+			crsr = conn.cursor()
+			
+			try:
+				columns_to_create = tuple(self.get_column_names_to_create(entity))
+				values = self.get_values_of_columns(entity, columns_to_create)
+				
+				query_str = self.get_insert_statement(columns_to_create)
+				
+				start = timer.begin()
+				crsr.execute(query_str, values)
+				crsr.execute("SELECT last_insert_rowid()")
+				timer.end_sql(start, rows=1, sql=query_str, values=values)
+				
+			# TODO: Reference to sqlite3 errors couples us to this database. Offload this to the db manager class.
+			except sqlite3.IntegrityError as e:
+				self.entity_log.info(f"Caught IntegrityError during '{self.get_validated_relation_expression()}' creation: {e}")
+				return None
+			
+			except sqlite3.OperationalError as e:
+				self.entity_log.error(f"Caught OperationalError during '{self.get_validated_relation_expression()}' creation: {e}")
+				return None
+			
+			else:
+				entity.id = crsr.fetchone()[0] # Bind.
+				entity.relation_mgr = self
+				entity.mark_clean()
+				self.invalidate_cached_entity(entity)
+				return entity
+	
+	# Inserts many unbound entities in one transaction.
+	# Entities are grouped by the columns they would be created with, and each group is inserted with as few multi-row INSERT statements as SQLite's host parameter limit allows.
+	# All entities share one created_on / updated_on timestamp.
+	# Returns a list parallel to entities, holding each bound entity or None where it could not be inserted.
+	def create_many(self, entities):
+		entities = list(entities)
+		for entity in entities:
+			if not isinstance(entity, self.entity_model):
+				raise RuntimeError(f"Cannot insert '{entity}' into '{self.get_validated_relation_expression()}'.")
+		
+		now = datetime.now(UTC)
+		
+		groups = {}
+		for i, entity in enumerate(entities):
+			self.set_timestamps(entity, now, creating=True)
+			
+			columns_to_create = tuple(self.get_column_names_to_create(entity))
+			groups.setdefault(columns_to_create, []).append(i)
+		
+		res = [None] * len(entities)
+		with self.timed("create_many") as timer, self.connection(commit=True, timer=timer) as conn:
+			crsr = conn.cursor()
+			max_variables = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+			
+			for columns_to_create, indices in groups.items():
+				rows_per_insert = max(1, min(self.max_rows_per_insert, max_variables // max(1, len(columns_to_create))))
+				
+				for start in range(0, len(indices), rows_per_insert):
+					chunk = indices[start : start + rows_per_insert]
+					chunk_entities = [entities[i] for i in chunk]
+					
+					started = timer.begin()
+					created_entities = self.create_chunk(crsr, columns_to_create, chunk_entities, rows_per_insert)
+					timer.end_sql(started, rows=sum(entity is not None for entity in created_entities), sql=self.get_insert_statement(columns_to_create) if timer.wants_sql() else None)
+					
+					for i, entity in zip(chunk, created_entities):
+						res[i] = entity
+		
+		return res
+	
+	# Inserts entities which share a column set inside a savepoint, binding their ids.
+	# If the batch fails as a whole, it is rolled back and retried row by row so that only the offending rows are lost.
+	# Only statements for full chunks of rows_per_insert rows are cached, since a remainder can be of any length.
+	def create_chunk(self, crsr, columns_to_create, entities, rows_per_insert):
+		relation_expression = self.get_validated_relation_expression()
+		row_values = [self.get_values_of_columns(entity, columns_to_create) for entity in entities]
 		
-		conn = self.entity_mgr.db_mgr.get_connection()
-		crsr = conn.cursor()
+		ids_are_set = [entity.id is not None for entity in entities]
 		
+		crsr.execute("SAVEPOINT create_many")
 		try:
-			columns_to_create = self.get_column_names_to_create(entity)
-			self.entity_mgr.db_mgr.validate_sql_identifiers(columns_to_create)
+			if len(columns_to_create) == 0:
+				raise sqlite3.IntegrityError("No columns to insert.") # Falls back to DEFAULT VALUES per row.
 			
-			values = self.get_values_of_columns(entity, columns_to_create)
+			# Explicit ids need not be read back.
+			if all(ids_are_set):
+				query_str = self.get_insert_statement(columns_to_create)
+				crsr.executemany(query_str, row_values)
 			
-			query_str = f"INSERT INTO {self.get_validated_relation_expression()} ({",".join(columns_to_create)}) VALUES ({",".join("?"*len(values))})"
-			self.entity_log.debug(f"Executing '{query_str}', {values}")
-			crsr.execute(query_str, values)
-			crsr.execute("SELECT last_insert_rowid()")
+			elif not any(ids_are_set):
+				if len(entities) == rows_per_insert:
+					query_str = self.get_insert_statement(columns_to_create, len(entities), return_ids=True)
+				else:
+					query_str = self.compile_insert_statement(columns_to_create, len(entities), return_ids=True)
+				
+				crsr.execute(query_str, [value for values in row_values for value in values])
+				
+				# RETURNING rows come back in no particular order.
+				# Rowids are handed out in ascending order within one statement, so sorting them restores the order of the VALUES.
+				new_ids = sorted(row[0] for row in crsr.fetchall())
+				if len(new_ids) != len(entities):
+					raise RuntimeError(f"Expected {len(entities)} ids from bulk insert, got {len(new_ids)}.")
+				
+				for entity, new_id in zip(entities, new_ids):
+					entity.id = new_id # Bind.
 			
-		# TODO: Reference to sqlite3 errors couples us to this database. Offload this to the db manager class.
+			else:
+				raise sqlite3.IntegrityError("Mix of set and unset ids.") # Falls back to binding ids row by row.
+		
 		except sqlite3.IntegrityError as e:
-			self.entity_log.info(f"Caught IntegrityError during '{self.get_validated_relation_expression()}' creation: {e}")
-			return None
+			self.entity_log.info(f"Bulk insert into '{relation_expression}' failed, retrying row by row: {e}")
+			crsr.execute("ROLLBACK TO create_many")
+			
+			res = []
+			for entity, values in zip(entities, row_values):
+				res.append(self.create_row(crsr, columns_to_create, entity, values))
+			
+			return res
 		
 		except sqlite3.OperationalError as e:
-			self.entity_log.error(f"Caught OperationalError during '{self.get_validated_relation_expression()}' creation: {e}")
-			return None
+			self.entity_log.error(f"Caught OperationalError during '{relation_expression}' bulk creation: {e}")
+			crsr.execute("ROLLBACK TO create_many")
+			return [None] * len(entities)
 		
-		else:
-			entity.id = crsr.fetchone()[0] # Bind.
+		finally:
+			crsr.execute("RELEASE create_many")
+		
+		for entity in entities:
 			entity.relation_mgr = self
-			
-			self.entity_log.debug(f"Got ID {str(entity.id)}, Returning")
-			return entity
+			entity.mark_clean()
+			self.invalidate_cached_entity(entity)
 		
-		finally:
-			conn.commit()
-			conn.close()
+		return entities
+	
+	# Inserts a single row with an already-built column set. Used by create_many() after a failed batch.
+	def create_row(self, crsr, columns_to_create, entity, values):
+		relation_expression = self.get_validated_relation_expression()
+		query_str = self.get_insert_statement(columns_to_create)
+		
+		try:
+			crsr.execute(query_str, values)
+		
+		except sqlite3.IntegrityError as e:
+			self.entity_log.info(f"Caught IntegrityError during '{relation_expression}' creation: {e}")
+			return None
+		
+		except sqlite3.OperationalError as e:
+			self.entity_log.error(f"Caught OperationalError during '{relation_expression}' creation: {e}")
+			return None
+		
+		entity.id = crsr.lastrowid # Bind.
+		entity.relation_mgr = self
+		entity.mark_clean()
+		self.invalidate_cached_entity(entity)
+		return entity
 	
 	def read(self, id):
 		if id is None or type(id) is not int:
 			raise ValueError(f"Invalid id '{id}' of type '{type(id)}'")
 		
-		columns_to_select = ",".join(map(lambda col : f"{repr(col)} AS [{repr(col)}]", self.get_column_identifiers()))
+		# Inside a transaction, reads may see its uncommitted writes, which other threads must not be handed, and the cache may be older than them.
+		identity_map = self.get_identity_map()
+		if identity_map is not None and self.entity_mgr.current_transaction() is not None:
+			identity_map = None
 		
-		conn = self.entity_mgr.db_mgr.get_connection()
-		crsr = conn.cursor()
+		if identity_map is not None:
+			entity = identity_map.get(self.table_name, id)
+			if entity is not None:
+				return entity
 		
-		entity_data = None
-		try:
-			query_str = f"SELECT {columns_to_select} FROM {self.get_validated_relation_expression()} WHERE id = ?"
-			self.entity_log.debug(f"Executing '{query_str}' [{id}]")
+		with self.timed("read") as timer:
+			with self.connection() as conn:
+				crsr = conn.cursor()
+				
+				query_str = self.cached(("read",), lambda: f"{self.get_select_statement()} WHERE id = ?")
+				
+				start = timer.begin()
+				crsr.execute(query_str, (id,))
+				entity_data = crsr.fetchone()
+				timer.end_sql(start, rows=int(entity_data is not None), sql=query_str, values=(id,))
 			
-			crsr.execute(query_str, (id,))
-			entity_data = crsr.fetchone()
+			if entity_data is None:
+				return None
+			
+			start = timer.begin()
+			entity = self.hydrate_entity(entity_data, self.get_hydration_plan())
+			timer.end_hydrate(start, 1)
 		
-		finally:
-			conn.close()
+		if identity_map is not None:
+			identity_map.put(self.table_name, entity)
 		
-		if entity_data is None:
-			return None
+		return entity
+	
+	# Reads the entities whose column_name holds each of the passed keys, ids by default.
+	# Keys are looked up with WHERE ... IN (...) queries, chunked to fit SQLite's host parameter limit.
+	# Returns a list parallel to keys, holding None where no row matched.
+	# Throws an error if one key matches multiple rows, which can happen on joined relations.
+	def read_many(self, keys, column_name="id"):
+		keys = list(keys)
 		
-		else:
-			entity = self.new_blank_entity()
-			for column in self.get_column_identifiers():
-				entity.set_value(column, entity_data[repr(column)])
+		key_column = self.get_validated_column_reference(column_name)
+		hydration_plan = self.get_hydration_plan()
+		
+		unique_keys = list(dict.fromkeys(key for key in keys if key is not None))
+		
+		found = {}
+		self.observe_query(column_name)
+		
+		with self.timed("read_many") as timer, self.connection() as conn:
+			crsr = conn.cursor()
+			chunk_size = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+			
+			for start in range(0, len(unique_keys), chunk_size):
+				chunk = unique_keys[start : start + chunk_size]
 				
-			return entity
+				query_str = f"{self.get_select_statement()} WHERE {key_column} IN ({",".join("?"*len(chunk))})"
+				
+				started = timer.begin()
+				crsr.execute(query_str, chunk)
+				rows = crsr.fetchall()
+				timer.end_sql(started, rows=len(rows), sql=query_str, values=chunk)
+				
+				started = timer.begin()
+				for entity_data in rows:
+					entity = self.hydrate_entity(entity_data, hydration_plan)
+					
+					# Lazy rows hold keys unconverted.
+					key = entity.get_value(column_name) if self.lazy else entity_data[key_column]
+					if key in found:
+						raise ReadResultError(f"Expected at most one result for '{key_column}' = {key}.")
+					
+					found[key] = entity
+				
+				timer.end_hydrate(started, len(rows))
+		
+		return [found.get(key) for key in keys]
 	
 	# Returns a list of entities containing the passed matching value in the identified column.
+	# If matching_value is a list, tuple or set, entities matching any of its values are returned.
 	def read_by_column(self, column_name, matching_value):
-		column = self.get_validated_column_identifier(ColumnIdentifier(column_name)) # TODO get alias here!!!!
+		return list(self.iter_by_column(column_name, matching_value))
+	
+	# Lazily yields the entities that read_by_column() would return, fetching batch_size rows at a time.
+	# The connection is held until the iterator is exhausted or closed. Close iterators which are abandoned early, e.g. with contextlib.closing().
+	def iter_by_column(self, column_name, matching_value, batch_size=None):
+		self.get_validated_column_reference(column_name) # Fail now rather than on the first next().
+		return self.iter_selected(column_name, matching_value, batch_size)
+	
+	# Lazily yields an entity for every row of the relation, fetching batch_size rows at a time.
+	# Holds its connection in the same way as iter_by_column().
+	def scan(self, batch_size=None):
+		return self.iter_selected(None, None, batch_size)
+	
+	# Generator behind iter_by_column() and scan(). A column_name of None selects every row.
+	# Each batch of rows is hydrated before any of its entities are yielded, so that time spent by the caller between entities is not counted as hydration.
+	def iter_selected(self, column_name, matching_value, batch_size):
+		if batch_size is None:
+			batch_size = self.default_batch_size
 		
-		columns_to_select = ",".join(map(lambda col : f"{repr(col)} AS [{repr(col)}]", self.get_column_identifiers()))
+		if type(batch_size) is not int or batch_size < 1:
+			raise ValueError(f"batch_size must be a positive int, not '{batch_size}'.")
 		
-		conn = self.entity_mgr.db_mgr.get_connection()
-		crsr = conn.cursor()
+		hydration_plan = self.get_hydration_plan()
 		
-		res = []
-		try:
-			query_str = f"SELECT {columns_to_select} FROM {self.get_validated_relation_expression()} WHERE {repr(column)} = ?"
-			self.entity_log.debug(f"Executing '{query_str}', {(matching_value,)}")
-			
-			crsr.execute(query_str, (matching_value,))
+		self.observe_query(column_name)
+		
+		with self.timed("scan" if column_name is None else "read_by_column", activate=False) as timer, self.connection() as conn:
+			if column_name is None:
+				condition_context = nullcontext(("1", []))
+			else:
+				condition_context = self.validated_condition(conn, column_name, matching_value)
 			
-			for entity_data in crsr:
-				self.entity_log.debug(str(dict(entity_data)))
-				entity = self.new_blank_entity()
-				for column in self.get_column_identifiers():
-					entity.set_value(column, entity_data[repr(column)])
+			with condition_context as (condition, condition_values):
+				crsr = conn.cursor()
+				
+				query_str = f"{self.get_select_statement()} WHERE {condition}"
 				
-				res.append(entity)
+				start = timer.begin()
+				crsr.execute(query_str, condition_values)
+				timer.end_sql(start, sql=query_str, values=condition_values)
+				
+				while True:
+					start = timer.begin()
+					rows = crsr.fetchmany(batch_size)
+					timer.end_fetch(start, len(rows))
+					
+					if len(rows) == 0:
+						break
+					
+					start = timer.begin()
+					entities = [self.hydrate_entity(entity_data, hydration_plan) for entity_data in rows]
+					timer.end_hydrate(start, len(entities))
+					
+					yield from entities
+	
+	# Reads whole columns without building entities, for aggregation.
+	# Returns a dict from the qualified name of each column, as in get_column_identifiers(), to a NumPy array of its values.
+	# Timestamps become datetime64 in UTC, and NULLs in numeric columns become NaN, which makes an integer column float.
+	# Without NumPy, columns are array.arrays, with timestamps as POSIX seconds, and lists for columns of other values.
+	# column_names selects columns, all by default. column_name and matching_value filter rows as with read_by_column(), and every row is read if column_name is None.
+	def read_columns(self, column_names=None, column_name=None, matching_value=None, batch_size=None):
+		if batch_size is None:
+			batch_size = self.default_batch_size
 		
-		finally:
-			conn.close()
+		if type(batch_size) is not int or batch_size < 1:
+			raise ValueError(f"batch_size must be a positive int, not '{batch_size}'.")
+		
+		declared_types = {repr(column): column_info.type for column_info, column in zip(self.get_columns(), self.get_compiled_column_identifiers())}
+		
+		if column_names is None:
+			column_references = list(declared_types)
+		else:
+			column_references = [self.get_validated_column_reference(name) for name in column_names]
+		
+		buffers = {column_reference: ColumnBuffer(declared_types[column_reference]) for column_reference in column_references}
+		
+		column_expressions = []
+		for column_reference, column_buffer in buffers.items():
+			# Casting drops the declared type, so that sqlite3 does not convert each timestamp to a datetime.
+			if column_buffer.kind == "timestamp":
+				column_expressions.append(f"CAST({column_reference} AS TEXT)")
+			else:
+				column_expressions.append(column_reference)
+		
+		self.observe_query(column_name, None if column_names is None else list(column_names))
+		
+		with self.timed("read_columns") as timer, self.connection() as conn:
+			if column_name is None:
+				condition_context = nullcontext(("1", []))
+			else:
+				condition_context = self.validated_condition(conn, column_name, matching_value)
+			
+			with condition_context as (condition, condition_values):
+				crsr = conn.cursor()
+				crsr.row_factory = None # Plain tuples, which transpose quickly.
+				
+				query_str = f"SELECT {",".join(column_expressions)} FROM {self.get_validated_relation_expression()} WHERE {condition}"
+				
+				start = timer.begin()
+				crsr.execute(query_str, condition_values)
+				timer.end_sql(start, sql=query_str, values=condition_values)
+				
+				while True:
+					start = timer.begin()
+					rows = crsr.fetchmany(batch_size)
+					timer.end_fetch(start, len(rows))
+					
+					if len(rows) == 0:
+						break
+					
+					start = timer.begin()
+					for column_buffer, values in zip(buffers.values(), zip(*rows)):
+						column_buffer.extend(values)
+					
+					timer.end_hydrate(start, len(rows))
+			
+			start = timer.begin()
+			res = {column_reference: column_buffer.result() for column_reference, column_buffer in buffers.items()}
+			timer.end_hydrate(start)
 		
 		return res
 	
@@ -305,55 +899,344 @@ class RelationManager:
 		
 		return res[0]
 	
+	# Writes the columns of entity which were assigned since it was last read or written.
+	# Clean entities are not written at all. Changes made without EntityModel.__setattr__() must be reported with mark_dirty().
 	def update(self, entity):
 		if not isinstance(entity, self.entity_model):
-			raise RuntimeError(f"Cannot insert '{entity}' into '{get_validated_relation_expression()}'.")
+			raise RuntimeError(f"Cannot insert '{entity}' into '{self.get_validated_relation_expression()}'.")
 		
-		entity.updated_on = datetime.now(UTC)
+		if len(self.get_dirty_columns_to_update(entity)) == 0:
+			return entity
 		
-		conn = self.entity_mgr.db_mgr.get_connection()
-		crsr = conn.cursor()
+		# Queued for the transaction to flush. The transaction calls back into update() while flushing.
+		transaction = self.entity_mgr.current_transaction()
+		if transaction is not None and not transaction.is_flushing:
+			transaction.enqueue_update(self, entity)
+			return entity
 		
-		try:
-			columns_to_update = self.get_column_names()
-			columns_to_update.remove("id")
-			self.entity_mgr.db_mgr.validate_sql_identifiers(columns_to_update)
+		self.set_timestamps(entity, datetime.now(UTC))
+		
+		with self.timed("update") as timer, self.connection(commit=True, timer=timer) as conn:
+			crsr = conn.cursor()
 			
-			values = self.get_values_of_columns(entity, columns_to_update)
-			values.append(entity.id)
+			try:
+				columns_to_update = self.get_dirty_columns_to_update(entity)
+				
+				values = self.get_values_of_columns(entity, columns_to_update)
+				values.append(entity.id)
+				
+				query_str = self.get_update_statement(columns_to_update)
+				
+				start = timer.begin()
+				crsr.execute(query_str, values)
+				timer.end_sql(start, rows=crsr.rowcount, sql=query_str, values=values)
+				
+			# TODO: Reference to sqlite3 errors couples us to this database. Offload this to the db manager class.
+			except sqlite3.IntegrityError as e:
+				self.entity_log.info(f"Caught IntegrityError during '{self.get_validated_relation_expression()}' creation: {e}")
+				self.invalidate_cached_entity(entity)
+				return None
 			
-			query_str = f"UPDATE {self.get_validated_relation_expression()} SET {",".join(map(lambda v : v + "=?", columns_to_update))} WHERE id = ?"
-			self.entity_log.debug(f"Executing '{query_str}', {values}")
-			crsr.execute(query_str, values)
+			except sqlite3.OperationalError as e:
+				self.entity_log.error(f"Caught OperationalError during '{self.get_validated_relation_expression()}' creation: {e}")
+				self.invalidate_cached_entity(entity)
+				return None
 			
-		# TODO: Reference to sqlite3 errors couples us to this database. Offload this to the db manager class.
-		except sqlite3.IntegrityError as e:
-			self.entity_log.info(f"Caught IntegrityError during '{self.get_validated_relation_expression()}' creation: {e}")
-			return None
+			else:
+				entity.relation_mgr = self # Bind.
+				entity.mark_clean()
+				self.invalidate_cached_entity(entity, successful=True)
+				return entity
+	
+	# Updates many bound entities in one transaction.
+	# Entities are grouped by the columns they need written, and each group's UPDATE statement is built once and run with executemany. Clean entities are skipped.
+	# If a group fails, it is rolled back and retried row by row so that one bad entity does not abort the others.
+	# Returns a list parallel to entities, holding each updated entity or None where its update failed.
+	# Flushes of a transaction's queued updates do not tolerate partial failure: the first row to fail raises, naming the table and id, and the transaction rolls back.
+	def update_many(self, entities):
+		entities = list(entities)
+		for entity in entities:
+			if not isinstance(entity, self.entity_model):
+				raise RuntimeError(f"Cannot update '{entity}' in '{self.get_validated_relation_expression()}'.")
+			
+			if entity.id is None:
+				raise RuntimeError(f"Cannot update unbound entity '{entity}' in '{self.get_validated_relation_expression()}'.")
 		
-		except sqlite3.OperationalError as e:
-			self.entity_log.error(f"Caught OperationalError during '{self.get_validated_relation_expression()}' creation: {e}")
-			return None
+		relation_expression = self.get_validated_relation_expression()
 		
-		else:
-			entity.relation_mgr = self # Bind.
-			return entity
+		now = datetime.now(UTC)
 		
-		finally:
-			conn.commit()
-			conn.close()
+		groups = {}
+		for i, entity in enumerate(entities):
+			if len(self.get_dirty_columns_to_update(entity)) == 0:
+				continue
+			
+			self.set_timestamps(entity, now)
+			groups.setdefault(self.get_dirty_columns_to_update(entity), []).append(i)
+		
+		transaction = self.entity_mgr.current_transaction()
+		is_flushing = transaction is not None and transaction.is_flushing
+		
+		res = list(entities)
+		with self.timed("update_many") as timer, self.connection(commit=True, timer=timer) as conn:
+			crsr = conn.cursor()
+			
+			for columns_to_update, indices in groups.items():
+				query_str = self.get_update_statement(columns_to_update)
+				
+				row_values = []
+				for i in indices:
+					values = self.get_values_of_columns(entities[i], columns_to_update)
+					values.append(entities[i].id)
+					row_values.append(values)
+				
+				start = timer.begin()
+				crsr.execute("SAVEPOINT update_many")
+				try:
+					crsr.executemany(query_str, row_values)
+				
+				except (sqlite3.IntegrityError, sqlite3.OperationalError) as e:
+					self.entity_log.info(f"Bulk update of '{relation_expression}' failed, retrying row by row: {e}")
+					crsr.execute("ROLLBACK TO update_many")
+					
+					for i, values in zip(indices, row_values):
+						try:
+							crsr.execute(query_str, values)
+						
+						except sqlite3.IntegrityError as e:
+							if is_flushing:
+								raise sqlite3.IntegrityError(f"Queued update of '{relation_expression}' id {values[-1]} failed: {e}") from e
+							
+							self.entity_log.info(f"Caught IntegrityError during '{relation_expression}' update of id {values[-1]}: {e}")
+							res[i] = None
+						
+						except sqlite3.OperationalError as e:
+							if is_flushing:
+								raise sqlite3.OperationalError(f"Queued update of '{relation_expression}' id {values[-1]} failed: {e}") from e
+							
+							self.entity_log.error(f"Caught OperationalError during '{relation_expression}' update of id {values[-1]}: {e}")
+							res[i] = None
+				
+				finally:
+					crsr.execute("RELEASE update_many")
+					timer.end_sql(start, rows=sum(res[i] is not None for i in indices), sql=query_str)
+		
+		for entity, updated_entity in zip(entities, res):
+			if updated_entity is not None:
+				# The write is undone if the transaction rolls back, and so must be made again.
+				if transaction is not None:
+					transaction.record_written(entity, frozenset(entity.get_dirty_columns()))
+				
+				entity.relation_mgr = self # Bind.
+				entity.mark_clean()
+			
+			self.invalidate_cached_entity(entity, successful=updated_entity is not None)
+		
+		return res
 	
 	def delete(self, id):
 		if id is None or type(id) != int:
 			raise TypeError(f"Invalid id '{str(id)}' of type '{type(id)}'")
 		
-		conn = self.entity_mgr.db_mgr.get_connection()
-		crsr = conn.cursor()
-		query_str = f"DELETE FROM {self.get_validated_relation_expression()} WHERE id = ?"
-		crsr.execute(query_str, (id,))
+		with self.timed("delete") as timer, self.connection(commit=True, timer=timer) as conn:
+			crsr = conn.cursor()
+			query_str = self.cached(("delete",), lambda: f"DELETE FROM {self.get_validated_relation_expression()} WHERE id = ?")
+			
+			start = timer.begin()
+			crsr.execute(query_str, (id,))
+			timer.end_sql(start, rows=crsr.rowcount, sql=query_str, values=(id,))
+		
+		if self.get_identity_map() is not None:
+			self.get_identity_map().invalidate(self.table_name, id)
+	
+	# Sets columns on every row whose column_name matches matching_value, as one UPDATE statement.
+	# Rows are never read, so no entities are created. updated_on is maintained if it exists and is not being assigned.
+	# Returns the number of rows affected, or None if the update failed.
+	def update_where(self, column_name, matching_value, **assignments):
+		if len(assignments) == 0:
+			raise ValueError("update_where requires at least one column to assign.")
+		
+		column_names = self.get_column_names()
+		for assigned_column in assignments:
+			if assigned_column.lower() not in column_names:
+				raise ColumnRetrievalError(f"Column name '{assigned_column}' does not exist.")
+			
+			if assigned_column.lower() == "id":
+				raise ValueError("update_where cannot reassign ids.")
+		
+		if "updated_on" in column_names and "updated_on" not in {assigned_column.lower() for assigned_column in assignments}:
+			assignments["updated_on"] = datetime.now(UTC)
+		
+		self.entity_mgr.db_mgr.validate_sql_identifiers(list(assignments))
+		
+		relation_expression = self.get_validated_relation_expression()
+		
+		self.observe_query(column_name)
+		
+		with self.timed("update_where") as timer, self.connection(commit=True, timer=timer) as conn, self.validated_condition(conn, column_name, matching_value) as (condition, condition_values):
+			crsr = conn.cursor()
+			
+			query_str = f"UPDATE {relation_expression} SET {",".join(map(lambda v : v + "=?", assignments))} WHERE {condition}"
+			values = list(assignments.values()) + condition_values
+			
+			try:
+				start = timer.begin()
+				crsr.execute(query_str, values)
+				timer.end_sql(start, rows=crsr.rowcount, sql=query_str, values=values)
+			
+			except sqlite3.IntegrityError as e:
+				self.entity_log.info(f"Caught IntegrityError during '{relation_expression}' update: {e}")
+				return None
+			
+			except sqlite3.OperationalError as e:
+				self.entity_log.error(f"Caught OperationalError during '{relation_expression}' update: {e}")
+				return None
+			
+			finally:
+				# Which rows matched is unknown without reading them.
+				if self.get_identity_map() is not None:
+					self.get_identity_map().clear(self.table_name)
+			
+			return crsr.rowcount
+	
+	# Deletes every row whose column_name matches matching_value, as one DELETE statement.
+	# Returns the number of rows deleted, or None if the delete failed.
+	def delete_where(self, column_name, matching_value):
+		relation_expression = self.get_validated_relation_expression()
+		
+		self.observe_query(column_name)
 		
-		conn.commit()
-		conn.close()
+		with self.timed("delete_where") as timer, self.connection(commit=True, timer=timer) as conn, self.validated_condition(conn, column_name, matching_value) as (condition, condition_values):
+			crsr = conn.cursor()
+			
+			query_str = f"DELETE FROM {relation_expression} WHERE {condition}"
+			
+			try:
+				start = timer.begin()
+				crsr.execute(query_str, condition_values)
+				timer.end_sql(start, rows=crsr.rowcount, sql=query_str, values=condition_values)
+			
+			except sqlite3.IntegrityError as e:
+				self.entity_log.info(f"Caught IntegrityError during '{relation_expression}' delete: {e}")
+				return None
+			
+			except sqlite3.OperationalError as e:
+				self.entity_log.error(f"Caught OperationalError during '{relation_expression}' delete: {e}")
+				return None
+			
+			finally:
+				# Which rows matched is unknown without reading them.
+				if self.get_identity_map() is not None:
+					self.get_identity_map().clear(self.table_name)
+			
+			return crsr.rowcount
+	
+	#### Indexes ####
+	
+	# Creates an index on the columns of the managed table, unless an index on the same columns already exists, and returns the index's name.
+	# columns is a column name or a list of them. With unique, the index also enforces that no two rows share its values.
+	# where is a SQL expression making the index partial, e.g. "manager_id IS NOT NULL". It is spliced in as is, so must never come from users.
+	# Returns None if the index could not be created, e.g. because existing rows are not unique.
+	def ensure_index(self, columns, unique=False, where=None):
+		if type(columns) is str:
+			columns = [columns]
+		
+		schema_names = dict(zip(self.get_column_names(), self.get_column_names(do_lower=False)))
+		
+		column_names = []
+		for column in columns:
+			if type(column) is not str:
+				raise TypeError(f"columns must be a column name or a list of them, not {type(column)}.")
+			
+			if column.lower() not in schema_names:
+				raise ColumnRetrievalError(f"Column name '{column}' does not exist.")
+			
+			column_names.append(schema_names[column.lower()])
+		
+		if len(column_names) == 0:
+			raise ValueError("ensure_index requires at least one column.")
+		
+		if where is not None and type(where) is not str:
+			raise TypeError(f"where must be a string, not {type(where)}.")
+		
+		# A unique index serves where a plain one was asked for, but partial indexes only serve the queries their condition implies.
+		if where is None:
+			for index in self.get_indexes():
+				if index["columns"] == column_names and not index["partial"] and (index["unique"] or not unique):
+					return index["name"]
+		
+		index_name, query_str = self.get_create_index_statement(column_names, unique, where)
+		
+		with self.timed("ensure_index") as timer, self.connection(commit=True, timer=timer) as conn:
+			try:
+				start = timer.begin()
+				conn.execute(query_str)
+				timer.end_sql(start)
+			
+			except sqlite3.IntegrityError as e:
+				self.entity_log.info(f"Caught IntegrityError creating index '{index_name}': {e}")
+				return None
+			
+			except sqlite3.OperationalError as e:
+				self.entity_log.error(f"Caught OperationalError creating index '{index_name}': {e}")
+				return None
+		
+		# Plans explained before may no longer be the ones SQLite picks.
+		if self.entity_mgr.slow_query_log is not None:
+			self.entity_mgr.slow_query_log.clear_plans()
+		
+		return index_name
+	
+	# Returns the name ensure_index() gives an index, and the CREATE INDEX statement for it. Partial indexes are named after a checksum of their condition too.
+	def get_create_index_statement(self, column_names, unique=False, where=None):
+		table_name = self.get_table_name()
+		self.entity_mgr.db_mgr.validate_sql_identifiers(column_names)
+		
+		index_name = f"{"ux" if unique else "ix"}_{table_name}_{"_".join(column_names)}"
+		if where is not None:
+			index_name += f"_{zlib.crc32(where.encode()):08x}"
+		
+		query_str = f"CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {index_name} ON {table_name} ({",".join(column_names)})"
+		if where is not None:
+			query_str += f" WHERE {where}"
+		
+		return index_name, query_str
+	
+	# Lists the indexes on the managed table, including those SQLite creates for UNIQUE and PRIMARY KEY constraints,
+	# as dicts with the index's "name", whether it is "unique" and "partial", and its "columns" in order. Columns which are expressions are None.
+	# The INTEGER PRIMARY KEY id column is the table's rowid, and so is not listed.
+	def get_indexes(self):
+		table_name = self.get_table_name()
+		
+		res = []
+		with self.connection() as conn:
+			for seq, index_name, unique, origin, partial in conn.execute(f"PRAGMA index_list({table_name})").fetchall():
+				res.append({
+					"name": index_name,
+					"unique": bool(unique),
+					"partial": bool(partial),
+					"columns": [column_name for seqno, cid, column_name in conn.execute(f"PRAGMA index_info(\"{index_name}\")").fetchall()]
+				})
+		
+		return res
+	
+	# Tells the EntityManager's index advisor, if enabled, that a query filtering on column_name, or reading every row if it is None, is about to run.
+	# column_names are the columns read, if not all of them.
+	def observe_query(self, column_name, column_names=None):
+		index_advisor = self.entity_mgr.index_advisor
+		if index_advisor is not None:
+			index_advisor.observe(self, column_name, column_names)
+	
+	# Returns the RelationManager of the table holding the named column, and the column's name as in the schema.
+	# Overriden by JoinedRelationManager
+	def get_index_target(self, column_name):
+		schema_names = self.cached(("schema_names",), lambda: dict(zip(self.get_column_names(), self.get_column_names(do_lower=False))))
+		return self, schema_names[column_name.rsplit(".", 1)[-1].lower()]
+	
+	# Returns the index targets, as get_index_target(), of both keys of every join in this relation.
+	# Overriden by JoinedRelationManager
+	def get_join_targets(self):
+		return ()
 	
 	#### Syntactic Sugar ####
 	
@@ -0,0 +1,140 @@
+import re
+import sqlite3
+import threading
+
+# Collects the statements of operations whose SQL took at least threshold seconds, with their EXPLAIN QUERY PLAN.
+# Each is logged as a warning with its parameters (unless log_parameters is False), timing and plan, and aggregated by statement text for report().
+# Plans are explained once per statement text, on a connection borrowed from the DatabaseManager, so statements using another connection's temporary tables cannot be explained.
+class SlowQueryLog:
+	# Matches plan lines which read every row of a table, e.g. "SCAN users" or, before SQLite 3.36, "SCAN TABLE users". Scans through an index are not matched.
+	full_scan_pattern = re.compile(r"^SCAN (?:TABLE )?(\S+)(?!.*\bUSING\b.*\bINDEX\b)")
+	
+	# Matches plan lines where SQLite builds a temporary index for want of a real one.
+	automatic_index_pattern = re.compile(r"^(?:SEARCH|SCAN) (?:TABLE )?(\S+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX")
+	
+	# Aggregates are kept for up to this many distinct statements. The least total time is dropped first.
+	max_statements = 1000
+	
+	def __init__(self, db_mgr, log, threshold=0.1, explain=True, log_parameters=True):
+		if not isinstance(threshold, (int, float)) or threshold < 0:
+			raise ValueError(f"threshold must be a non-negative number of seconds, not '{threshold}'.")
+		
+		self.db_mgr = db_mgr
+		self.log = log
+		self.threshold = threshold
+		self.explain = explain
+		self.log_parameters = log_parameters
+		
+		self.lock = threading.Lock()
+		self.statements = {}
+		self.plans = {}
+	
+	# Called with the statement of an operation which took at least threshold seconds.
+	# values is None for statements run with executemany().
+	def record(self, table_name, operation, sql, values, seconds):
+		plan = self.get_plan(sql, values)
+		full_scans, automatic_indexes = SlowQueryLog.find_missing_indexes(plan)
+		is_join = "JOIN" in sql
+		
+		with self.lock:
+			entry = self.statements.get(sql)
+			if entry is None:
+				if len(self.statements) >= self.max_statements:
+					del self.statements[min(self.statements, key=lambda key: self.statements[key]["total_seconds"])]
+				
+				entry = {
+					"sql": sql,
+					"table": table_name,
+					"operation": operation,
+					"is_join": is_join,
+					"count": 0,
+					"total_seconds": 0.0,
+					"max_seconds": 0.0,
+					"last_parameters": None,
+					"plan": plan,
+					"full_scans": full_scans,
+					"automatic_indexes": automatic_indexes
+				}
+				self.statements[sql] = entry
+			
+			entry["count"] += 1
+			entry["total_seconds"] += seconds
+			entry["max_seconds"] = max(entry["max_seconds"], seconds)
+			entry["last_parameters"] = None if values is None or not self.log_parameters else list(values)
+		
+		message = f"Slow query ({seconds * 1000:.1f}ms) in {table_name}.{operation}: {sql}"
+		
+		if self.log_parameters:
+			message += f"\n  parameters: {'(executemany)' if values is None else list(values)}"
+		
+		for line in plan:
+			message += f"\n  plan: {line}"
+		
+		# Nested-loop scans are what make joins slow, so they are called out.
+		for table in full_scans:
+			message += f"\n  full scan of '{table}'{' within join' if is_join else ''}: no index is used"
+		
+		for table in automatic_indexes:
+			message += f"\n  automatic index built on '{table}'{' within join' if is_join else ''}: an index on the join or filter column would avoid it"
+		
+		self.log.warning(message)
+	
+	# Returns the detail lines of the statement's EXPLAIN QUERY PLAN, indented by depth, or a single line explaining why there is none.
+	def get_plan(self, sql, values):
+		if not self.explain:
+			return []
+		
+		with self.lock:
+			plan = self.plans.get(sql)
+		
+		if plan is not None:
+			return plan
+		
+		try:
+			plan = self.db_mgr.explain_query_plan(sql, values)
+		
+		except sqlite3.Error as e:
+			return [f"(unavailable: {e})"]
+		
+		with self.lock:
+			self.plans[sql] = plan
+		
+		return plan
+	
+	# Returns the tables read in full, and those which SQLite built an automatic index on, according to the plan lines.
+	@staticmethod
+	def find_missing_indexes(plan):
+		full_scans = []
+		automatic_indexes = []
+		
+		for line in plan:
+			line = line.strip()
+			
+			match = SlowQueryLog.automatic_index_pattern.match(line)
+			if match is not None:
+				automatic_indexes.append(match.group(1))
+				continue
+			
+			match = SlowQueryLog.full_scan_pattern.match(line)
+			# Neither "SCAN CONSTANT ROW" nor scans of subquery results, e.g. "SCAN (subquery-1)", read a table.
+			if match is not None and match.group(1) != "CONSTANT" and not match.group(1).startswith("("):
+				full_scans.append(match.group(1))
+		
+		return full_scans, automatic_indexes
+	
+	# Returns the n statements which took the most time in total, slowest first, as dicts with their plans and counts.
+	def report(self, n=10):
+		with self.lock:
+			entries = sorted(self.statements.values(), key=lambda entry: entry["total_seconds"], reverse=True)[:n]
+			return [dict(entry) for entry in entries]
+	
+	# Forgets aggregates and cached plans.
+	def reset(self):
+		with self.lock:
+			self.statements = {}
+			self.plans = {}
+	
+	# Forgets cached plans, which indexes created since may have changed. Called by RelationManager.ensure_index().
+	def clear_plans(self):
+		with self.lock:
+			self.plans = {}
@@ -0,0 +1,295 @@
+import math
+import threading
+import time
+
+# Counts durations in buckets which grow by a factor of 2 ** (1 / buckets_per_doubling).
+# Percentiles are read back as the upper bound of the bucket they fall in, capped at the largest duration seen, so they are within about 19% of the true value.
+class LatencyHistogram:
+	smallest_bucket = 1e-6
+	buckets_per_doubling = 4
+	
+	def __init__(self):
+		self.bucket_counts = {}
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+	
+	def record(self, seconds):
+		if seconds <= LatencyHistogram.smallest_bucket:
+			bucket = 0
+		else:
+			bucket = math.ceil(math.log2(seconds / LatencyHistogram.smallest_bucket) * LatencyHistogram.buckets_per_doubling)
+		
+		self.bucket_counts[bucket] = self.bucket_counts.get(bucket, 0) + 1
+		self.count += 1
+		self.total += seconds
+		
+		if seconds > self.max:
+			self.max = seconds
+	
+	# Returns the duration below which the fraction q of recorded durations fall, or None if nothing was recorded.
+	def percentile(self, q):
+		if self.count == 0:
+			return None
+		
+		rank = q * self.count
+		seen = 0
+		for bucket in sorted(self.bucket_counts):
+			seen += self.bucket_counts[bucket]
+			if seen >= rank:
+				return min(LatencyHistogram.smallest_bucket * 2 ** (bucket / LatencyHistogram.buckets_per_doubling), self.max)
+		
+		return self.max
+	
+	def summary(self):
+		return {
+			"count": self.count,
+			"total": self.total,
+			"mean": self.total / self.count if self.count > 0 else None,
+			"p50": self.percentile(0.5),
+			"p95": self.percentile(0.95),
+			"p99": self.percentile(0.99),
+			"max": self.max
+		}
+
+# Records where an EntityManager's time goes, per table and operation: how long was spent running SQL, how long building entities from rows,
+# how many statements were run and how many rows they returned or affected. Also records how long connections took to acquire from the DatabaseManager's pool.
+# exporter, if given, is called with a dict describing each operation or acquire as it is recorded, e.g. to forward it to a metrics service. Errors it raises are counted and otherwise ignored.
+class StatementMetrics:
+	# Stands in for the table of operations which are not run against one table, such as DatabaseManager.run_script() and the commit of EntityManager.transaction().
+	# Not a valid identifier, so it cannot collide with a table.
+	database_label = "(database)"
+	
+	def __init__(self, exporter=None):
+		if exporter is not None and not callable(exporter):
+			raise TypeError(f"exporter must be callable, not {type(exporter)}.")
+		
+		self.exporter = exporter
+		
+		self.lock = threading.Lock()
+		self.reset()
+	
+	# Forgets everything recorded so far.
+	def reset(self):
+		with self.lock:
+			self.operations = {}
+			self.acquire_histogram = LatencyHistogram()
+			self.connections = {
+				"acquired": 0,
+				"created": 0
+			}
+			self.exporter_errors = 0
+	
+	def record_operation(self, table_name, operation, sql_seconds, hydrate_seconds, statements, rows):
+		with self.lock:
+			operation_metrics = self.operations.get((table_name, operation))
+			if operation_metrics is None:
+				operation_metrics = {
+					"calls": 0,
+					"statements": 0,
+					"rows": 0,
+					"sql": LatencyHistogram(),
+					"hydrate": LatencyHistogram()
+				}
+				self.operations[(table_name, operation)] = operation_metrics
+			
+			operation_metrics["calls"] += 1
+			operation_metrics["statements"] += statements
+			operation_metrics["rows"] += rows
+			operation_metrics["sql"].record(sql_seconds)
+			
+			# Operations which build no entities would only dilute the percentiles.
+			if hydrate_seconds > 0:
+				operation_metrics["hydrate"].record(hydrate_seconds)
+		
+		if self.exporter is None:
+			return
+		
+		self.export({
+			"kind": "operation",
+			"table": table_name,
+			"operation": operation,
+			"sql_seconds": sql_seconds,
+			"hydrate_seconds": hydrate_seconds,
+			"statements": statements,
+			"rows": rows
+		})
+	
+	def record_acquire(self, seconds, created):
+		with self.lock:
+			self.connections["acquired"] += 1
+			if created:
+				self.connections["created"] += 1
+			
+			self.acquire_histogram.record(seconds)
+		
+		if self.exporter is None:
+			return
+		
+		self.export({
+			"kind": "acquire",
+			"seconds": seconds,
+			"created": created
+		})
+	
+	def export(self, event):
+		try:
+			self.exporter(event)
+		
+		except Exception:
+			with self.lock:
+				self.exporter_errors += 1
+	
+	# Returns a snapshot of everything recorded, as plain dicts:
+	# {"tables": {table: {operation: {"calls", "statements", "rows", "sql": {...}, "hydrate": {...}}}}, "connections": {"acquired", "created", "acquire": {...}}, "exporter_errors": n}
+	# Each of "sql", "hydrate" and "acquire" holds the count, total, mean, p50, p95, p99 and max of its durations in seconds.
+	def stats(self):
+		with self.lock:
+			tables = {}
+			for (table_name, operation), operation_metrics in self.operations.items():
+				tables.setdefault(table_name, {})[operation] = {
+					"calls": operation_metrics["calls"],
+					"statements": operation_metrics["statements"],
+					"rows": operation_metrics["rows"],
+					"sql": operation_metrics["sql"].summary(),
+					"hydrate": operation_metrics["hydrate"].summary()
+				}
+			
+			connections = dict(self.connections)
+			connections["acquire"] = self.acquire_histogram.summary()
+			
+			return {
+				"tables": tables,
+				"connections": connections,
+				"exporter_errors": self.exporter_errors
+			}
+
+# Accumulates the SQL time, hydration time, statements and rows of one call of an operation, and records them into StatementMetrics when its with block exits.
+# With a Tracer, the call is also traced as a span named after the operation, with a child span for each statement ("query"), fetch of rows ("fetch"), batch of hydration ("hydrate") and commit ("commit").
+# With a SlowQueryLog, the last statement of a call whose statements and fetches took at least its threshold is handed to it, with its parameters.
+# Any of metrics, tracer and slow_query_log may be None. Callers bracket work with begin() and one of the end methods.
+class OperationTimer:
+	def __init__(self, metrics, tracer, slow_query_log, table_name, operation, activate=True):
+		self.metrics = metrics
+		self.tracer = tracer
+		self.slow_query_log = slow_query_log
+		self.table_name = table_name
+		self.operation = operation
+		
+		self.sql_seconds = 0.0
+		self.hydrate_seconds = 0.0
+		self.statements = 0
+		self.rows = 0
+		
+		# Time spent in statements and fetches, but not commits, which the slow query log judges by.
+		self.query_seconds = 0.0
+		self.sql = None
+		self.values = None
+		
+		self.span_scope = None if tracer is None else tracer.span(operation, activate, table=table_name)
+		self.span = None
+	
+	# Returns a timer recording into metrics, tracer and slow_query_log, or null_operation_timer if all are None.
+	# activate is passed on to Tracer.span().
+	@staticmethod
+	def of(metrics, tracer, slow_query_log, table_name, operation, activate=True):
+		if metrics is None and tracer is None and slow_query_log is None:
+			return null_operation_timer
+		
+		return OperationTimer(metrics, tracer, slow_query_log, table_name, operation, activate)
+	
+	def __enter__(self):
+		if self.span_scope is not None:
+			self.span = self.span_scope.__enter__()
+		
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self.metrics is not None:
+			self.metrics.record_operation(self.table_name, self.operation, self.sql_seconds, self.hydrate_seconds, self.statements, self.rows)
+		
+		if self.slow_query_log is not None and self.sql is not None and self.query_seconds >= self.slow_query_log.threshold:
+			self.slow_query_log.record(self.table_name, self.operation, self.sql, self.values, self.query_seconds)
+		
+		if self.span_scope is not None:
+			if self.span is not None:
+				self.span.attributes["statements"] = self.statements
+				self.span.attributes["rows"] = self.rows
+			
+			self.span_scope.__exit__(exc_type, exc_value, traceback)
+		
+		return False
+	
+	def begin(self):
+		return time.perf_counter()
+	
+	# Counts a statement which returned or affected rows. sql and values are only kept by the span and slow query log, and sql is only worth building if wants_sql().
+	# values is None for statements run with executemany().
+	def end_sql(self, start, rows=0, sql=None, values=None):
+		end = time.perf_counter()
+		self.sql_seconds += end - start
+		self.query_seconds += end - start
+		self.statements += 1
+		self.rows += rows
+		self.sql = sql
+		self.values = values
+		
+		if self.span is not None:
+			self.tracer.record("query", self.span, start, end, sql=sql, rows=rows)
+	
+	# Counts rows fetched from a statement which was already counted by end_sql().
+	def end_fetch(self, start, rows):
+		end = time.perf_counter()
+		self.sql_seconds += end - start
+		self.query_seconds += end - start
+		self.rows += rows
+		
+		if self.span is not None:
+			self.tracer.record("fetch", self.span, start, end, rows=rows)
+	
+	def end_hydrate(self, start, entities=None):
+		end = time.perf_counter()
+		self.hydrate_seconds += end - start
+		
+		if self.span is not None:
+			self.tracer.record("hydrate", self.span, start, end, entities=entities)
+	
+	def end_commit(self, start):
+		end = time.perf_counter()
+		self.sql_seconds += end - start
+		self.statements += 1
+		
+		if self.span is not None:
+			self.tracer.record("commit", self.span, start, end)
+	
+	# True if statements are being traced or checked for slowness, and so worth describing.
+	def wants_sql(self):
+		return self.span is not None or self.slow_query_log is not None
+
+# Used while metrics, tracing and the slow query log are all disabled. Records nothing and never reads the clock.
+class NullOperationTimer:
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+	
+	def begin(self):
+		return 0.0
+	
+	def end_sql(self, start, rows=0, sql=None, values=None):
+		pass
+	
+	def end_fetch(self, start, rows):
+		pass
+	
+	def end_hydrate(self, start, entities=None):
+		pass
+	
+	def end_commit(self, start):
+		pass
+	
+	def wants_sql(self):
+		return False
+
+null_operation_timer = NullOperationTimer()
@@ -0,0 +1,173 @@
+from collections import deque
+from contextvars import ContextVar
+import itertools
+import logging
+import random
+import threading
+import time
+
+# The span which new spans in the current context are children of. Tracer.unsampled when the current trace was not sampled.
+_current_span = ContextVar("current_span", default=None)
+
+# A timed unit of work within a trace. start and end are time.perf_counter() values.
+# The trace_id of a trace is the span_id of its root span.
+class Span:
+	__slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "error")
+	
+	span_ids = itertools.count(1)
+	
+	def __init__(self, name, parent, start, attributes):
+		self.name = name
+		self.span_id = next(Span.span_ids)
+		
+		if parent is None:
+			self.trace_id = self.span_id
+			self.parent_id = None
+		else:
+			self.trace_id = parent.trace_id
+			self.parent_id = parent.span_id
+		
+		self.start = start
+		self.end = None
+		self.attributes = attributes
+		self.error = None
+	
+	def get_duration(self):
+		if self.end is None:
+			return None
+		
+		return self.end - self.start
+	
+	def to_dict(self):
+		return {
+			"name": self.name,
+			"trace_id": self.trace_id,
+			"span_id": self.span_id,
+			"parent_id": self.parent_id,
+			"start": self.start,
+			"end": self.end,
+			"duration": self.get_duration(),
+			"attributes": dict(self.attributes),
+			"error": None if self.error is None else repr(self.error)
+		}
+	
+	def __str__(self):
+		duration = self.get_duration()
+		res = f"{self.name} {'?' if duration is None else f'{duration * 1000:.3f}ms'} trace={self.trace_id} span={self.span_id} parent={self.parent_id}"
+		
+		for key, value in self.attributes.items():
+			res += f" {key}={value!r}"
+		
+		if self.error is not None:
+			res += f" error={self.error!r}"
+		
+		return res
+
+# Produces spans and hands each one, once finished, to sink: a callable taking the Span, such as a SpanCollector or LoggingSpanSink.
+# Each trace is sampled as its root span starts, with probability sample_rate. Every span of an unsampled trace is skipped, so only sampled traces cost anything beyond the decision.
+# Spans opened with span() are the parent of spans started within the with block in the same context, including those of EntityManager operations.
+class Tracer:
+	# Marks the current context as inside a trace which was not sampled.
+	unsampled = object()
+	
+	def __init__(self, sink, sample_rate=1.0):
+		if not callable(sink):
+			raise TypeError(f"sink must be callable, not {type(sink)}.")
+		
+		if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+			raise ValueError(f"sample_rate must be a number from 0 to 1, not '{sample_rate}'.")
+		
+		self.sink = sink
+		self.sample_rate = sample_rate
+	
+	def is_sampled(self):
+		return self.sample_rate >= 1 or random.random() < self.sample_rate
+	
+	# Returns the span which spans started now would be children of, None at the root of a trace, or Tracer.unsampled.
+	@staticmethod
+	def get_current_span():
+		return _current_span.get()
+	
+	# Times the with block as a span, which it yields, or None if the trace is not sampled.
+	# With activate, the span is made current for the block. Generators, whose blocks can span several contexts, must not activate their spans.
+	def span(self, name, activate=True, **attributes):
+		return SpanScope(self, name, activate, attributes)
+	
+	# Emits a span which has already finished, e.g. a statement timed by an OperationTimer.
+	def record(self, name, parent, start, end, **attributes):
+		span = Span(name, parent, start, attributes)
+		span.end = end
+		self.emit(span)
+	
+	def emit(self, span):
+		self.sink(span)
+
+# The context manager returned by Tracer.span().
+class SpanScope:
+	__slots__ = ("tracer", "name", "activate", "attributes", "span", "token")
+	
+	def __init__(self, tracer, name, activate, attributes):
+		self.tracer = tracer
+		self.name = name
+		self.activate = activate
+		self.attributes = attributes
+		
+		self.span = None
+		self.token = None
+	
+	def __enter__(self):
+		parent = _current_span.get()
+		
+		if parent is Tracer.unsampled or (parent is None and not self.tracer.is_sampled()):
+			if self.activate and parent is None:
+				self.token = _current_span.set(Tracer.unsampled)
+			
+			return None
+		
+		self.span = Span(self.name, parent, time.perf_counter(), self.attributes)
+		
+		if self.activate:
+			self.token = _current_span.set(self.span)
+		
+		return self.span
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self.token is not None:
+			_current_span.reset(self.token)
+			self.token = None
+		
+		if self.span is not None:
+			self.span.end = time.perf_counter()
+			self.span.error = exc_value
+			self.tracer.emit(self.span)
+		
+		return False
+
+# Keeps the last max_spans finished spans in memory, e.g. for tests or a debug endpoint.
+class SpanCollector:
+	def __init__(self, max_spans=10000):
+		self.lock = threading.Lock()
+		self.spans = deque(maxlen=max_spans)
+	
+	def __call__(self, span):
+		with self.lock:
+			self.spans.append(span)
+	
+	# Returns the collected spans, oldest first, optionally only those with the passed name.
+	def get_spans(self, name=None):
+		with self.lock:
+			return [span for span in self.spans if name is None or span.name == name]
+	
+	def clear(self):
+		with self.lock:
+			self.spans.clear()
+
+# Writes each finished span to a standard library logger. Nothing is formatted unless the logger is enabled for level.
+class LoggingSpanSink:
+	def __init__(self, logger=None, level=logging.DEBUG):
+		self.logger = logger if logger is not None else logging.getLogger(__package__ or __name__)
+		self.level = level
+	
+	def __call__(self, span):
+		if self.logger.isEnabledFor(self.level):
+			self.logger.log(self.level, "%s", span)
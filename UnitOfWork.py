@@ -0,0 +1,87 @@
+
+from .StatementMetrics import OperationTimer, StatementMetrics
+
+# Holds the state of an EntityManager.transaction() scope.
+# Every operation inside the scope runs on one pinned connection which is committed once when the scope exits.
+# Updates, including those made by exiting an entity's context manager, are queued and deduplicated per entity.
+# The queue is flushed in order before any other statement runs on the connection, and again at commit.
+class UnitOfWork:
+	def __init__(self, entity_mgr, conn):
+		self.entity_mgr = entity_mgr
+		self.conn = conn
+		
+		# Keyed by id(entity). The queued entity is kept alive by the queue, so its id cannot be reused while queued.
+		self.pending_updates = {}
+		self.is_flushing = False
+		
+		# Entities written on the connection, with the columns written, which are marked dirty again if the transaction rolls back.
+		self.written_entities = []
+		
+		# (relation_mgr, entity) pairs of cached entities written in the transaction, which are dropped from the identity map until it commits.
+		self.cacheable_entities = []
+	
+	def enqueue_update(self, relation_mgr, entity):
+		self.pending_updates[id(entity)] = (relation_mgr, entity)
+	
+	# Called by RelationManager.invalidate_cached_entity() for cached entities written in the transaction.
+	def record_cacheable(self, relation_mgr, entity):
+		self.cacheable_entities.append((relation_mgr, entity))
+	
+	# Called by RelationManager.update_many() as it marks entity clean.
+	def record_written(self, entity, column_names):
+		self.written_entities.append((entity, column_names))
+	
+	# Executes all queued updates on the pinned connection without committing.
+	# Consecutive updates to the same table are written together with update_many().
+	# update_many() raises the error of the first queued update to fail, so that the transaction rolls back rather than committing the rest without it.
+	def flush(self):
+		if self.is_flushing or len(self.pending_updates) == 0:
+			return
+		
+		pending_updates = self.pending_updates
+		self.pending_updates = {}
+		
+		batches = []
+		for relation_mgr, entity in pending_updates.values():
+			if len(batches) > 0 and batches[-1][0] is relation_mgr:
+				batches[-1][1].append(entity)
+			else:
+				batches.append((relation_mgr, [entity]))
+		
+		self.is_flushing = True
+		try:
+			for relation_mgr, entities in batches:
+				relation_mgr.update_many(entities)
+		
+		finally:
+			self.is_flushing = False
+	
+	def commit(self):
+		self.flush()
+		
+		with OperationTimer.of(self.entity_mgr.metrics, self.entity_mgr.tracer, self.entity_mgr.slow_query_log, StatementMetrics.database_label, "commit") as timer:
+			start = timer.begin()
+			self.conn.commit()
+			timer.end_commit(start)
+		
+		identity_map = self.entity_mgr.identity_map
+		if identity_map is not None:
+			for relation_mgr, entity in self.cacheable_entities:
+				# Entities changed again since being written do not match their rows.
+				if not entity.is_dirty():
+					identity_map.put(relation_mgr.table_name, entity)
+		
+		self.cacheable_entities = []
+		self.written_entities = []
+	
+	# Entities written in the transaction no longer match their rows, so they are marked dirty again for a later update() to write.
+	def rollback(self):
+		self.pending_updates = {}
+		self.conn.rollback()
+		
+		for entity, column_names in self.written_entities:
+			for column_name in column_names:
+				entity.mark_dirty(column_name)
+		
+		self.written_entities = []
+		self.cacheable_entities = []
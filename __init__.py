@@ -1,11 +1,20 @@
 from .DatabaseManager import *
 
 from .ColumnIdentifier import ColumnIdentifier
+from .ColumnBuffer import *
 
 from .RelationManager import *
 from .EntityModel import *
 
 from .EntityManager import *
+from .AsyncEntityManager import *
+from .AsyncRelationManager import *
+from .IdentityMap import *
+from .StatementMetrics import *
+from .Tracer import *
+from .SlowQueryLog import *
+from .IndexAdvisor import *
+from .UnitOfWork import *
 
 from .JoinedRelationManager import *
 from .JoinedEntityModel import *
\ No newline at end of file
@@ -0,0 +1,102 @@
+import argparse
+import os
+import tempfile
+import time
+
+from ..DatabaseManager import DatabaseManager
+from ..EntityManager import EntityManager
+from ..EntityModel import EntityModel
+from ..Tracer import SpanCollector
+from ..VoidLog import VoidLog
+
+# Times column access through get_value() / set_value() on plain and joined entities, and scans, with tracing off and on.
+# The "eager" column puts back the debug messages which were formatted on every column access and fetched row before tracing replaced them,
+# so that the cost of formatting them whether or not anything is logged can be compared with the current code.
+# Run from the directory containing the package: python -m <package>.benchmarks.entity_access
+
+class User(EntityModel):
+	pass
+
+# Formats the message EntityModel.value_accessor() used to log on every call.
+class EagerLoggingUser(EntityModel):
+	def value_accessor(self, column, self_alias, am_setting, new_value, depth):
+		self.get_relation_mgr().entity_log.debug("  "*depth + f"[{self_alias if self_alias is not None else self.get_relation_mgr().get_table_name()}] {column}{f" := {new_value}"}")
+		return super().value_accessor(column, self_alias, am_setting, new_value, depth)
+
+# Formats the per-row message the relation used to log while reading.
+def enable_eager_row_logging(relation):
+	hydrate_entity = relation.hydrate_entity
+	
+	def eager_hydrate_entity(entity_data, hydration_plan):
+		relation.entity_log.debug(str(dict(entity_data)))
+		return hydrate_entity(entity_data, hydration_plan)
+	
+	relation.hydrate_entity = eager_hydrate_entity
+
+def populate(db_mgr, rows):
+	conn = db_mgr.get_connection()
+	conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, created_on TIMESTAMP, updated_on TIMESTAMP, username VARCHAR, password VARCHAR, manager_id INTEGER)")
+	conn.executemany(
+		"INSERT INTO users (username, password, manager_id) VALUES (?, ?, ?)",
+		((f"user {i}", f"password {i}", i // 10 + 1) for i in range(rows))
+	)
+	conn.commit()
+	conn.close()
+
+# Returns the seconds per call of fn, over the given number of calls.
+def time_calls(fn, calls):
+	start = time.perf_counter()
+	for i in range(calls):
+		fn()
+	
+	return (time.perf_counter() - start) / calls
+
+def measure(entity_mgr, calls):
+	users = entity_mgr.with_table("users")
+	user = users.read(1)
+	joined_user = users.inner_join("users", left_key="manager_id", right_key="id", left_alias="u", right_alias="m").read_one_by_column("u.id", 1)
+	
+	timings = {}
+	timings["get_value"] = time_calls(lambda: user.get_value("username"), calls)
+	timings["set_value"] = time_calls(lambda: user.set_value("password", "changed"), calls)
+	timings["joined get_value"] = time_calls(lambda: joined_user.get_value("m.username"), calls)
+	
+	start = time.perf_counter()
+	rows = sum(1 for user in users.scan())
+	timings["scan per row"] = (time.perf_counter() - start) / rows
+	
+	timings["read"] = time_calls(lambda: users.read(1), max(1, calls // 100))
+	return timings
+
+def main():
+	parser = argparse.ArgumentParser(description="Cost of column access and reads, with the old eager debug logging, and with tracing off and on.")
+	parser.add_argument("--rows", type=int, default=100000)
+	parser.add_argument("--calls", type=int, default=200000)
+	args = parser.parse_args()
+	
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		db_mgr = DatabaseManager(os.path.join(tmp_dir, "entity_access.db"))
+		populate(db_mgr, args.rows)
+		
+		eager_mgr = EntityManager(db_mgr, VoidLog())
+		eager_mgr.manage_table("users", EagerLoggingUser)
+		enable_eager_row_logging(eager_mgr.with_table("users"))
+		
+		eager = measure(eager_mgr, args.calls)
+		
+		entity_mgr = EntityManager(db_mgr, VoidLog())
+		entity_mgr.manage_table("users", User)
+		
+		untraced = measure(entity_mgr, args.calls)
+		
+		entity_mgr.enable_tracing(SpanCollector())
+		traced = measure(entity_mgr, args.calls)
+		
+		db_mgr.close_pool()
+	
+	print(f"{'':<18} {'eager':>12} {'untraced':>12} {'traced':>12}")
+	for name in untraced:
+		print(f"{name:<18} {eager[name] * 1e9:>10.0f}ns {untraced[name] * 1e9:>10.0f}ns {traced[name] * 1e9:>10.0f}ns")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,71 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from ..DatabaseManager import DatabaseManager
+from ..EntityManager import EntityManager
+from ..EntityModel import EntityModel
+from ..VoidLog import VoidLog
+
+# Measures the memory held per resident entity, with columns in a __dict__ and in slots.
+# Run from the directory containing the package: python -m <package>.benchmarks.entity_memory
+
+class DictUser(EntityModel):
+	pass
+
+class CompactUser(EntityModel):
+	__slots__ = ()
+
+def populate(db_mgr, rows):
+	conn = db_mgr.get_connection()
+	conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, created_on TIMESTAMP, updated_on TIMESTAMP, username VARCHAR, password VARCHAR, email VARCHAR, score INTEGER, manager_id INTEGER)")
+	conn.executemany(
+		"INSERT INTO users (username, password, email, score, manager_id) VALUES (?, ?, ?, ?, ?)",
+		((f"user {i}", f"password {i}", f"user{i}@example.com", i, i // 10) for i in range(rows))
+	)
+	conn.commit()
+	conn.close()
+
+# Returns the bytes held per entity once every row is resident.
+def measure(db_mgr, entity_model, slotted):
+	entity_mgr = EntityManager(db_mgr, VoidLog())
+	entity_mgr.manage_table("users", entity_model, slotted=slotted)
+	users = entity_mgr.with_table("users")
+	
+	# Compile statements and the entity class before measuring.
+	next(users.scan(), None)
+	
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	
+	entities = list(users.scan())
+	
+	gc.collect()
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	
+	return (after - before) / len(entities)
+
+def main():
+	parser = argparse.ArgumentParser(description="Memory per resident entity.")
+	parser.add_argument("--rows", type=int, default=100000)
+	args = parser.parse_args()
+	
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		db_mgr = DatabaseManager(os.path.join(tmp_dir, "entity_memory.db"))
+		populate(db_mgr, args.rows)
+		
+		dict_bytes = measure(db_mgr, DictUser, False)
+		slotted_bytes = measure(db_mgr, CompactUser, True)
+		
+		db_mgr.close_pool()
+	
+	print(f"rows: {args.rows}")
+	print(f"__dict__ entities: {dict_bytes:.0f} bytes/row")
+	print(f"slotted entities:  {slotted_bytes:.0f} bytes/row ({slotted_bytes / dict_bytes:.0%})")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import time
+
+from ..DatabaseManager import DatabaseManager
+from ..EntityManager import EntityManager
+from ..EntityModel import EntityModel
+from ..VoidLog import VoidLog
+
+# Times small commits, one bulk insert and a full scan under each pragma profile.
+# Run from the directory containing the package: python -m <package>.benchmarks.pragma_profiles
+
+class User(EntityModel):
+	pass
+
+def create_schema(db_mgr):
+	with db_mgr.borrow_connection() as conn:
+		conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, created_on TIMESTAMP, updated_on TIMESTAMP, username VARCHAR, password VARCHAR, email VARCHAR, score INTEGER)")
+		conn.commit()
+
+def new_user(users, i):
+	user = users.new_blank_entity()
+	user.username = f"user {i}"
+	user.password = f"password {i}"
+	user.email = f"user{i}@example.com"
+	user.score = i
+	return user
+
+# Returns the seconds taken by each phase.
+def measure(db_path, profile_name, commits, rows):
+	db_mgr = DatabaseManager(db_path, pragma_profile=profile_name)
+	create_schema(db_mgr)
+	
+	entity_mgr = EntityManager(db_mgr, VoidLog())
+	entity_mgr.manage_table("users", User)
+	users = entity_mgr.with_table("users")
+	
+	timings = {}
+	
+	start = time.perf_counter()
+	for i in range(commits):
+		users.create(new_user(users, i))
+	timings["commits"] = time.perf_counter() - start
+	
+	start = time.perf_counter()
+	users.create_many(new_user(users, i) for i in range(rows))
+	timings["bulk"] = time.perf_counter() - start
+	
+	start = time.perf_counter()
+	for user in users.scan():
+		pass
+	timings["scan"] = time.perf_counter() - start
+	
+	db_mgr.close_pool()
+	return timings
+
+def main():
+	parser = argparse.ArgumentParser(description="Write and read throughput under each pragma profile.")
+	parser.add_argument("--commits", type=int, default=1000, help="Rows created with one commit each.")
+	parser.add_argument("--rows", type=int, default=100000, help="Rows created by one create_many().")
+	parser.add_argument("--profile", action="append", choices=sorted(DatabaseManager.pragma_profiles), help="Profiles to measure. Defaults to every profile which can write.")
+	args = parser.parse_args()
+	
+	profile_names = args.profile or [name for name in DatabaseManager.pragma_profiles if name != "read_replica"]
+	
+	print(f"{'profile':<12} {'commits/s':>10} {'bulk rows/s':>12} {'scan rows/s':>12}")
+	
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		for profile_name in profile_names:
+			timings = measure(os.path.join(tmp_dir, f"{profile_name}.db"), profile_name, args.commits, args.rows)
+			
+			print(f"{profile_name:<12} {args.commits / timings['commits']:>10.0f} {args.rows / timings['bulk']:>12.0f} {(args.commits + args.rows) / timings['scan']:>12.0f}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,369 @@
+import argparse
+from datetime import datetime, UTC
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from ..DatabaseManager import DatabaseManager
+from ..EntityManager import EntityManager
+from ..EntityModel import EntityModel
+from ..VoidLog import VoidLog
+
+# Times CRUD operations, joins, hydration and column access on synthetic users / projects / project_members tables, shaped like the test schema, at several sizes.
+# Results can be saved as a JSON baseline, and a later run compared against it, failing if any case got slower by more than the tolerance.
+# Run from the directory containing the package:
+#	python -m <package>.benchmarks.suite --scale 1000 --scale 100000 --output baseline.json
+#	python -m <package>.benchmarks.suite --scale 1000 --scale 100000 --compare baseline.json
+# By default, the users table is built at 1000, 10000 and 100000 rows. --full adds 1000000, which takes far longer to build and run.
+
+# Rows in the users table when no --scale is given, and those added by --full.
+default_scales = [1000, 10000, 100000]
+full_scales = [1000000]
+
+class User(EntityModel):
+	pass
+
+class Project(EntityModel):
+	pass
+
+class ProjectMember(EntityModel):
+	pass
+
+#### Dataset ####
+
+# Every user but the first is managed by one of the first tenth of users, so manager_id lookups match about ten rows.
+# There is a project per four users, with titles shared by about ten projects each, and a membership per user.
+def populate(db_mgr, scale, seed):
+	rng = random.Random(seed)
+	now = datetime(2001, 2, 2, 2, 22, 22).isoformat()
+	
+	project_count = max(1, scale // 4)
+	title_count = max(1, project_count // 10)
+	
+	conn = db_mgr.get_connection()
+	conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, created_on TIMESTAMP, updated_on TIMESTAMP, username VARCHAR, password VARCHAR, manager_id INTEGER)")
+	conn.execute("CREATE TABLE projects (id INTEGER PRIMARY KEY AUTOINCREMENT, created_on TIMESTAMP, updated_on TIMESTAMP, title VARCHAR(64), owner_id INTEGER)")
+	conn.execute("CREATE TABLE project_members (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, project_id)")
+	
+	conn.executemany(
+		"INSERT INTO users (id, created_on, updated_on, username, password, manager_id) VALUES (?, ?, ?, ?, ?, ?)",
+		((i, now, now, f"user {i}", f"password {i}", None if i == 1 else rng.randint(1, max(1, scale // 10))) for i in range(1, scale + 1))
+	)
+	conn.executemany(
+		"INSERT INTO projects (id, created_on, updated_on, title, owner_id) VALUES (?, ?, ?, ?, ?)",
+		((i, now, now, f"project {i % title_count}", rng.randint(1, scale)) for i in range(1, project_count + 1))
+	)
+	conn.executemany(
+		"INSERT INTO project_members (id, user_id, project_id) VALUES (?, ?, ?)",
+		((i, i, rng.randint(1, project_count)) for i in range(1, scale + 1))
+	)
+	
+	conn.commit()
+	conn.close()
+	
+	return {
+		"users": scale,
+		"projects": project_count,
+		"titles": title_count
+	}
+
+#### Cases ####
+
+# Each case runs some number of operations and returns that number. ctx holds the managers, the dataset's sizes, a seeded Random and the operation count.
+# Cases which scan a table on every operation run fewer of them on larger tables.
+
+def scanning_ops(ctx):
+	return max(3, min(ctx["ops"], ctx["ops"] * 1000 // ctx["sizes"]["users"]))
+
+def random_user_ids(ctx, count):
+	return [ctx["rng"].randint(1, ctx["sizes"]["users"]) for i in range(count)]
+
+def new_users(ctx, count):
+	users = ctx["users"]
+	
+	res = []
+	for i in range(count):
+		user = users.new_blank_entity()
+		user.username = f"created {i}"
+		user.password = "created"
+		res.append(user)
+	
+	return res
+
+def bench_create(ctx):
+	users = ctx["users"]
+	
+	with ctx["entity_mgr"].transaction():
+		for user in new_users(ctx, ctx["ops"]):
+			users.create(user)
+			ctx["created_ids"].append(user.id)
+	
+	return ctx["ops"]
+
+def bench_create_many(ctx):
+	created = ctx["users"].create_many(new_users(ctx, ctx["ops"] * 10))
+	ctx["created_ids"].extend(user.id for user in created)
+	return len(created)
+
+def bench_read(ctx):
+	users = ctx["users"]
+	for id in random_user_ids(ctx, ctx["ops"]):
+		users.read(id)
+	
+	return ctx["ops"]
+
+def bench_read_many(ctx):
+	ids = random_user_ids(ctx, ctx["ops"] * 10)
+	ctx["users"].read_many(ids)
+	return len(ids)
+
+def bench_read_by_column(ctx):
+	users = ctx["users"]
+	
+	ops = scanning_ops(ctx)
+	for i in range(ops):
+		users.read_by_column("manager_id", ctx["rng"].randint(1, max(1, ctx["sizes"]["users"] // 10)))
+	
+	return ops
+
+def bench_scan(ctx):
+	return sum(1 for user in ctx["users"].scan())
+
+def bench_update(ctx):
+	users = ctx["users"]
+	
+	with ctx["entity_mgr"].transaction():
+		for user in users.read_many(random_user_ids(ctx, ctx["ops"])):
+			user.password = "updated"
+			users.update(user)
+	
+	return ctx["ops"]
+
+def bench_update_many(ctx):
+	users = ctx["users"]
+	
+	entities = users.read_many(random_user_ids(ctx, ctx["ops"] * 10))
+	for user in entities:
+		user.password = "updated many"
+	
+	users.update_many(entities)
+	return len(entities)
+
+def bench_delete(ctx):
+	users = ctx["users"]
+	
+	# Everything create and create_many made, so that every repeat starts from the same tables.
+	ids = ctx["created_ids"]
+	ctx["created_ids"] = []
+	
+	with ctx["entity_mgr"].transaction():
+		for id in ids:
+			users.delete(id)
+	
+	return len(ids)
+
+def bench_join2(ctx):
+	ops = scanning_ops(ctx)
+	for i in range(ops):
+		ctx["join2"].read_by_column("title", f"project {ctx['rng'].randrange(ctx['sizes']['titles'])}")
+	
+	return ops
+
+def bench_join3(ctx):
+	ops = scanning_ops(ctx)
+	for i in range(ops):
+		ctx["join3"].read_by_column("projects.title", f"project {ctx['rng'].randrange(ctx['sizes']['titles'])}")
+	
+	return ops
+
+# The entities which to_dict and get_value cases are run on, one per join depth.
+def get_entities_by_depth(ctx):
+	if "entities_by_depth" not in ctx:
+		ctx["entities_by_depth"] = {
+			1: ctx["users"].read(1),
+			2: next(ctx["join2"].scan()),
+			3: next(ctx["join3"].scan())
+		}
+	
+	return ctx["entities_by_depth"]
+
+def bench_to_dict(depth):
+	def bench(ctx):
+		entity = get_entities_by_depth(ctx)[depth]
+		
+		calls = ctx["ops"] * 10
+		for i in range(calls):
+			entity.to_dict()
+		
+		return calls
+	
+	return bench
+
+def bench_get_value(depth, column_name):
+	def bench(ctx):
+		entity = get_entities_by_depth(ctx)[depth]
+		
+		calls = ctx["ops"] * 100
+		for i in range(calls):
+			entity.get_value(column_name)
+		
+		return calls
+	
+	return bench
+
+# In the order they run, which matters: delete removes the rows made by create and create_many, before the other cases see them.
+cases = {
+	"create": bench_create,
+	"create_many": bench_create_many,
+	"delete": bench_delete,
+	"read": bench_read,
+	"read_many": bench_read_many,
+	"read_by_column": bench_read_by_column,
+	"scan": bench_scan,
+	"update": bench_update,
+	"update_many": bench_update_many,
+	"join2 read_by_column": bench_join2,
+	"join3 read_by_column": bench_join3,
+	"to_dict depth 1": bench_to_dict(1),
+	"to_dict depth 2": bench_to_dict(2),
+	"to_dict depth 3": bench_to_dict(3),
+	"get_value depth 1": bench_get_value(1, "username"),
+	"get_value depth 2": bench_get_value(2, "title"),
+	"get_value depth 3": bench_get_value(3, "projects.title")
+}
+
+#### Running ####
+
+# Runs the selected cases repeat times each on one dataset of the given scale, and returns the fastest time per operation of each.
+def run_scale(scale, case_names, ops, repeat, seed):
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		db_mgr = DatabaseManager(os.path.join(tmp_dir, "suite.db"))
+		sizes = populate(db_mgr, scale, seed)
+		
+		entity_mgr = EntityManager(db_mgr, VoidLog())
+		entity_mgr.manage_table("users", User)
+		entity_mgr.manage_table("projects", Project)
+		entity_mgr.manage_table("project_members", ProjectMember)
+		
+		users = entity_mgr.with_table("users")
+		
+		ctx = {
+			"entity_mgr": entity_mgr,
+			"users": users,
+			"join2": users.inner_join("projects", left_key="id", right_key="owner_id"),
+			"join3": users.inner_join("project_members", left_key="id", right_key="user_id", left_alias="u").inner_join("projects", left_key="project_id", right_key="id"),
+			"sizes": sizes,
+			"rng": random.Random(seed),
+			"ops": ops,
+			"created_ids": []
+		}
+		
+		res = {}
+		for attempt in range(repeat):
+			for case_name in case_names:
+				start = time.perf_counter()
+				case_ops = cases[case_name](ctx)
+				seconds = time.perf_counter() - start
+				
+				per_op = seconds / max(1, case_ops)
+				if case_name not in res or per_op < res[case_name]["per_op"]:
+					res[case_name] = {
+						"ops": case_ops,
+						"seconds": seconds,
+						"per_op": per_op
+					}
+		
+		db_mgr.close_pool()
+	
+	return res
+
+def get_environment():
+	return {
+		"python": platform.python_version(),
+		"sqlite": sqlite3.sqlite_version,
+		"platform": platform.platform(),
+		"date": datetime.now(UTC).isoformat()
+	}
+
+# Compares the per-operation times of results against a baseline, and returns a list of (scale, case, baseline per_op, per_op, ratio, verdict).
+# verdict is "regressed" if the case got slower by more than tolerance, "improved" if it got faster by more than tolerance, and "ok" otherwise.
+def compare(baseline, results, tolerance):
+	res = []
+	for scale, scale_results in results.items():
+		baseline_results = baseline.get(scale, {})
+		
+		for case_name, case_result in scale_results.items():
+			if case_name not in baseline_results:
+				continue
+			
+			baseline_per_op = baseline_results[case_name]["per_op"]
+			ratio = case_result["per_op"] / baseline_per_op if baseline_per_op > 0 else float("inf")
+			
+			if ratio > 1 + tolerance:
+				verdict = "regressed"
+			elif ratio < 1 - tolerance:
+				verdict = "improved"
+			else:
+				verdict = "ok"
+			
+			res.append((scale, case_name, baseline_per_op, case_result["per_op"], ratio, verdict))
+	
+	return res
+
+def format_duration(seconds):
+	if seconds < 1e-3:
+		return f"{seconds * 1e6:.2f}us"
+	
+	return f"{seconds * 1e3:.2f}ms"
+
+def main():
+	parser = argparse.ArgumentParser(description="Throughput of CRUD operations, joins, hydration and column access.")
+	parser.add_argument("--scale", type=int, action="append", help="Rows in the users table. May be given several times. Defaults to 1000, 10000 and 100000, or with --full, 1000 to 1000000.")
+	parser.add_argument("--full", action="store_true", help="Run the default scales and 1000000.")
+	parser.add_argument("--case", action="append", choices=list(cases), help="Cases to run. Defaults to every case.")
+	parser.add_argument("--ops", type=int, default=1000, help="Operations per case, scaled up for cheap cases and down for those which scan a table.")
+	parser.add_argument("--repeat", type=int, default=3, help="Runs of each case. The fastest is kept.")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="Write the results to this JSON file, for use as a baseline.")
+	parser.add_argument("--compare", help="Compare against a baseline JSON file written with --output, and exit with status 1 if any case regressed.")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction by which a case may be slower than the baseline before it counts as a regression.")
+	args = parser.parse_args()
+	
+	scales = args.scale or default_scales
+	if args.full:
+		scales = list(dict.fromkeys(scales + full_scales))
+	case_names = [case_name for case_name in cases if args.case is None or case_name in args.case]
+	
+	results = {}
+	for scale in scales:
+		scale_results = run_scale(scale, case_names, args.ops, args.repeat, args.seed)
+		results[str(scale)] = scale_results
+		
+		print(f"scale {scale}")
+		for case_name, case_result in scale_results.items():
+			print(f"  {case_name:<22} {format_duration(case_result['per_op']):>10}/op {1 / case_result['per_op'] if case_result['per_op'] > 0 else float('inf'):>12.0f} ops/s")
+	
+	if args.output is not None:
+		with open(args.output, "w") as output_file:
+			json.dump({"environment": get_environment(), "results": results}, output_file, indent="\t")
+	
+	if args.compare is not None:
+		with open(args.compare, "r") as baseline_file:
+			baseline = json.load(baseline_file)
+		
+		comparison = compare(baseline["results"], results, args.tolerance)
+		
+		print(f"compared with {args.compare} ({baseline['environment']['date']}), tolerance {args.tolerance:.0%}")
+		for scale, case_name, baseline_per_op, per_op, ratio, verdict in comparison:
+			print(f"  {scale:>8} {case_name:<22} {format_duration(baseline_per_op):>10} -> {format_duration(per_op):>10} {ratio:>6.2f}x {verdict}")
+		
+		if any(verdict == "regressed" for *rest, verdict in comparison):
+			sys.exit(1)
+
+if __name__ == "__main__":
+	main()
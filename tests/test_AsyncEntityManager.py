@@ -0,0 +1,106 @@
+import asyncio
+from contextlib import aclosing
+import pytest
+import time
+
+from ..AsyncEntityManager import AsyncEntityManager
+
+def test_async_crud(dummy_structured_entity_mgr):
+	async_entity_mgr = AsyncEntityManager(dummy_structured_entity_mgr)
+	users = async_entity_mgr.with_table("users")
+	
+	async def crud():
+		new_user = users.new_blank_entity()
+		new_user.username = "async user"
+		new_user = await users.create(new_user)
+		
+		read_user = await users.read(new_user.id)
+		assert read_user.username == "async user"
+		
+		read_user.password = "async password"
+		await users.update(read_user)
+		assert (await users.read_one_by_column("username", "async user")).password == "async password"
+		
+		owner = await users.inner_join("projects", left_key="id", right_key="owner_id").read_one_by_column("title", "ekobadds project")
+		assert owner.username == "ekobadd"
+		
+		read_users = await asyncio.gather(*(users.read_one_by_column("username", username) for username in ["big boss", "lil boss", "ekobadd"]))
+		assert [read_user.username for read_user in read_users] == ["big boss", "lil boss", "ekobadd"]
+		
+		await users.delete(new_user.id)
+		assert await users.read(new_user.id) is None
+	
+	asyncio.run(crud())
+	async_entity_mgr.close()
+
+def test_async_iteration(dummy_structured_entity_mgr):
+	async_entity_mgr = AsyncEntityManager(dummy_structured_entity_mgr)
+	users = async_entity_mgr.with_table("users")
+	
+	async def iterate():
+		usernames = [user.username async for user in users.scan(batch_size=2)]
+		assert usernames == [user.username for user in dummy_structured_entity_mgr.with_table("users").scan()]
+		
+		async with aclosing(users.iter_by_column("username", ["big boss", "lil boss", "ekobadd"], batch_size=1)) as read_users:
+			async for read_user in read_users:
+				assert read_user.username == "big boss"
+				break
+	
+	asyncio.run(iterate())
+	async_entity_mgr.close()
+
+def test_async_transaction(dummy_structured_entity_mgr):
+	async_entity_mgr = AsyncEntityManager(dummy_structured_entity_mgr)
+	users = async_entity_mgr.with_table("users")
+	
+	async def rename(username, new_username):
+		read_user = await users.read_one_by_column("username", username)
+		read_user.username = new_username
+		await users.update(read_user)
+	
+	async def transactions():
+		async with async_entity_mgr.transaction() as transaction:
+			await asyncio.gather(rename("big boss", "biggest boss"), rename("lil boss", "littlest boss"))
+			
+			async with async_entity_mgr.transaction() as nested_transaction:
+				assert nested_transaction is transaction
+			
+			assert await async_entity_mgr.run(dummy_structured_entity_mgr.current_transaction) is transaction
+		
+		assert (await users.read_one_or_none_by_column("username", "biggest boss")) is not None
+		
+		with pytest.raises(RuntimeError):
+			async with async_entity_mgr.transaction():
+				await rename("ekobadd", "rolled back")
+				raise RuntimeError("Abort!")
+		
+		assert (await users.read_one_or_none_by_column("username", "rolled back")) is None
+		assert (await users.read_one_or_none_by_column("username", "littlest boss")) is not None
+	
+	asyncio.run(transactions())
+	async_entity_mgr.close()
+
+def test_async_does_not_block_event_loop(dummy_structured_entity_mgr):
+	async_entity_mgr = AsyncEntityManager(dummy_structured_entity_mgr)
+	
+	async def measure_lag():
+		gaps = []
+		stop = asyncio.Event()
+		
+		async def tick():
+			last = time.perf_counter()
+			while not stop.is_set():
+				await asyncio.sleep(0.005)
+				now = time.perf_counter()
+				gaps.append(now - last)
+				last = now
+		
+		ticker = asyncio.create_task(tick())
+		await asyncio.gather(*(async_entity_mgr.run(time.sleep, 0.1) for i in range(8)))
+		stop.set()
+		await ticker
+		
+		return max(gaps)
+	
+	assert asyncio.run(measure_lag()) < 0.08
+	async_entity_mgr.close()
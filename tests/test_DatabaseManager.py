@@ -1,6 +1,10 @@
 from datetime import datetime
+import pytest
+import sqlite3
 import uuid
 
+from ..DatabaseManager import DatabaseManager, _live_db_mgrs, _reset_pools_after_fork
+
 def test_datetime_conversion(dummy_structured_database_mgr):
 	db_mgr = dummy_structured_database_mgr
 	
@@ -43,4 +47,176 @@ def test_uuid_conversion(dummy_structured_database_mgr):
 	assert entity_data["uuid_of"] == uuid_value
 	
 	conn.commit()
-	conn.close()
\ No newline at end of file
+	conn.close()
+
+def test_pool_reuses_connections(db_mgr):
+	with db_mgr.borrow_connection() as conn:
+		first_conn = conn
+	
+	with db_mgr.borrow_connection() as conn:
+		assert conn is first_conn
+	
+	stats = db_mgr.pool_stats()
+	assert stats["created"] == 1
+	assert stats["reused"] == 1
+	assert stats["checked_out"] == 0
+	assert stats["idle"] == 1
+
+def test_pool_read_only_connections(dummy_structured_database_mgr):
+	db_mgr = dummy_structured_database_mgr
+	
+	with db_mgr.borrow_connection(read_only=True) as conn:
+		read_only_conn = conn
+		assert conn.execute("SELECT COUNT(*) FROM stuff").fetchone()[0] == 0
+		
+		with pytest.raises(sqlite3.OperationalError):
+			conn.execute("INSERT INTO stuff (date_of) VALUES (NULL)")
+	
+	with db_mgr.borrow_connection() as conn:
+		assert conn is not read_only_conn
+	
+	with db_mgr.borrow_connection(read_only=True) as conn:
+		assert conn is read_only_conn
+	
+	stats = db_mgr.pool_stats()
+	assert stats["idle"] == 1
+	assert stats["idle_read_only"] == 1
+
+def test_pool_size_limits_idle_connections(tmpdir):
+	db_mgr = DatabaseManager(tmpdir + "pool_size.db", pool_size=1)
+	
+	with db_mgr.borrow_connection() as conn1:
+		with db_mgr.borrow_connection() as conn2:
+			assert conn1 is not conn2
+			assert db_mgr.pool_stats()["checked_out"] == 2
+	
+	stats = db_mgr.pool_stats()
+	assert stats["idle"] == 1
+	assert stats["discarded"] == 1
+
+def test_pool_thread_affinity(db_mgr):
+	import threading
+	
+	main_conn = db_mgr.acquire_connection()
+	
+	thread_conns = []
+	thread = threading.Thread(target=lambda: thread_conns.append(db_mgr.acquire_connection()))
+	thread.start()
+	thread.join()
+	
+	# The other thread's connection is released last, so it sits on top of the idle list.
+	db_mgr.release_connection(main_conn)
+	db_mgr.release_connection(thread_conns[0])
+	
+	with db_mgr.borrow_connection() as conn:
+		assert conn is main_conn
+
+def test_pool_health_check(tmpdir):
+	db_mgr = DatabaseManager(tmpdir + "health_check.db", health_check_interval=0)
+	
+	with db_mgr.borrow_connection() as conn:
+		broken_conn = conn
+	
+	broken_conn.close()
+	
+	with db_mgr.borrow_connection() as conn:
+		assert conn is not broken_conn
+		assert conn.execute("SELECT 1").fetchone()[0] == 1
+	
+	assert db_mgr.pool_stats()["health_check_failures"] == 1
+
+def test_pool_rolls_back_on_release(dummy_structured_database_mgr):
+	db_mgr = dummy_structured_database_mgr
+	
+	with db_mgr.borrow_connection() as conn:
+		conn.execute("INSERT INTO stuff (date_of) VALUES (?)", (datetime(2001, 2, 2),))
+	
+	with db_mgr.borrow_connection() as conn:
+		assert conn.execute("SELECT COUNT(*) FROM stuff").fetchone()[0] == 0
+
+def test_pool_discards_connections_from_before_fork(db_mgr):
+	import os
+	
+	conn = db_mgr.acquire_connection()
+	with db_mgr.borrow_connection():
+		pass
+	
+	# Simulate the child side of a fork.
+	db_mgr._reset_pool_after_fork()
+	conn.owner_pid = os.getpid() + 1
+	db_mgr.release_connection(conn)
+	
+	stats = db_mgr.pool_stats()
+	assert stats["idle"] == 0
+	assert stats["fork_resets"] == 1
+
+def test_fork_hook_resets_live_managers_only(db_mgr, tmpdir):
+	import gc
+	
+	other_db_mgr = DatabaseManager(tmpdir + "other.db")
+	assert db_mgr in _live_db_mgrs
+	assert other_db_mgr in _live_db_mgrs
+	
+	# The hook does not keep managers alive.
+	del other_db_mgr
+	gc.collect()
+	assert len([mgr for mgr in _live_db_mgrs if mgr.db_conn_str == tmpdir + "other.db"]) == 0
+	
+	_reset_pools_after_fork()
+	assert db_mgr.pool_stats()["fork_resets"] == 1
+
+def test_identifier_validation_is_memoized(db_mgr):
+	db_mgr.validate_sql_identifiers(["users", "username"])
+	assert "users" in db_mgr.validated_identifiers
+	assert "username" in db_mgr.validated_identifiers
+	
+	with pytest.raises(ValueError):
+		db_mgr.validate_sql_identifiers(["users", "user name"])
+	
+	assert "user name" not in db_mgr.validated_identifiers
+
+def test_run_script_reports_schema_change(db_mgr):
+	import io
+	
+	generation = db_mgr.schema_generation
+	db_mgr.run_script(io.StringIO("CREATE TABLE things (id INTEGER PRIMARY KEY);"))
+	
+	assert db_mgr.schema_generation == generation + 1
+
+def test_foreign_keys_are_enforced(db_mgr):
+	with db_mgr.borrow_connection() as conn:
+		assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+		
+		conn.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+		conn.execute("CREATE TABLE children (id INTEGER PRIMARY KEY, parent_id INTEGER REFERENCES parents (id))")
+		
+		with pytest.raises(sqlite3.IntegrityError):
+			conn.execute("INSERT INTO children (parent_id) VALUES (1)")
+
+def test_pragma_profiles(tmpdir):
+	with pytest.raises(ValueError):
+		DatabaseManager(tmpdir + "pragmas.db", pragma_profile="reckless")
+	
+	db_mgr = DatabaseManager(tmpdir + "pragmas.db", pragma_profile="throughput")
+	
+	with db_mgr.borrow_connection() as conn:
+		first_conn = conn
+		assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+		assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+		assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+	
+	with db_mgr.using_pragma_profile("bulk_load"):
+		with db_mgr.borrow_connection() as conn:
+			assert conn is first_conn
+			assert conn.execute("PRAGMA synchronous").fetchone()[0] == 0
+			assert conn.execute("PRAGMA cache_size").fetchone()[0] == -256000
+	
+	# Switched back on the next acquire.
+	with db_mgr.borrow_connection() as conn:
+		assert conn is first_conn
+		assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+		assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+	
+	with db_mgr.borrow_connection(read_only=True) as conn:
+		assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+		assert conn.execute("PRAGMA cache_size").fetchone()[0] == -64000
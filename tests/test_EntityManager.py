@@ -1,6 +1,15 @@
+from array import array
+from datetime import datetime
 import pytest
+import sqlite3
+import sys
+from uuid import uuid4
 
-from ..ColumnIdentifier import ReadResultError
+from ..ColumnBuffer import ColumnBuffer
+from ..ColumnIdentifier import ColumnIdentifier, ColumnRetrievalError, ReadResultError
+from ..EntityManager import EntityManager
+from ..EntityModel import EntityModel
+from ..Tracer import LoggingSpanSink, SpanCollector
 
 def test_identifier_validation(db_mgr):
 	db_mgr.validate_sql_identifiers("_1aAzZ_0")
@@ -109,6 +118,20 @@ def test_update(dummy_structured_entity_mgr):
 	assert new_read_user.username == "not ekobadd"
 	assert new_read_user.password == "not password123"
 
+def test_update_needs_mark_dirty_when_bypassing_setattr(dummy_structured_entity_mgr):
+	users = dummy_structured_entity_mgr.with_table("users")
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	object.__setattr__(read_user, "password", "untracked")
+	
+	# Nothing was marked dirty, so nothing is written.
+	assert users.update(read_user) is read_user
+	assert users.read(read_user.id).password == "password123"
+	
+	read_user.mark_dirty("password")
+	users.update(read_user)
+	assert users.read(read_user.id).password == "untracked"
+
 def test_entity_context_manager(dummy_structured_entity_mgr):
 	entity_mgr = dummy_structured_entity_mgr
 	
@@ -292,6 +315,35 @@ def test_double_join(dummy_structured_entity_mgr):
 	assert users_project_member.project_id == new_project.id
 	assert users_project_member.title == "New Project"
 
+def test_double_join_to_dict(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	new_user = entity_mgr.with_table("users").new_blank_entity()
+	new_user.username = "member"
+	new_user.password = "member123"
+	entity_mgr.with_table("users").create(new_user)
+	
+	new_project = entity_mgr.with_table("projects").new_blank_entity()
+	new_project.title = "New Project"
+	entity_mgr.with_table("projects").create(new_project)
+	
+	new_project_member = entity_mgr.with_table("project_members").new_blank_entity()
+	new_project_member.user_id = new_user.id
+	new_project_member.project_id = new_project.id
+	entity_mgr.with_table("project_members").create(new_project_member)
+	
+	users_project_member = entity_mgr.with_table("users"
+		).inner_join("project_members", left_key="id", right_key="user_id", left_alias="u"
+		).inner_join("projects", left_key="project_id", right_key="id"
+	).read_one_by_column("u.id", new_user.id)
+	
+	# Tables nested in the left join are listed alongside the others.
+	res = users_project_member.to_dict()
+	assert res.keys() == {"u", "project_members", "projects"}
+	assert res["u"]["username"] == "member"
+	assert res["project_members"]["project_id"] == new_project.id
+	assert res["projects"]["title"] == "New Project"
+
 def test_no_alias_joined_relation(dummy_structured_entity_mgr):
 	entity_mgr = dummy_structured_entity_mgr
 	
@@ -358,7 +410,1282 @@ def test_aliased_joined_to_dict(dummy_structured_entity_mgr):
 			assert read_project_user.get_value(f"{tbl_key}.{col_key}") == dict_project_user[tbl_key][col_key]
 	
 
+def test_transaction_commits_once(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	with entity_mgr.transaction():
+		for i in range(5):
+			with users.new_blank_entity() as new_user:
+				new_user.username = f"batched {i}"
+		
+		# Not visible to other connections until the transaction commits.
+		conn = entity_mgr.db_mgr.get_connection()
+		assert conn.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'batched %'").fetchone()[0] == 0
+		conn.close()
+		
+		# But visible through the transaction itself.
+		assert len(users.read_by_column("username", "batched 3")) == 1
+	
+	conn = entity_mgr.db_mgr.get_connection()
+	assert conn.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'batched %'").fetchone()[0] == 5
+	conn.close()
+
+def test_transaction_rolls_back(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	with pytest.raises(RuntimeError):
+		with entity_mgr.transaction():
+			new_user = users.new_blank_entity()
+			new_user.username = "rolled back"
+			users.create(new_user)
+			
+			read_user = users.read_one_by_column("username", "ekobadd")
+			read_user.username = "renamed"
+			users.update(read_user)
+			
+			raise RuntimeError("Abort!")
+	
+	assert entity_mgr.current_transaction() is None
+	assert users.read_by_column("username", "rolled back") == []
+	assert users.read_by_column("username", "renamed") == []
+	assert len(users.read_by_column("username", "ekobadd")) == 1
+
+def test_transaction_rolls_back_failed_queued_update(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	projects = entity_mgr.with_table("projects")
+	
+	assert users.ensure_index("username", unique=True) is not None
+	
+	with pytest.raises(sqlite3.IntegrityError, match="'users' id"):
+		with entity_mgr.transaction():
+			project = projects.read_one_by_column("title", "ekobadds project")
+			project.title = "renamed project"
+			projects.update(project)
+			
+			new_user = users.new_blank_entity()
+			new_user.username = "rolled back"
+			users.create(new_user)
+			
+			# Queued, and only fails when flushed at commit.
+			read_user = users.read_one_by_column("username", "ekofren")
+			read_user.username = "ekobadd"
+			assert users.update(read_user) is read_user
+	
+	assert entity_mgr.current_transaction() is None
+	assert projects.read_by_column("title", "renamed project") == []
+	assert len(projects.read_by_column("title", "ekobadds project")) == 1
+	assert users.read_by_column("username", "rolled back") == []
+	assert len(users.read_by_column("username", "ekofren")) == 1
+
+def test_transaction_rollback_marks_flushed_entities_dirty(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	
+	with pytest.raises(RuntimeError):
+		with entity_mgr.transaction():
+			read_user.username = "zzz"
+			users.update(read_user)
+			
+			# Flushes the queued update, which marks the entity clean.
+			users.read(read_user.id)
+			assert not read_user.is_dirty()
+			
+			raise RuntimeError("Abort!")
+	
+	assert users.read(read_user.id).username == "ekobadd"
+	assert read_user.get_dirty_columns() >= {"username"}
+	
+	users.update(read_user)
+	assert users.read(read_user.id).username == "zzz"
+
+def test_transaction_queues_updates(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	with entity_mgr.transaction() as transaction:
+		with users.read_one_by_column("username", "ekobadd") as read_user:
+			read_user.password = "first"
+		
+		with read_user:
+			read_user.password = "second"
+		
+		# Both context manager exits queue the same entity once.
+		assert len(transaction.pending_updates) == 1
+		
+		# Reads flush the queue first.
+		assert users.read(read_user.id).password == "second"
+		assert len(transaction.pending_updates) == 0
+		
+		# Nested scopes join the outer one.
+		with entity_mgr.transaction() as inner_transaction:
+			assert inner_transaction is transaction
+		
+		read_user.password = "third"
+		users.update(read_user)
+	
+	assert users.read(read_user.id).password == "third"
+
+def test_create_many(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	new_users = []
+	for i in range(25):
+		new_user = users.new_blank_entity()
+		new_user.username = f"bulk {i}"
+		
+		# Two different column sets.
+		if i % 2 == 0:
+			new_user.password = f"password {i}"
+		
+		new_users.append(new_user)
+	
+	created_users = users.create_many(new_users)
+	
+	assert created_users == new_users
+	assert len(set(new_user.id for new_user in new_users)) == 25
+	assert len(set(new_user.created_on for new_user in new_users)) == 1
+	
+	for i, new_user in enumerate(new_users):
+		read_user = users.read(new_user.id)
+		assert read_user.username == f"bulk {i}"
+		assert read_user.password == (f"password {i}" if i % 2 == 0 else None)
+
+def test_create_many_chunks_and_reports_failures(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	users.max_rows_per_insert = 4
+	
+	existing_user = users.read_one_by_column("username", "ekobadd")
+	
+	new_users = []
+	for i in range(10):
+		new_user = users.new_blank_entity()
+		new_user.username = f"chunked {i}"
+		new_users.append(new_user)
+	
+	# Collides with an existing primary key.
+	duplicate_user = users.new_blank_entity()
+	duplicate_user.id = existing_user.id
+	duplicate_user.username = "duplicate"
+	new_users.append(duplicate_user)
+	
+	created_users = users.create_many(new_users)
+	
+	assert created_users[:10] == new_users[:10]
+	assert created_users[10] is None
+	
+	for i in range(10):
+		assert users.read(new_users[i].id).username == f"chunked {i}"
+	
+	assert users.read(existing_user.id).username == "ekobadd"
+
+def test_update_many(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	projects = entity_mgr.with_table("projects")
+	
+	read_projects = projects.read_by_column("title", "duped title")
+	for i, read_project in enumerate(read_projects):
+		read_project.title = f"deduped title {i}"
+	
+	updated_projects = projects.update_many(read_projects)
+	assert updated_projects == read_projects
+	
+	for i, read_project in enumerate(read_projects):
+		assert projects.read(read_project.id).title == f"deduped title {i}"
+	
+	with pytest.raises(RuntimeError):
+		projects.update_many([projects.new_blank_entity()])
+
+def test_update_many_raises_when_flushing(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	assert users.ensure_index("username", unique=True) is not None
+	
+	# Both updates are flushed in one update_many(), which would otherwise write the good one and report the bad one.
+	with pytest.raises(sqlite3.IntegrityError, match="UNIQUE"):
+		with entity_mgr.transaction():
+			good_user = users.read_one_by_column("username", "wagie :(")
+			bad_user = users.read_one_by_column("username", "ekofren")
+			
+			good_user.username = "promoted"
+			users.update(good_user)
+			
+			bad_user.username = "ekobadd"
+			users.update(bad_user)
+	
+	assert users.read_by_column("username", "promoted") == []
+	assert len(users.read_by_column("username", "ekofren")) == 1
+
+def test_update_many_reports_failures(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR UNIQUE)")
+	conn.execute("INSERT INTO tags (name) VALUES ('a'), ('b'), ('c')")
+	conn.commit()
+	conn.close()
+	
+	class Tag(EntityModel):
+		pass
+	
+	entity_mgr.manage_table("tags", Tag)
+	tags = entity_mgr.with_table("tags")
+	
+	tag_a = tags.read_one_by_column("name", "a")
+	tag_b = tags.read_one_by_column("name", "b")
+	tag_c = tags.read_one_by_column("name", "c")
+	
+	tag_a.name = "x"
+	tag_b.name = "c" # Violates UNIQUE.
+	tag_c.name = "z"
+	
+	assert tags.update_many([tag_a, tag_b, tag_c]) == [tag_a, None, tag_c]
+	
+	assert tags.read(tag_a.id).name == "x"
+	assert tags.read(tag_b.id).name == "b"
+	assert tags.read(tag_c.id).name == "z"
+
+def test_update_where(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	projects = entity_mgr.with_table("projects")
+	
+	assert projects.update_where("title", "duped title", title="renamed title") == 2
+	assert len(projects.read_by_column("title", "renamed title")) == 2
+	assert all(project.updated_on is not None for project in projects.read_by_column("title", "renamed title"))
+	
+	# IN matching.
+	assert projects.update_where("title", ["renamed title", "ekobadds project"], owner_id=None) == 3
+	assert projects.update_where("title", [], owner_id=None) == 0
+	assert projects.update_where("title", "nonexistent title", owner_id=None) == 0
+	
+	with pytest.raises(ValueError):
+		projects.update_where("title", "renamed title")
+	
+	with pytest.raises(ValueError):
+		projects.update_where("title", "renamed title", id=5)
+	
+	with pytest.raises(AttributeError):
+		projects.update_where("title", "renamed title", nonexistent_column=5)
+	
+	# updated_on is not overwritten when assigned in another case.
+	updated_on = datetime(2001, 2, 2)
+	assert projects.update_where("title", "renamed title", Updated_On=updated_on) == 2
+	assert all(project.updated_on == updated_on for project in projects.read_by_column("title", "renamed title"))
+	
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("CREATE TRIGGER protect_titles BEFORE UPDATE ON projects WHEN NEW.title = 'protected' BEGIN SELECT RAISE(ABORT, 'protected'); END")
+	conn.commit()
+	conn.close()
+	
+	assert projects.update_where("title", "renamed title", title="protected") is None
+	assert len(projects.read_by_column("title", "renamed title")) == 2
+
+def test_delete_where(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	assert users.delete_where("username", "ekobadd") == 1
+	assert users.read_by_column("username", "ekobadd") == []
+	
+	assert users.delete_where("users.username", ["big boss", "lil boss", "nobody"]) == 2
+	assert users.read_by_column("username", "big boss") == []
+	assert users.read_by_column("username", "lil boss") == []
+	
+	assert users.delete_where("username", "nobody") == 0
+	
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("CREATE TRIGGER protect_users BEFORE DELETE ON users WHEN OLD.username = 'ekofren' BEGIN SELECT RAISE(ABORT, 'protected'); END")
+	conn.commit()
+	conn.close()
+	
+	assert users.delete_where("username", "ekofren") is None
+	assert len(users.read_by_column("username", "ekofren")) == 1
+
+def test_joined_update_where_and_delete_where(dummy_structured_entity_mgr):
+	joined = dummy_structured_entity_mgr.with_table("users").inner_join("projects", left_key="id", right_key="owner_id")
+	
+	with pytest.raises(RuntimeError, match="update_where"):
+		joined.update_where("title", "ekobadds project", title="renamed")
+	
+	with pytest.raises(RuntimeError, match="delete_where"):
+		joined.delete_where("title", "ekobadds project")
+
+def test_read_many(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	ekobadd = users.read_one_by_column("username", "ekobadd")
+	ekofren = users.read_one_by_column("username", "ekofren")
+	
+	read_users = users.read_many([ekofren.id, 9999, ekobadd.id, ekofren.id])
+	
+	assert read_users[0].username == "ekofren"
+	assert read_users[1] is None
+	assert read_users[2].username == "ekobadd"
+	assert read_users[3].username == "ekofren"
+	
+	assert users.read_many([]) == []
+
+def test_read_many_chunks(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	new_users = []
+	for i in range(50):
+		new_user = users.new_blank_entity()
+		new_user.username = f"many {i}"
+		new_users.append(new_user)
+	
+	users.create_many(new_users)
+	
+	with entity_mgr.transaction() as transaction:
+		transaction.conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 7)
+		
+		read_users = users.read_many([new_user.id for new_user in reversed(new_users)])
+	
+	assert [read_user.username for read_user in read_users] == [f"many {i}" for i in reversed(range(50))]
+
+def test_joined_read_many(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	lilboss = users.read_one_by_column("username", "lil boss")
+	wagie = users.read_one_by_column("username", "wagie :(")
+	
+	managed_users = users.inner_join("users",
+		left_key="id", right_key="manager_id", left_alias="m", right_alias="u"
+	)
+	
+	read_managed_users = managed_users.read_many([wagie.id, 9999, lilboss.id], "u.id")
+	
+	assert read_managed_users[0].m.username == "lil boss"
+	assert read_managed_users[1] is None
+	assert read_managed_users[2].m.username == "big boss"
+	
+	# The manager side is not unique.
+	big_boss = users.read_one_by_column("username", "big boss")
+	
+	new_user = users.new_blank_entity()
+	new_user.username = "another lil boss"
+	new_user.manager_id = big_boss.id
+	users.create(new_user)
+	
+	with pytest.raises(ReadResultError):
+		users.inner_join("users", left_key="manager_id", right_key="id", left_alias="u", right_alias="m").read_many([big_boss.id, lilboss.id], "m.id")
+
+def test_read_by_column_list(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	read_users = users.read_by_column("username", ["ekobadd", "ekofren", "nobody"])
+	assert sorted(read_user.username for read_user in read_users) == ["ekobadd", "ekofren"]
+	
+	assert users.read_by_column("username", []) == []
+	assert users.read_one_or_none_by_column("username", ("ekobadd", "nobody")).username == "ekobadd"
+	
+	with pytest.raises(ReadResultError):
+		users.read_one_or_none_by_column("username", {"ekobadd", "ekofren"})
+
+def test_read_by_column_long_list(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	users.max_inline_values = 3
+	
+	usernames = ["ekobadd", "ekofren", "big boss"] + [f"nobody {i}" for i in range(1000)]
+	
+	# Outside and inside of a transaction, since the temporary table is only committed outside of one.
+	read_users = users.read_by_column("username", usernames)
+	assert sorted(read_user.username for read_user in read_users) == ["big boss", "ekobadd", "ekofren"]
+	
+	with entity_mgr.transaction():
+		read_users = users.read_by_column("username", usernames)
+		assert sorted(read_user.username for read_user in read_users) == ["big boss", "ekobadd", "ekofren"]
+	
+	read_users = users.read_by_column("username", usernames)
+	assert len(read_users) == 3
+	
+	# The temporary table is emptied after each query.
+	with entity_mgr.db_mgr.borrow_connection() as conn:
+		assert conn.execute("SELECT COUNT(*) FROM temp.entity_match_values").fetchone()[0] == 0
+	
+	assert users.update_where("username", usernames, password="reset") == 3
+	assert users.delete_where("username", usernames) == 3
+
+def test_joined_read_by_column_list(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	users_projects = entity_mgr.with_table("users").inner_join("projects",
+		left_key="id", right_key="owner_id", left_alias="u", right_alias="p"
+	)
+	users_projects.max_inline_values = 1
+	
+	read_users_projects = users_projects.read_by_column("p.title", ["ekobadds project", "duped title"])
+	assert sorted(read_user_project.u.username for read_user_project in read_users_projects) == ["dupe title owner", "dupe title owner", "ekobadd"]
+
+def test_iter_by_column(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	projects = entity_mgr.with_table("projects")
+	
+	read_projects = projects.iter_by_column("title", "duped title", batch_size=1)
+	
+	# Nothing is read until the first next().
+	assert entity_mgr.db_mgr.pool_stats()["checked_out"] == 0
+	
+	assert next(read_projects).title == "duped title"
+	assert entity_mgr.db_mgr.pool_stats()["checked_out"] == 1
+	
+	assert next(read_projects).title == "duped title"
+	
+	with pytest.raises(StopIteration):
+		next(read_projects)
+	
+	assert entity_mgr.db_mgr.pool_stats()["checked_out"] == 0
+	
+	with pytest.raises(AttributeError):
+		projects.iter_by_column("nonexistent_column", 1)
+	
+	with pytest.raises(ValueError):
+		next(projects.iter_by_column("title", "duped title", batch_size=0))
+
+def test_scan(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	usernames = [read_user.username for read_user in users.scan(batch_size=2)]
+	assert len(usernames) == 6
+	assert "ekobadd" in usernames
+	
+	# Closing an unfinished scan releases its connection.
+	scanned_users = users.scan(batch_size=2)
+	next(scanned_users)
+	assert entity_mgr.db_mgr.pool_stats()["checked_out"] == 1
+	
+	scanned_users.close()
+	assert entity_mgr.db_mgr.pool_stats()["checked_out"] == 0
+	
+	joined_rows = list(users.inner_join("projects", left_key="id", right_key="owner_id").scan())
+	assert len(joined_rows) == 3
+
+def test_statement_cache(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	# Compiled once.
+	assert users.get_select_statement() is users.get_select_statement()
+	assert users.get_update_statement(users.get_columns_to_update()) is users.get_update_statement(users.get_columns_to_update())
+	
+	users_projects = users.inner_join("projects", left_key="id", right_key="owner_id")
+	assert users_projects.get_validated_relation_expression() is users_projects.get_validated_relation_expression()
+	
+	select_statement = users.get_select_statement()
+	
+	# Recompiled after a schema change.
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("ALTER TABLE users ADD COLUMN nickname VARCHAR")
+	conn.commit()
+	conn.close()
+	
+	entity_mgr.db_mgr.schema_changed()
+	
+	assert users.get_select_statement() is not select_statement
+	assert "nickname" in users.get_column_names()
+	assert "nickname" in users_projects.get_select_statement()
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	read_user.nickname = "eko"
+	users.update(read_user)
+	
+	assert users.read(read_user.id).nickname == "eko"
+
+def test_manage_all_tables(dummy_structured_entity_mgr):
+	from ..EntityManager import EntityManager
+	
+	db_mgr = dummy_structured_entity_mgr.db_mgr
+	
+	class User(EntityModel):
+		pass
+	
+	conn = db_mgr.get_connection()
+	conn.execute("CREATE TABLE no_id (name VARCHAR)")
+	conn.commit()
+	conn.close()
+	
+	entity_mgr = EntityManager(db_mgr, dummy_structured_entity_mgr.entity_log)
+	entity_mgr.manage_all_tables({"users": User})
+	
+	assert sorted(entity_mgr.tables) == ["project_members", "projects", "users"]
+	assert entity_mgr.with_table("users").entity_model is User
+	assert entity_mgr.with_table("projects").entity_model is EntityModel
+	
+	assert entity_mgr.with_table("users").read_one_by_column("username", "ekobadd").password == "password123"
+	assert "title" in entity_mgr.with_table("projects").get_column_names()
+
+def test_schema_snapshot(dummy_structured_entity_mgr, tmpdir):
+	import json
+	from ..DatabaseManager import DatabaseManager
+	from ..EntityManager import EntityManager
+	
+	db_path = dummy_structured_entity_mgr.db_mgr.db_conn_str
+	snapshot_path = tmpdir + "schema.json"
+	
+	DatabaseManager(db_path, schema_snapshot_path=snapshot_path).load_schema()
+	
+	with open(snapshot_path) as snapshot_file:
+		snapshot = json.load(snapshot_file)
+	
+	assert "users" in snapshot["tables"]
+	
+	# Doctor the snapshot to prove that it is what gets loaded while the schema_version matches.
+	snapshot["tables"]["users"].append(dict(snapshot["tables"]["users"][-1], name="from_snapshot"))
+	with open(snapshot_path, "w") as snapshot_file:
+		json.dump(snapshot, snapshot_file)
+	
+	db_mgr = DatabaseManager(db_path, schema_snapshot_path=snapshot_path)
+	assert "from_snapshot" in [column.name for column in db_mgr.load_schema()["users"]]
+	
+	entity_mgr = EntityManager(db_mgr, dummy_structured_entity_mgr.entity_log)
+	entity_mgr.manage_all_tables()
+	assert "from_snapshot" in entity_mgr.with_table("users").get_column_names()
+	
+	# Changing the schema bumps the schema_version, which invalidates the snapshot.
+	conn = db_mgr.get_connection()
+	conn.execute("CREATE TABLE newer (id INTEGER PRIMARY KEY)")
+	conn.commit()
+	conn.close()
+	
+	db_mgr = DatabaseManager(db_path, schema_snapshot_path=snapshot_path)
+	schema = db_mgr.load_schema()
+	assert "newer" in schema
+	assert "from_snapshot" not in [column.name for column in schema["users"]]
+
+def test_identity_map(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	ekobadd_id = users.read_one_by_column("username", "ekobadd").id
+	ekofren_id = users.read_one_by_column("username", "ekofren").id
+	
+	# Disabled by default.
+	assert users.read(ekobadd_id) is not users.read(ekobadd_id)
+	assert entity_mgr.identity_map_stats() is None
+	
+	entity_mgr.enable_identity_map(table_sizes={"users": 1})
+	
+	read_user = users.read(ekobadd_id)
+	assert users.read(ekobadd_id) is read_user
+	
+	stats = entity_mgr.identity_map_stats()
+	assert stats["hits"] == 1
+	assert stats["misses"] == 1
+	
+	# Updating the cached instance keeps it cached.
+	read_user.password = "updated"
+	users.update(read_user)
+	assert users.read(ekobadd_id) is read_user
+	
+	# Updating another instance of the same row drops the cached one.
+	other_user = users.read_one_by_column("username", "ekobadd")
+	other_user.password = "updated again"
+	users.update(other_user)
+	assert users.read(ekobadd_id).password == "updated again"
+	
+	# LRU eviction.
+	users.read(ekofren_id)
+	assert entity_mgr.identity_map_stats()["evictions"] == 1
+	assert entity_mgr.identity_map_stats()["sizes"]["users"] == 1
+	
+	users.update_where("username", "ekofren", password="set-based")
+	assert users.read(ekofren_id).password == "set-based"
+	
+	users.delete(ekofren_id)
+	assert users.read(ekofren_id) is None
+
+def test_identity_map_cleared_on_rollback(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	entity_mgr.enable_identity_map()
+	
+	ekobadd_id = users.read_one_by_column("username", "ekobadd").id
+	
+	with pytest.raises(RuntimeError):
+		with entity_mgr.transaction():
+			read_user = users.read(ekobadd_id)
+			read_user.password = "rolled back"
+			users.update(read_user)
+			
+			raise RuntimeError("Abort!")
+	
+	assert users.read(ekobadd_id).password == "password123"
+
+def test_identity_map_hides_uncommitted_writes(dummy_structured_entity_mgr):
+	import threading
+	
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	entity_mgr.enable_identity_map()
+	
+	ekobadd_id = users.read_one_by_column("username", "ekobadd").id
+	cached_user = users.read(ekobadd_id)
+	
+	other_thread_reads = []
+	def read_from_other_thread():
+		other_thread_reads.append(users.read(ekobadd_id).password)
+	
+	with pytest.raises(RuntimeError):
+		with entity_mgr.transaction():
+			read_user = users.read(ekobadd_id)
+			read_user.password = "uncommitted"
+			users.update(read_user)
+			users.read_by_column("username", "ekobadd") # Flushes the update.
+			
+			other_thread = threading.Thread(target=read_from_other_thread)
+			other_thread.start()
+			other_thread.join()
+			
+			raise RuntimeError("Abort!")
+	
+	assert other_thread_reads == ["password123"]
+	assert users.read(ekobadd_id).password == "password123"
+	
+	# A cached instance written in a transaction is cached again once it commits.
+	cached_user = users.read(ekobadd_id)
+	with entity_mgr.transaction():
+		cached_user.password = "committed"
+		users.update(cached_user)
+		users.read_by_column("username", "ekobadd")
+		
+		other_thread = threading.Thread(target=read_from_other_thread)
+		other_thread.start()
+		other_thread.join()
+	
+	assert other_thread_reads[-1] == "password123"
+	assert users.read(ekobadd_id) is cached_user
+
+def test_update_writes_only_dirty_columns(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	assert not read_user.is_dirty()
+	
+	# Changed behind the entity's back; a full-row write would clobber this.
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("UPDATE users SET password = 'changed elsewhere' WHERE id = ?", [read_user.id])
+	conn.commit()
+	conn.close()
+	
+	read_user.username = "not ekobadd"
+	assert read_user.get_dirty_columns() == {"username"}
+	
+	assert users.update(read_user) is read_user
+	assert not read_user.is_dirty()
+	
+	new_read_user = users.read(read_user.id)
+	assert new_read_user.username == "not ekobadd"
+	assert new_read_user.password == "changed elsewhere"
+
+def test_clean_update_is_skipped(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	updated_on = read_user.updated_on
+	
+	with users.read_one_by_column("username", "ekobadd") as same_user:
+		same_user.get_value("password")
+	
+	assert users.update(read_user) is read_user
+	assert read_user.updated_on == updated_on
+	assert users.read(read_user.id).updated_on == updated_on
+
+def test_update_many_groups_dirty_columns(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	big_boss = users.read_one_by_column("username", "big boss")
+	lil_boss = users.read_one_by_column("username", "lil boss")
+	ekobadd = users.read_one_by_column("username", "ekobadd")
+	updated_on = ekobadd.updated_on
+	
+	big_boss.password = "big password"
+	lil_boss.username = "medium boss"
+	
+	assert users.update_many([big_boss, lil_boss, ekobadd]) == [big_boss, lil_boss, ekobadd]
+	assert not big_boss.is_dirty() and not lil_boss.is_dirty()
+	
+	assert users.read(big_boss.id).password == "big password"
+	assert users.read(big_boss.id).username == "big boss"
+	assert users.read(lil_boss.id).username == "medium boss"
+	assert users.read(ekobadd.id).updated_on == updated_on
+
+def test_slotted_entities_without_timestamps(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	class CompactMember(EntityModel):
+		__slots__ = ()
+	
+	# project_members has neither created_on nor updated_on, so its entities have no slots for them.
+	entity_mgr.manage_table("project_members", CompactMember, slotted=True)
+	project_members = entity_mgr.with_table("project_members")
+	
+	new_member = project_members.new_blank_entity()
+	new_member.user_id = 1
+	new_member.project_id = 10
+	assert project_members.create(new_member) is new_member
+	
+	new_members = []
+	for user_id in (2, 3):
+		new_members.append(project_members.new_blank_entity())
+		new_members[-1].user_id = user_id
+		new_members[-1].project_id = 10
+	
+	assert project_members.create_many(new_members) == new_members
+	assert sorted(member.user_id for member in project_members.read_by_column("project_id", 10)) == [1, 2, 3]
+	
+	new_member.project_id = 11
+	assert project_members.update(new_member) is new_member
+	
+	new_members[0].project_id = 11
+	assert project_members.update_many(new_members) == new_members
+	
+	assert sorted(member.user_id for member in project_members.read_by_column("project_id", 11)) == [1, 2]
+
+def test_slotted_entities(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	class CompactUser(EntityModel):
+		__slots__ = ()
+	
+	entity_mgr.manage_table("users", CompactUser, slotted=True)
+	users = entity_mgr.with_table("users")
+	
+	read_user = users.read_one_by_column("username", "ekobadd")
+	assert isinstance(read_user, CompactUser)
+	assert not hasattr(read_user, "__dict__")
+	
+	assert read_user.username == "ekobadd"
+	assert read_user.get_value("users.password") == "password123"
+	assert read_user.to_dict()["username"] == "ekobadd"
+	
+	with pytest.raises(AttributeError):
+		read_user.not_a_column = 1
+	
+	read_user.set_value("password", "password456")
+	assert read_user.get_dirty_columns() == {"password"}
+	users.update(read_user)
+	assert users.read(read_user.id).password == "password456"
+	
+	with users.new_blank_entity() as new_user:
+		new_user.username = "compact"
+	assert users.read_one_by_column("username", "compact").id == new_user.id
+	
+	# Slotted leaves still join.
+	user_projects = entity_mgr.with_table("users").join("projects", "id", "owner_id")
+	assert user_projects.read_one_by_column("title", "ekobadds project").username == "ekobadd"
+	
+	class DictUser(EntityModel):
+		pass
+	
+	with pytest.raises(TypeError):
+		entity_mgr.manage_table("users", DictUser, slotted=True)
+	
+	# Slotted models can still be managed without slots.
+	entity_mgr.manage_table("users", CompactUser)
+	assert entity_mgr.with_table("users").read(read_user.id).password == "password456"
+
+def test_joined_accessor_map(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	user_projects = entity_mgr.with_table("users").inner_join("projects",
+		left_key="id", right_key="owner_id", left_alias="u"
+	).inner_join("users", left_key="projects.owner_id", right_key="id", right_alias="owner")
+	
+	accessor_map = user_projects.get_accessor_map()
+	assert accessor_map["title"] == (1, "title")
+	assert accessor_map["owner.username"] == (2, "username")
+	assert accessor_map["username"] == user_projects.ambiguous_column
+	assert accessor_map["users.username"] == user_projects.ambiguous_column
+	
+	read_user_project = user_projects.read_one_by_column("title", "ekobadds project")
+	assert read_user_project.get_value("u.username") == "ekobadd"
+	assert read_user_project.get_value("OWNER.USERNAME") == "ekobadd"
+	assert read_user_project.get_value(ColumnIdentifier(qualifier="projects", name="title")) == "ekobadds project"
+	
+	with pytest.raises(ValueError):
+		read_user_project.get_value("username")
+	
+	with pytest.raises(ValueError):
+		read_user_project.users.username
+	
+	with pytest.raises(ColumnRetrievalError):
+		read_user_project.get_value("p.title")
+	
+	read_user_project.set_value("projects.title", "renamed project")
+	project = read_user_project.leaf_entities[1]
+	assert project.title == "renamed project"
+	assert project.get_dirty_columns() == {"title"}
+	assert not read_user_project.leaf_entities[0].is_dirty()
+
+def test_hydration_plan(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	assert users.get_hydration_plan()[:2] == ((0, "id"), (1, "created_on"))
+	
+	user_projects = users.inner_join("projects", left_key="id", right_key="owner_id", right_alias="p")
+	hydration_plan = user_projects.get_hydration_plan()
+	assert hydration_plan[0] == (0, 0, "id")
+	assert (len(users.get_column_names()) + 3, 1, "title") in hydration_plan
+	
+	read_user_projects = user_projects.read_by_column("p.title", "duped title")
+	assert len(read_user_projects) == 2
+	for read_user_project in read_user_projects:
+		assert read_user_project.username == "dupe title owner"
+		assert read_user_project.p.owner_id == read_user_project.users.id
+		assert not read_user_project.leaf_entities[0].is_dirty()
+		assert not read_user_project.leaf_entities[1].is_dirty()
+
+def test_lazy_entities(dummy_structured_entity_mgr, dummy_structured_database_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	
+	class Stuff(EntityModel):
+		pass
+	
+	entity_mgr.manage_table("stuff", Stuff, lazy=True)
+	stuff = entity_mgr.with_table("stuff")
+	
+	date_of = datetime(2024, 1, 2, 3, 4, 5)
+	uuid_of = uuid4()
+	with stuff.new_blank_entity() as new_stuff:
+		new_stuff.date_of = date_of
+		new_stuff.uuid_of = uuid_of
+	
+	read_stuff = stuff.read(new_stuff.id)
+	assert isinstance(read_stuff, Stuff)
+	assert "lazy_row" in read_stuff.__dict__
+	assert "date_of" not in read_stuff.__dict__
+	
+	assert read_stuff.date_of == date_of
+	assert read_stuff.get_value("uuid_of") == uuid_of
+	assert read_stuff.to_dict() == {"id": new_stuff.id, "date_of": date_of, "uuid_of": uuid_of}
+	assert stuff.read_many([uuid_of], "uuid_of")[0].id == new_stuff.id
+	
+	# The first write copies the row out.
+	new_date_of = datetime(2025, 1, 1)
+	with stuff.read(new_stuff.id) as read_stuff:
+		read_stuff.date_of = new_date_of
+		
+		assert "lazy_row" not in read_stuff.__dict__
+		assert read_stuff.uuid_of == uuid_of
+		assert read_stuff.get_dirty_columns() == {"date_of"}
+	
+	assert stuff.read(new_stuff.id).date_of == new_date_of
+	
+	read_stuff = stuff.read(new_stuff.id)
+	read_stuff.patch({"uuid_of": None})
+	stuff.update(read_stuff)
+	assert stuff.read(new_stuff.id).to_dict() == {"id": new_stuff.id, "date_of": new_date_of, "uuid_of": None}
+	
+	read_stuff = stuff.read(new_stuff.id)
+	read_stuff.put({"id": new_stuff.id, "date_of": date_of, "uuid_of": uuid_of})
+	stuff.update(read_stuff)
+	assert stuff.read(new_stuff.id).uuid_of == uuid_of
+	
+	with pytest.raises(ValueError):
+		entity_mgr.manage_table("stuff", Stuff, slotted=True, lazy=True)
+
+def test_read_columns(dummy_structured_entity_mgr):
+	numpy = pytest.importorskip("numpy")
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	with users.new_blank_entity() as new_user:
+		new_user.username = "timestamped"
+	
+	columns = users.read_columns(batch_size=2)
+	assert list(columns) == [repr(column) for column in users.get_column_identifiers()]
+	
+	user_ids = [user.id for user in users.scan()]
+	assert columns["users.id"].dtype == numpy.int64
+	assert columns["users.id"].tolist() == user_ids
+	assert columns["users.username"].tolist()[-1] == "timestamped"
+	
+	# NULLs make integer columns float.
+	assert columns["users.manager_id"].dtype == numpy.float64
+	assert numpy.isnan(columns["users.manager_id"][0])
+	
+	assert columns["users.created_on"].dtype == numpy.dtype("datetime64[us]")
+	assert numpy.isnat(columns["users.created_on"][0])
+	assert columns["users.created_on"][-1] == numpy.datetime64(new_user.created_on.replace(tzinfo=None))
+	
+	columns = users.read_columns(["id", "manager_id"], "username", ["big boss", "lil boss"])
+	assert list(columns) == ["users.id", "users.manager_id"]
+	assert columns["users.manager_id"][1] == columns["users.id"][0]
+	
+	conn = entity_mgr.db_mgr.get_connection()
+	conn.execute("UPDATE users SET created_on = '2024-01-01T05:00:00+05:00' WHERE username = 'big boss'")
+	conn.commit()
+	conn.close()
+	
+	columns = users.read_columns(["created_on"], "username", "big boss")
+	assert columns["users.created_on"][0] == numpy.datetime64("2024-01-01T00:00:00")
+	
+	user_projects = users.inner_join("projects", left_key="id", right_key="owner_id", left_alias="u")
+	columns = user_projects.read_columns(["u.username", "owner_id"], "title", "duped title")
+	assert columns["u.username"].tolist() == ["dupe title owner", "dupe title owner"]
+	assert columns["projects.owner_id"].dtype == numpy.int64
+
+def test_read_columns_without_numpy(dummy_structured_entity_mgr, monkeypatch):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	monkeypatch.setattr(sys.modules[ColumnBuffer.__module__], "numpy", None)
+	
+	with users.new_blank_entity() as new_user:
+		new_user.username = "timestamped"
+	
+	columns = users.read_columns(["id", "manager_id", "created_on", "username"], batch_size=2)
+	
+	assert columns["users.id"] == array("q", [user.id for user in users.scan()])
+	assert columns["users.manager_id"].typecode == "d"
+	assert columns["users.created_on"][-1] == new_user.created_on.timestamp()
+	assert columns["users.username"][-1] == "timestamped"
+
+def test_gather(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	projects = entity_mgr.with_table("projects")
+	
+	ekobadd = users.read_one_by_column("username", "ekobadd")
+	
+	res = entity_mgr.gather(
+		lambda: users.read(ekobadd.id),
+		lambda: projects.read_by_column("owner_id", ekobadd.id),
+		lambda: users.read_by_column("username", [f"user {i}" for i in range(users.max_inline_values + 1)] + ["big boss"]),
+		lambda: users.inner_join("projects", left_key="id", right_key="owner_id").read_by_column("title", "duped title")
+	)
+	
+	assert res[0].username == "ekobadd"
+	assert [project.title for project in res[1]] == ["ekobadds project"]
+	assert [user.username for user in res[2]] == ["big boss"]
+	assert len(res[3]) == 2
+	assert entity_mgr.db_mgr.pool_stats()["idle_read_only"] > 0
+	
+	# Errors are raised in query order once every query has finished, or returned in place.
+	with pytest.raises(ValueError):
+		entity_mgr.gather(lambda: users.read(ekobadd.id), lambda: users.read_by_column("not;a column", 1))
+	
+	new_user = users.new_blank_entity()
+	new_user.username = "written in gather"
+	res = entity_mgr.gather(lambda: users.read(ekobadd.id), lambda: users.create(new_user), lambda: 1 // 0, return_exceptions=True)
+	
+	assert res[0].username == "ekobadd"
+	assert res[1] is None # The write failed on the read-only connection.
+	assert type(res[2]) is ZeroDivisionError
+	assert users.read_one_or_none_by_column("username", "written in gather") is None
+	
+	with pytest.raises(TypeError):
+		entity_mgr.gather(users.read_by_column("username", "ekobadd"))
+	
+	# Transactions read their own writes.
+	with entity_mgr.transaction():
+		users.create(new_user)
+		assert entity_mgr.gather(lambda: users.read(new_user.id))[0].username == "written in gather"
+
+def test_gather_close(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	with pytest.raises(ValueError):
+		EntityManager(entity_mgr.db_mgr, entity_mgr.entity_log, gather_workers=0)
+	
+	# No threads until the first gather().
+	assert entity_mgr.gather_executor is None
+	
+	entity_mgr.gather(lambda: users.read_by_column("username", "ekobadd"))
+	gather_executor = entity_mgr.gather_executor
+	assert gather_executor is not None
+	
+	entity_mgr.gather(lambda: users.read_by_column("username", "ekobadd"))
+	assert entity_mgr.gather_executor is gather_executor
+	
+	entity_mgr.close()
+	assert entity_mgr.gather_executor is None
+	assert entity_mgr.db_mgr.pool_stats()["idle_read_only"] == 0
+	with pytest.raises(RuntimeError):
+		gather_executor.submit(lambda: None)
+	
+	# Closing again does nothing, and a later gather() starts new workers.
+	entity_mgr.close()
+	assert entity_mgr.gather(lambda: users.read_one_by_column("username", "ekobadd"))[0].username == "ekobadd"
+	assert entity_mgr.gather_executor is not gather_executor
+	
+	entity_mgr.close()
+
+def test_metrics(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	# Disabled by default.
+	users.read_by_column("username", "ekobadd")
+	assert entity_mgr.stats() is None
+	
+	events = []
+	entity_mgr.enable_metrics(exporter=events.append)
+	
+	ekobadd = users.read_one_by_column("username", "ekobadd")
+	users.read(ekobadd.id)
+	users.read(9999)
+	assert len(list(users.scan(batch_size=2))) == 6
+	
+	ekobadd.password = "measured"
+	users.update(ekobadd)
+	
+	with entity_mgr.transaction():
+		users.create_many([users.new_blank_entity() for i in range(3)])
+	
+	joined = users.inner_join("projects", left_key="id", right_key="owner_id")
+	assert len(joined.read_by_column("title", "duped title")) == 2
+	
+	stats = entity_mgr.stats()
+	user_stats = stats["tables"]["users"]
+	
+	assert user_stats["read_by_column"]["calls"] == 1
+	assert user_stats["read_by_column"]["rows"] == 1
+	assert user_stats["read"]["calls"] == 2
+	assert user_stats["read"]["rows"] == 1
+	assert user_stats["read"]["hydrate"]["count"] == 1
+	assert user_stats["scan"]["rows"] == 6
+	assert user_stats["scan"]["statements"] == 1
+	assert user_stats["update"]["rows"] == 1
+	assert user_stats["update"]["statements"] == 2 # The statement and its commit.
+	assert user_stats["create_many"]["rows"] == 3
+	assert stats["tables"]["users+projects"]["read_by_column"]["rows"] == 2
+	assert stats["tables"]["(database)"]["commit"]["calls"] == 1
+	
+	for operation_stats in user_stats.values():
+		sql_stats = operation_stats["sql"]
+		assert sql_stats["count"] == operation_stats["calls"]
+		assert 0 < sql_stats["p50"] <= sql_stats["p95"] <= sql_stats["p99"] <= sql_stats["max"]
+	
+	assert stats["connections"]["acquired"] >= 7
+	assert stats["connections"]["acquire"]["count"] == stats["connections"]["acquired"]
+	
+	assert {"operation", "acquire"} == {event["kind"] for event in events}
+	assert sum(1 for event in events if event["kind"] == "operation") == sum(operation_stats["calls"] for table_stats in stats["tables"].values() for operation_stats in table_stats.values())
+	
+	entity_mgr.disable_metrics()
+	assert entity_mgr.stats() is None
+	assert entity_mgr.db_mgr.metrics is None
+
+def test_tracing(dummy_structured_entity_mgr, capsys):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	collector = SpanCollector()
+	tracer = entity_mgr.enable_tracing(collector)
+	
+	ekobadd = users.read_one_by_column("username", "ekobadd")
+	capsys.readouterr()
+	
+	with tracer.span("request", path="/users") as request_span:
+		assert users.read(ekobadd.id).username == "ekobadd"
+		assert len(list(users.scan(batch_size=4))) == 6
+		
+		with entity_mgr.transaction():
+			ekobadd.password = "traced"
+			users.update(ekobadd)
+	
+	# Nothing is logged eagerly per row or per column access.
+	assert capsys.readouterr().out == ""
+	
+	[read_span] = [span for span in collector.get_spans("read") if span.parent_id == request_span.span_id]
+	assert read_span.trace_id == request_span.trace_id
+	assert read_span.attributes["table"] == "users"
+	assert read_span.attributes["rows"] == 1
+	
+	read_children = [span for span in collector.get_spans() if span.parent_id == read_span.span_id]
+	assert [span.name for span in read_children] == ["query", "hydrate"]
+	assert read_children[0].attributes["sql"].endswith("WHERE id = ?")
+	
+	[scan_span] = collector.get_spans("scan")
+	scan_children = [span.name for span in collector.get_spans() if span.parent_id == scan_span.span_id]
+	assert scan_children == ["query", "fetch", "hydrate", "fetch", "hydrate", "fetch"]
+	
+	# The transaction's commit operation, and the commit statement within it.
+	assert len([span for span in collector.get_spans("commit") if span.trace_id == request_span.trace_id]) == 2
+	assert collector.get_spans("update_many")[0].trace_id == request_span.trace_id
+	
+	# Unsampled traces produce no spans at all.
+	collector.clear()
+	tracer = entity_mgr.enable_tracing(collector, sample_rate=0)
+	with tracer.span("request"):
+		users.read(ekobadd.id)
+	
+	users.read(ekobadd.id)
+	assert collector.get_spans() == []
+	
+	with pytest.raises(ValueError):
+		entity_mgr.enable_tracing(collector, sample_rate=2)
+	
+	entity_mgr.disable_tracing()
+	users.read(ekobadd.id)
+	assert collector.get_spans() == []
+
+def test_tracing_to_logging(dummy_structured_entity_mgr, caplog):
+	import logging
+	
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	entity_mgr.enable_tracing(LoggingSpanSink(logging.getLogger("entity_trace")))
+	
+	with caplog.at_level(logging.DEBUG, logger="entity_trace"):
+		users.read_by_column("username", "ekobadd")
+	
+	messages = [record.getMessage() for record in caplog.records]
+	assert any(message.startswith("query ") and "sql='SELECT" in message for message in messages)
+	assert any(message.startswith("read_by_column ") and "table='users'" in message for message in messages)
+
+def test_slow_query_log(dummy_structured_entity_mgr):
+	class CapturingLog:
+		def __init__(self):
+			self.warnings = []
+		
+		def warning(self, message):
+			self.warnings.append(message)
+	
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	assert entity_mgr.slow_query_report() is None
+	
+	log = CapturingLog()
+	slow_query_log = entity_mgr.enable_slow_query_log(threshold=0, log=log)
+	assert entity_mgr.db_mgr.slow_query_log is slow_query_log
+	
+	# manager_id has no index, so every row of users is read.
+	users.read_by_column("manager_id", 1)
+	users.read_by_column("manager_id", 2)
+	
+	# The primary key is searched.
+	users.read(1)
+	
+	report = entity_mgr.slow_query_report()
+	assert len(report) == 2
+	assert report[0]["total_seconds"] >= report[1]["total_seconds"]
+	
+	scan = next(entry for entry in report if entry["operation"] == "read_by_column")
+	assert scan["count"] == 2
+	assert scan["full_scans"] == ["users"]
+	assert scan["last_parameters"] == [2]
+	assert not scan["is_join"]
+	
+	search = next(entry for entry in report if entry["operation"] == "read")
+	assert search["full_scans"] == []
+	assert any(line.startswith("SEARCH") for line in search["plan"])
+	
+	assert len(log.warnings) == 3
+	assert "parameters: [1]" in log.warnings[0]
+	assert "full scan of 'users'" in log.warnings[0]
+	
+	# Joins on unindexed columns are flagged.
+	users.inner_join("project_members", left_key="id", right_key="user_id", left_alias="u").read_by_column("u.username", "ekobadd")
+	
+	join = next(entry for entry in entity_mgr.slow_query_report() if entry["is_join"])
+	assert join["table"] == "users+project_members"
+	assert len(join["full_scans"]) + len(join["automatic_indexes"]) > 0
+	assert "within join" in log.warnings[-1]
+	
+	entity_mgr.disable_slow_query_log()
+	assert entity_mgr.db_mgr.slow_query_log is None
+	
+	users.read(1)
+	assert len(log.warnings) == 4
+
+def test_ensure_index(dummy_structured_entity_mgr):
+	users = dummy_structured_entity_mgr.with_table("users")
+	
+	index_name = users.ensure_index("manager_id")
+	assert index_name == "ix_users_manager_id"
+	assert {"name": index_name, "unique": False, "partial": False, "columns": ["manager_id"]} in users.get_indexes()
+	
+	# Existing indexes are reused, and unique ones serve plain requests.
+	assert users.ensure_index(["MANAGER_ID"]) == index_name
+	assert users.ensure_index("username", unique=True) == "ux_users_username"
+	assert users.ensure_index("username") == "ux_users_username"
+	
+	partial_name = users.ensure_index("manager_id", where="manager_id IS NOT NULL")
+	assert partial_name.startswith("ix_users_manager_id_")
+	assert next(index for index in users.get_indexes() if index["name"] == partial_name)["partial"]
+	
+	# Rows with duplicate passwords cannot be indexed uniquely.
+	new_user = users.new_blank_entity()
+	new_user.username = "copycat"
+	new_user.password = "bigboss123"
+	users.create(new_user)
+	
+	assert users.ensure_index("password", unique=True) is None
+	
+	with pytest.raises(ColumnRetrievalError):
+		users.ensure_index("not_a_column")
+	
+	with pytest.raises(ValueError):
+		users.ensure_index([])
+
+def test_index_advisor(dummy_structured_entity_mgr):
+	entity_mgr = dummy_structured_entity_mgr
+	users = entity_mgr.with_table("users")
+	
+	assert entity_mgr.index_advice() is None
+	entity_mgr.enable_index_advisor()
+	
+	users.read_by_column("manager_id", 1)
+	users.read_by_column("manager_id", 2)
+	users.read(1) # The primary key needs no index.
+	
+	users.inner_join("project_members", left_key="id", right_key="user_id", left_alias="u").read_by_column("u.username", "ekobadd")
+	
+	advice = entity_mgr.index_advice()
+	assert [(proposal["table"], proposal["columns"], proposal["kind"], proposal["uses"]) for proposal in advice] == [
+		("users", ["manager_id"], "filter", 2),
+		("users", ["username"], "filter", 1),
+		("project_members", ["user_id"], "join", 1)
+	]
+	assert advice[0]["sql"] == "CREATE INDEX IF NOT EXISTS ix_users_manager_id ON users (manager_id)"
+	assert len(entity_mgr.index_advice(min_uses=2)) == 1
+	
+	# read_columns() is served by an index covering the columns it reads, which also serves the filter alone.
+	users.read_columns(["username", "manager_id"], column_name="manager_id", matching_value=1)
+	
+	advice = entity_mgr.index_advice()
+	assert ("users", ["manager_id", "username"], "covering") in [(proposal["table"], proposal["columns"], proposal["kind"]) for proposal in advice]
+	assert ["manager_id"] not in [proposal["columns"] for proposal in advice]
+	
+	results = entity_mgr.index_advisor.apply(min_uses=1)
+	assert len(results) == len(advice)
+	
+	for result in results:
+		assert result["created"]
+		assert result["as_expected"], result
+		assert not any(f"INDEX {result["name"]}" in line for line in result["before"])
+	
+	covering = next(result for result in results if result["kind"] == "covering")
+	assert covering["before"] == ["SCAN users"]
+	assert any("COVERING INDEX ix_users_manager_id_username" in line for line in covering["after"])
+	
+	assert entity_mgr.index_advice() == []
+	
+	entity_mgr.disable_index_advisor()
+	assert entity_mgr.index_advice() is None
+
 # TODO:
 # - Test errors thrown when JOIN depth is exceeded.
 # - Test effictiveness with JoinedRelationManager constructor with different inputs on left and right.
-# - Test that dictionaries obtained via to_dict can be passed to put() and patch() and work as expected.
\ No newline at end of file
+# - Test that dictionaries obtained via to_dict can be passed to put() and patch() and work as expected.